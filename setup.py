@@ -18,6 +18,12 @@ EMAIL = 'taeskow@gmail.com'
 REQUIRES_PYTHON = '>=3.6.0'
 REQUIRED_FOR_INSTALL = ['click', 'xparser>=0.0.4', 'sty']
 REQUIRED_FOR_TESTS = ['pytest', 'pytest-runner']
+EXTRAS = {
+    # vectorized similarity search and audits over large theme collections
+    'fast': ['numpy'],
+    # theme generation from wallpapers
+    'image': ['numpy', 'Pillow'],
+}
 VERSION = None
 
 root = os.path.abspath(os.path.dirname(__file__))
@@ -128,11 +134,12 @@ setup(
     packages=find_packages('src'),
     package_dir={'': 'src'},
     install_requires=REQUIRED_FOR_INSTALL,
+    extras_require=EXTRAS,
     tests_require=REQUIRED_FOR_TESTS,
     include_package_data=True,
     entry_points='''
         [console_scripts]
-        xthematic=xthematic.cli:main
+        xthematic=xthematic.fastpath:main
     ''',
     license='MIT',
     classifiers=[
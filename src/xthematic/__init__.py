@@ -0,0 +1,7 @@
+def session(*args, **kwargs):
+    """ Start a transactional change of the terminal's palette, see xthematic.term.session.
+
+    xthematic.term reads the configuration when imported, so it is only imported here on use.
+    """
+    import xthematic.term
+    return xthematic.term.session(*args, **kwargs)
@@ -0,0 +1,331 @@
+""" Palette backends - how terminal colors are read from X and written to terminals.
+
+A backend answers these questions for xthematic.term:
+    read_loaded - which colors are loaded in the X resource database
+    apply_batch - change several palette slots of the current terminal at once
+    apply_everywhere - change them in every terminal of the user
+    query_current - which colors is the terminal currently showing
+
+Inside tmux or screen escape sequences only reach the real terminal when they are
+wrapped in the multiplexer's DCS passthrough, which palette_sequence() takes care of.
+
+The default backend is chosen through the $XTHEMATIC_BACKEND environment variable
+and can be replaced at runtime with set_backend().
+"""
+import os
+import re
+import subprocess
+import time
+
+import xthematic.colors
+import xthematic.profiling
+
+ESC = '\033'
+ST = ESC + '\\'
+BEL = '\a'
+
+# xterm's default 16 colors - the palette of a terminal nobody has customized yet
+DEFAULT_PALETTE = (
+    '#000000', '#CD0000', '#00CD00', '#CDCD00', '#0000EE', '#CD00CD', '#00CDCD', '#E5E5E5',
+    '#7F7F7F', '#FF0000', '#00FF00', '#FFFF00', '#5C5CFF', '#FF00FF', '#00FFFF', '#FFFFFF',
+)
+
+
+def default_palette():
+    return {xthematic.colors.ColorIdentifier(k): xthematic.colors.Color(h)
+            for k, h in enumerate(DEFAULT_PALETTE)}
+
+
+def colors_from_xrdb(output):
+    """ Parse the color resources out of `xrdb -query` output (bytes)."""
+    lines = output.splitlines()
+    matches = (re.match(pattern=rb'.*color(\d+):\t([^ ]+)', string=l) for l in lines)
+    grouped = (m.groups() for m in matches if m)
+    cast = ((int(num), byte_arr.decode(encoding='ascii')) for num, byte_arr in grouped)
+    colors = {}
+    for number, hex_code in sorted(cast):
+        if not xthematic.colors.ColorIdentifier.is_valid(number):
+            continue
+        cid = xthematic.colors.ColorIdentifier(number)
+        if cid in colors and hex_code != colors[cid].hex:
+            raise RuntimeError(f"color{number} has more than one value")
+        colors[cid] = xthematic.colors.Color(hex_code)
+    return colors  # values are sorted by keys
+
+
+def osc4_sequence(colors, terminator=ST):
+    """ Escape sequence that sets every color of the colors mapping in one go."""
+    parts = []
+    for color_id, color in colors.items():
+        r, g, b = color.rgb
+        parts.append(f'{ESC}]4;{color_id.id};rgb:{r:02x}/{g:02x}/{b:02x}{terminator}')
+    return ''.join(parts)
+
+
+OSC4_REPLY_RE = re.compile(rb'\033\]4;(\d+);rgb:([0-9a-fA-F]{1,4})/([0-9a-fA-F]{1,4})/([0-9a-fA-F]{1,4})(?:\007|\033\\)')
+DA1_REPLY_RE = re.compile(rb'\033\[\?[0-9;]*c')
+QUERY_TIMEOUT = 0.25  # seconds
+
+
+def _scale_channel(digits):
+    # replies use 1 to 4 hex digits per channel, usually 4 (rgb:ffff/0000/0000)
+    return round(int(digits, 16) * 255 / (16 ** len(digits) - 1))
+
+
+def colors_from_osc4_replies(data):
+    """ Parse the colors out of the terminal's replies (bytes) to OSC 4 queries."""
+    colors = {}
+    for number, r, g, b in OSC4_REPLY_RE.findall(data):
+        number = int(number)
+        if xthematic.colors.ColorIdentifier.is_valid(number):
+            rgb = (_scale_channel(r), _scale_channel(g), _scale_channel(b))
+            colors[xthematic.colors.ColorIdentifier(number)] = xthematic.colors.Color('#%02x%02x%02x' % rgb)
+    return dict(sorted(colors.items(), key=lambda item: item[0].id))
+
+
+@xthematic.profiling.traced('tty query', category='tty')
+def query_palette(slots=range(16), tty='/dev/tty', timeout=QUERY_TIMEOUT):
+    """ Ask the terminal for the colors of slots and return the ones it answered.
+
+    All queries are sent in one write followed by a primary device attributes request,
+    which every terminal answers after the queries before it. Replies are read in raw
+    mode until that answer arrives or timeout seconds passed. Without a controlling
+    terminal nothing is answered.
+    """
+    import select
+    import termios
+
+    try:
+        fd = os.open(tty, os.O_RDWR | os.O_NOCTTY)
+    except OSError:
+        return {}
+    data = b''
+    try:
+        try:
+            old = termios.tcgetattr(fd)
+        except termios.error:
+            return {}
+        raw = termios.tcgetattr(fd)
+        raw[3] &= ~(termios.ECHO | termios.ICANON)
+        raw[6][termios.VMIN] = 0
+        raw[6][termios.VTIME] = 0
+        termios.tcsetattr(fd, termios.TCSANOW, raw)
+        try:
+            query = ''.join(f'{ESC}]4;{slot};?{ST}' for slot in slots) + f'{ESC}[c'
+            os.write(fd, query.encode('ascii'))
+            deadline = time.monotonic() + timeout
+            while not DA1_REPLY_RE.search(data):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                    break
+                chunk = os.read(fd, 4096)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            # flushing drops replies that arrive too late instead of leaking them into the shell
+            termios.tcsetattr(fd, termios.TCSAFLUSH, old)
+    finally:
+        os.close(fd)
+    return colors_from_osc4_replies(data)
+
+
+def multiplexer(environ=None):
+    """ Return 'tmux' or 'screen' when running inside one of them, otherwise None."""
+    environ = os.environ if environ is None else environ
+    if environ.get('TMUX'):
+        return 'tmux'
+    if environ.get('STY'):
+        return 'screen'
+    return None
+
+
+def palette_sequence(colors, multiplexer=None):
+    """ osc4_sequence() wrapped so that it passes through multiplexer to the outer terminal.
+
+    tmux (with `set -g allow-passthrough on` since 3.3) takes the whole batch in one DCS
+    string with every ESC doubled. screen ends a DCS string at the first ST and limits
+    its length, so there every color gets its own DCS string and is terminated with BEL.
+    """
+    if multiplexer == 'screen':
+        return ''.join(f'{ESC}P{osc4_sequence({color_id: color}, terminator=BEL)}{ST}'
+                       for color_id, color in colors.items())
+    sequence = osc4_sequence(colors)
+    if multiplexer == 'tmux':
+        return f'{ESC}Ptmux;{sequence.replace(ESC, ESC + ESC)}{ST}'
+    return sequence
+
+
+def write_tty(tty, data):
+    fd = os.open(tty, os.O_WRONLY | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def tmux_ttys():
+    """ Return the ttys of every pane and every attached client of the current tmux session.
+
+    A single tmux process lists both: panes get the palette through tmux, which keeps a
+    palette per pane, and clients are the outer terminals the session is displayed in.
+    """
+    output = subprocess.run(
+        ['tmux', 'list-panes', '-s', '-F', 'pane #{session_name} #{pane_tty}', ';',
+         'list-clients', '-F', 'client #{client_session} #{client_tty}'],
+        stdout=subprocess.PIPE, check=True).stdout.decode()
+    entries = [line.split(' ', 2) for line in output.splitlines() if line.count(' ') >= 2]
+    sessions = {session for kind, session, _ in entries if kind == 'pane'}
+    return [tty for kind, session, tty in entries if kind == 'pane' or session in sessions]
+
+
+def user_ttys(directory='/dev/pts'):
+    """ Return the pseudo terminals in directory that belong to the current user."""
+    uid = os.getuid()
+    ttys = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.isdigit() and os.stat(path).st_uid == uid:
+            ttys.append(path)
+    return sorted(ttys, key=lambda path: int(os.path.basename(path)))
+
+
+@xthematic.profiling.traced('broadcast', category='tty')
+def broadcast(colors):
+    """ Write colors to every pane and client of the tmux session, or to every pty of the user.
+
+    Returns the number of ttys written to - the ones that can't be opened are skipped.
+    """
+    ttys = tmux_ttys() if multiplexer() == 'tmux' else user_ttys()
+    data = osc4_sequence(colors).encode('ascii')
+    written = 0
+    for tty in ttys:
+        try:
+            write_tty(tty, data)
+        except OSError:
+            continue
+        written += 1
+    return written
+
+
+class PaletteBackend:
+    """ Interface for reading and changing terminal palettes."""
+    name = None
+
+    def read_loaded(self):
+        """ Return a dict of ColorIdentifier -> Color loaded in the X resource database."""
+        raise NotImplementedError()
+
+    def apply_batch(self, colors):
+        """ Set every ColorIdentifier -> Color of the colors mapping in the terminal."""
+        raise NotImplementedError()
+
+    def query_current(self):
+        """ Return a dict of ColorIdentifier -> Color the terminal is currently using."""
+        raise NotImplementedError()
+
+    def apply_everywhere(self, colors):
+        """ Set colors in all terminals of the user and return in how many."""
+        return broadcast(colors)
+
+
+class SubprocessBackend(PaletteBackend):
+    """ Talks to X and the terminal through the xrdb and tput executables."""
+    name = 'subprocess'
+    tty = '/dev/tty'
+
+    @xthematic.profiling.traced('xrdb -query', category='subprocess')
+    def read_loaded(self):
+        queried = subprocess.Popen(['xrdb', '-query'], stdout=subprocess.PIPE)
+        grepped = subprocess.check_output(['grep', 'color'], stdin=queried.stdout)
+        queried.wait()
+        return colors_from_xrdb(grepped)
+
+    @xthematic.profiling.traced('tput initc', category='subprocess')
+    def apply_batch(self, colors):
+        mux = multiplexer()
+        if mux:
+            # tput would only reach the pane, if the terminfo entry has initc at all
+            write_tty('/dev/tty', palette_sequence(colors, mux).encode('ascii'))
+            return
+        for color_id, color in colors.items():
+            r, g, b = map(str, color.rgb_large_percentage)
+            subprocess.run(['tput', 'initc', str(color_id.id), r, g, b]).check_returncode()
+
+    def query_current(self):
+        queried = query_palette(tty=self.tty)
+        if len(queried) < 16:
+            # slots the terminal didn't answer for are most likely still the loaded resources
+            colors = self.read_loaded()
+            colors.update(queried)
+            return colors
+        return queried
+
+
+class TtyBackend(SubprocessBackend):
+    """ Writes the whole batch as OSC 4 escape sequences to the tty in a single write."""
+    name = 'tty'
+
+    def __init__(self, tty='/dev/tty'):
+        self.tty = tty
+
+    @xthematic.profiling.traced('tty write', category='tty')
+    def apply_batch(self, colors):
+        if not colors:
+            return
+        write_tty(self.tty, palette_sequence(colors, multiplexer()).encode('ascii'))
+
+
+class MemoryBackend(PaletteBackend):
+    """ Keeps the palette in memory and never touches X or a terminal.
+
+    Every applied batch is recorded in the writes attribute and every batch applied
+    to all terminals in the broadcasts attribute.
+    """
+    name = 'memory'
+
+    def __init__(self, loaded=None):
+        self.loaded = dict(default_palette() if loaded is None else loaded)
+        self.current = dict(self.loaded)
+        self.writes = []
+        self.broadcasts = []
+
+    def read_loaded(self):
+        return dict(self.loaded)
+
+    def apply_batch(self, colors):
+        colors = dict(colors)
+        self.current.update(colors)
+        self.writes.append(colors)
+
+    def apply_everywhere(self, colors):
+        colors = dict(colors)
+        self.current.update(colors)
+        self.broadcasts.append(colors)
+        return 1
+
+    def query_current(self):
+        return dict(self.current)
+
+
+BACKENDS = {cls.name: cls for cls in (SubprocessBackend, TtyBackend, MemoryBackend)}
+
+_backend = None
+
+
+def get_backend():
+    """ Return the backend in use, creating the configured default on first use."""
+    global _backend
+    if _backend is None:
+        name = os.environ.get('XTHEMATIC_BACKEND', SubprocessBackend.name)
+        try:
+            _backend = BACKENDS[name]()
+        except KeyError:
+            raise ValueError(f'unknown palette backend {name!r}, choose one of {sorted(BACKENDS)}')
+    return _backend
+
+
+def set_backend(backend):
+    """ Use backend (a PaletteBackend instance) for all following palette operations."""
+    global _backend
+    _backend = backend
@@ -0,0 +1,144 @@
+""" Binary bundles of many themes in one file.
+
+A bundle is laid out as
+
+    header | records | name index | names
+
+The header holds a magic, the number of themes and the SHA-1 of everything after it.
+Every record is a fixed size palette - a bit mask of the slots that are set followed by
+16 rgb triples - and records are stored in the order of their names. The name index
+holds the offset and length of every name, so a theme is found with a binary search over
+the memory mapped file without parsing or reading the rest of the bundle.
+"""
+import hashlib
+import mmap
+import os
+import struct
+
+import xthematic.palette
+
+MAGIC = b'XTB1'
+SLOTS = 16
+HEADER = struct.Struct('<4sI20s')
+RECORD = struct.Struct(f'<H{SLOTS * 3}s')
+INDEX_ENTRY = struct.Struct('<II')
+
+
+class BundleError(ValueError):
+    pass
+
+
+def _record(palette):
+    mask = 0
+    rgb = bytearray(SLOTS * 3)
+    for number, hex_code in palette.items():
+        mask |= 1 << number
+        rgb[number * 3:number * 3 + 3] = bytes.fromhex(xthematic.palette.normalize_hex(hex_code)[1:])
+    return RECORD.pack(mask, bytes(rgb))
+
+
+def write_bundle(path, named_palettes):
+    """ Write (name, palette) pairs to a bundle at path and return its content hash."""
+    named_palettes = sorted(named_palettes, key=lambda item: item[0].encode('utf-8'))
+    names = [name.encode('utf-8') for name, _ in named_palettes]
+    if len(set(names)) != len(names):
+        raise BundleError('theme names in a bundle must be unique')
+    records = b''.join(_record(palette) for _, palette in named_palettes)
+    index, offset = [], 0
+    for name in names:
+        index.append(INDEX_ENTRY.pack(offset, len(name)))
+        offset += len(name)
+    body = records + b''.join(index) + b''.join(names)
+    digest = hashlib.sha1(body).digest()
+    tmp = f'{path}.tmp'
+    with open(tmp, mode='wb') as f:
+        f.write(HEADER.pack(MAGIC, len(names), digest))
+        f.write(body)
+    os.replace(tmp, path)
+    return digest.hex()
+
+
+def is_bundle(path):
+    try:
+        with open(path, mode='rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class Bundle:
+    """ Read only view of a memory mapped bundle file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, mode='rb') as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise BundleError(f'{path} is not a theme bundle')
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._digest = HEADER.unpack_from(self._map)
+        self._index_offset = HEADER.size + self.count * RECORD.size
+        self._names_offset = self._index_offset + self.count * INDEX_ENTRY.size
+        if magic != MAGIC or len(self._map) < self._names_offset:
+            self.close()
+            raise BundleError(f'{path} is not a theme bundle')
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def content_hash(self):
+        return self._digest.hex()
+
+    def verify(self):
+        """ Return whether the content matches the hash in the header - this reads the whole file."""
+        return hashlib.sha1(self._map[HEADER.size:]).digest() == self._digest
+
+    def _name(self, position):
+        offset, length = INDEX_ENTRY.unpack_from(self._map, self._index_offset + position * INDEX_ENTRY.size)
+        start = self._names_offset + offset
+        return self._map[start:start + length]
+
+    def _palette(self, position):
+        mask, rgb = RECORD.unpack_from(self._map, HEADER.size + position * RECORD.size)
+        return {number: '#' + rgb[number * 3:number * 3 + 3].hex() for number in range(SLOTS) if mask >> number & 1}
+
+    def _position(self, name):
+        key = name.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._name(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._name(low) == key:
+            return low
+        return None
+
+    def palette(self, name):
+        """ Return the palette of the theme name or raise KeyError."""
+        position = self._position(name)
+        if position is None:
+            raise KeyError(name)
+        return self._palette(position)
+
+    def __contains__(self, name):
+        return self._position(name) is not None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """ Yield the theme names in sorted order."""
+        for position in range(self.count):
+            yield self._name(position).decode('utf-8')
+
+    def items(self):
+        for position in range(self.count):
+            yield self._name(position).decode('utf-8'), self._palette(position)
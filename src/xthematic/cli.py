@@ -1,12 +1,30 @@
 import functools
+import itertools
+import os
+import select
+import shlex
 import string
+import sys
+
+import xthematic.profiling
+
+# decided before the remaining imports so that their cost shows up in the profile
+xthematic.profiling.enable_if_requested(sys.argv[1:])
 
 import click
 import collections
 
+import xthematic.backends
+import xthematic.bundle
 import xthematic.colors
 import xthematic.config
+import xthematic.contrast
 import xthematic.display
+import xthematic.exporters
+import xthematic.fastpath
+import xthematic.journal
+import xthematic.palette
+import xthematic.pipeline
 import xthematic.term
 import xthematic.themes
 
@@ -36,16 +54,22 @@ class MutuallyExclusiveOption(click.Option):
 class DependentOption(click.Option):
     def __init__(self, *args, **kwargs):
         self.dependencies = set(kwargs.pop('dependencies', []))
+        self.any_dependency = kwargs.pop('any_dependency', False)
         help_ = kwargs.get('help', '')
         if self.dependencies:
-            ex_str = ', '.join(self.dependencies)
+            ex_str = ', '.join(sorted(self.dependencies))
+            which = 'one of the arguments' if self.any_dependency else 'arguments'
             kwargs['help'] = help_ + (
-                f' NOTE: This argument is dependent on arguments: [{ex_str}].'
+                f' NOTE: This argument is dependent on {which}: [{ex_str}].'
             )
         super().__init__(*args, **kwargs)
 
     def handle_parse_result(self, ctx, opts, args):
-        if self.name in opts and not self.dependencies.issubset(opts):
+        if self.any_dependency:
+            satisfied = bool(self.dependencies.intersection(opts))
+        else:
+            satisfied = self.dependencies.issubset(opts)
+        if self.name in opts and not satisfied:
             raise click.UsageError(
                 f"Illegal usage: `{self.name}` depends on arguments `{self.dependencies}`."
             )
@@ -57,13 +81,25 @@ class ColorType(click.ParamType):
     name = "color"
 
     def convert(self, value, param, ctx):
-        try:
-            if not value.startswith('#'):
-                return xthematic.colors.Color('#' + value)
-            else:
-                return xthematic.colors.Color(value)
-        except ValueError:
-            self.fail(f"{value!r} is not a valid hex code", param, ctx)
+        if isinstance(value, xthematic.colors.Color):
+            return value
+        hex_code = value if value.startswith('#') else '#' + value
+        if xthematic.colors.Color.is_valid_hex_code(hex_code):
+            return xthematic.colors.Color(hex_code)
+        names = color_names()
+        hex_code = names.lookup(value)
+        if hex_code:
+            return xthematic.colors.Color(hex_code)
+        suggestions = ', '.join(match.name for match in names.fuzzy(value, limit=3))
+        hint = f' - did you mean {suggestions}?' if suggestions else ''
+        self.fail(f"{value!r} is neither a hex code nor a color name{hint}", param, ctx)
+
+
+def color_names():
+    """ Return the xthematic.names.ColorNames of the system and the user's list of names."""
+    import xthematic.names
+    return xthematic.names.database(extra_files=[xthematic.config.USER_COLOR_NAMES_FILE],
+                                    cache_file=xthematic.config.USER_COLOR_NAMES_INDEX_FILE)
 
 
 class ColorIdType(click.ParamType):
@@ -109,17 +145,38 @@ class XThemeType(click.ParamType):
         return value
 
 
+def print_profile(trace_file=None):
+    xthematic.profiling.record('total', category='process')
+    if trace_file:
+        xthematic.profiling.write_chrome_trace(trace_file)
+    click.echo(xthematic.profiling.report(), err=True)
+
+
 @click.group()
-def main():
-    pass
+@click.option('--profile', is_flag=True, default=False,
+              help="print a timing breakdown of the command to stderr")
+@click.option('--profile-trace', 'trace_file', type=click.Path(dir_okay=False, writable=True),
+              help="also write the timings as Chrome trace JSON to this file")
+@click.pass_context
+def main(ctx, profile, trace_file):
+    if profile or trace_file:
+        xthematic.profiling.enable()
+        xthematic.profiling.record('import', category='import')
+        ctx.call_on_close(functools.partial(print_profile, trace_file=trace_file))
 
 
 @main.command()
-@click.argument('color_views', type=ColorViewType(), nargs=-1, required=True)
+@click.argument('color_views', type=ColorViewType(), nargs=-1)
 @click.option('-f', '--foreground', type=ColorType(), help='default foreground')
 @click.option('-b', '--background', type=ColorType(), help='default background')
 @click.option('-t', '--text', type=str, default=string.ascii_letters, help='default text')
-def view(color_views, foreground, background, text):
+@click.option('-i', '--input', 'input_file', type=click.File(mode='r', encoding='utf-8'),
+              help="stream color views from this file, one per line ('-' for stdin)")
+@click.option('-p', '--pager', is_flag=True, default=False,
+              help="show streamed color views through a pager")
+@click.option('-n', '--no-wait', is_flag=True, default=False,
+              help="don't wait for Enter after showing the color views given as arguments")
+def view(color_views, foreground, background, text, input_file, pager, no_wait):
     """ display colors in the terminal through a color view spec.
 
     The command takes a variable number of color view arguments.
@@ -133,7 +190,23 @@ def view(color_views, foreground, background, text):
 
     The options '-f', '-b', '-t' can be used to specify default foreground, background and text
     otherwise the default for the terminal are used whilst text is all the ascii letters.
+
+    Without arguments, or with '--input', color views are read one per line from stdin or
+    the file and shown as they arrive, in truecolor and without waiting for Enter, e.g.
+    `palette-generator | xthematic view --pager`. Lines that aren't valid color views are
+    reported and skipped.
     """
+    if input_file is None and not color_views:
+        if click.get_text_stream('stdin').isatty():
+            raise click.UsageError('give color views as arguments, with --input or on stdin')
+        input_file = click.get_text_stream('stdin')
+    if input_file is not None:
+        input_lines, ready = readable_lines(input_file)
+        views = itertools.chain(color_views, read_color_views(input_lines))
+        lines = xthematic.display.color_view_lines(views, foreground=foreground, background=background, text=text)
+        xthematic.display.echo_lines(lines, ready=ready, pager=pager)
+        return
+
     with xthematic.display.ColoredStream.open() as stream:
         nl = True
         for i, cv in enumerate(color_views):
@@ -143,7 +216,94 @@ def view(color_views, foreground, background, text):
             if i == len(color_views) - 1:
                 nl = False
             stream.echo(text=text, fg=fg, bg=bg, nl=nl)
-        input()  # wait for user to press Enter
+        if not no_wait:
+            input()  # wait for user to press Enter
+
+
+def read_color_views(lines):
+    """ Yield the color views of lines of text, reporting invalid lines on stderr."""
+    convert = ColorViewType().convert
+    for number, line in enumerate(lines, start=1):
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+        try:
+            yield convert(line, None, None)
+        except click.BadParameter as e:
+            click.echo(f'line {number}: {e.format_message()}', err=True)
+
+
+def readable_lines(file):
+    """ Return the lines of file and a function telling whether the next one can be read without blocking.
+
+    The lines are read straight from the file descriptor - lines waiting in the buffers of
+    file are invisible to select(). For files without a descriptor the lines of file and None
+    are returned.
+    """
+    try:
+        fd = file.fileno()
+    except (AttributeError, OSError, ValueError):
+        return file, None
+    encoding = getattr(file, 'encoding', None) or 'utf-8'
+    data, start = b'', 0  # lines are split off data[start:] as they are needed
+
+    def lines():
+        nonlocal data, start
+        while True:
+            end = data.find(b'\n', start)
+            if end >= 0:
+                line, start = data[start:end + 1], end + 1
+                yield line.decode(encoding, errors='replace')
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                if start < len(data):
+                    yield data[start:].decode(encoding, errors='replace')
+                return
+            data, start = data[start:] + chunk, 0
+
+    def ready():
+        return data.find(b'\n', start) >= 0 or bool(select.select([fd], [], [], 0)[0])
+
+    return lines(), ready
+
+
+@main.command('import')
+@click.argument('source', type=click.Path(exists=True, resolve_path=True))
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=None,
+              help="number of processes used for parsing (default: number of cores)")
+@click.option('-v', '--verbose', is_flag=True, default=False,
+              help="list every imported and skipped theme")
+def import_(source, jobs, verbose):
+    """ import themes from a directory, a tar/zip archive or a bundle.
+
+    Every file in SOURCE is parsed as an .Xresources file and each one that defines color
+    resources is saved as a theme named after the file. Themes whose colors are the same as
+    an already saved theme are skipped and files that can't be parsed are reported.
+    Bundles written by `xthematic bundle --write` are imported under their theme names.
+    """
+    try:
+        report = xthematic.themes.import_themes(source, jobs=jobs)
+    except xthematic.themes.UnsupportedSource as e:
+        raise click.UsageError(str(e))
+    echo_import_report(report, verbose=verbose)
+
+
+def echo_import_report(report, verbose):
+    if verbose:
+        for path, name in report.imported:
+            click.echo(f'imported {path} as {name}')
+        for path, name in report.duplicates:
+            click.echo(f'skipped {path} - same colors as {name}')
+    for path, error in report.errors:
+        click.echo(f'error: {path}: {error}', err=True)
+    click.echo(f'imported {len(report.imported)} themes, skipped {len(report.duplicates)} duplicates, '
+               f'{len(report.errors)} errors')
+
+
+def echo_step_errors(error):
+    for line in error.describe():
+        click.echo(f'error: {line}', err=True)
 
 
 def deactivate_theme(ctx, param, value):
@@ -160,14 +320,30 @@ def list_themes(ctx, param, value):
     ctx.exit()
 
 
+def show_current_theme(ctx, param, value):
+    if not value or ctx.resilient_parsing:
+        return
+    names = xthematic.themes.current_theme_names()
+    if names:
+        click.echo(' '.join(names))
+    else:
+        click.echo('the current colors are not saved in any theme', err=True)
+        ctx.exit(1)
+    ctx.exit()
+
+
 @main.command()
 @click.argument('theme_name', type=XThemeType(), required=False)
 @click.option('-d', '--deactivate', is_flag=True, default=False,
               is_eager=True, callback=deactivate_theme, expose_value=False,
-              help="deactivate the current theme and return to terminal default colors")
+              help="undo the color changes back to the last theme activation (the resources "
+                   "loaded by a permanent activation stay as they are)")
 @click.option('-l', '--list', is_flag=True, default=False,
               is_eager=True, callback=list_themes, expose_value=False,
               help="list all saved themes")
+@click.option('-c', '--current', is_flag=True, default=False,
+              is_eager=True, callback=show_current_theme, expose_value=False,
+              help="print the names of saved themes with the current terminal colors")
 @click.option('-r', '--remove', is_flag=True, default=False,
               help="delete the specified theme")
 @click.option('-a', '--activate', is_flag=True, default=False,
@@ -179,13 +355,34 @@ def list_themes(ctx, param, value):
                     "the user's ~/.Xresources file. Alternatively if the $XTHEME_LINK_FILE "
                     "environment variable is set will link the symlink to the theme file "
                     "and will not do any modifications to ~/.Xresources."))
+@click.option('-A', '--all-terminals', is_flag=True, default=False,
+              cls=DependentOption, dependencies=['activate'],
+              help="activate the theme in all open terminals, or in every pane of the tmux session")
 @click.option('-s', '--save', is_flag=True, default=False,
               cls=MutuallyExclusiveOption, mutually_exclusive=['activate'],
               help="save the current terminal colors in a theme file.")
 @click.option('-o', '--overwrite', is_flag=True, default=False,
-              cls=DependentOption, dependencies=['save'],
+              cls=DependentOption, dependencies=['save', 'image'], any_dependency=True,
               help="overwrite a theme file if it exists with the current terminal colors")
-def theme(theme_name, remove, activate, permanent, save, overwrite):
+@click.option('-i', '--from-image', 'image', type=click.Path(exists=True),
+              cls=MutuallyExclusiveOption, mutually_exclusive=['activate', 'save'],
+              help="generate the theme from the colors of an image, or a theme per image of a directory")
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=None,
+              help="number of processes used by --from-image for a directory (default: number of cores)")
+@click.option('--similar', 'similar_to', type=XThemeType(),
+              cls=MutuallyExclusiveOption, mutually_exclusive=['near'],
+              help="list the saved themes that look the most like this theme")
+@click.option('--near', type=ColorType(),
+              cls=MutuallyExclusiveOption, mutually_exclusive=['similar_to'],
+              help="list the saved themes with a color closest to this hex code")
+@click.option('-k', '--count', type=click.IntRange(min=1), default=10,
+              help="number of themes listed by --similar and --near")
+@click.option('-g', '--gallery', is_flag=True, default=False,
+              help="show swatches of all saved themes, or of those matching THEME_NAME as a pattern")
+@click.option('-e', '--emit', is_flag=True, default=False,
+              help="print the escape sequence that sets the theme's colors (the current colors by default)")
+def theme(theme_name, remove, activate, permanent, all_terminals, save, overwrite, image, jobs, similar_to, near,
+          count, gallery, emit):
     """ view, activate or save themes.
 
     The first argument to this command is a theme name (valid or invalid), if no theme_name
@@ -194,17 +391,50 @@ def theme(theme_name, remove, activate, permanent, save, overwrite):
     Specifying a theme name without any options will print the themes colors
     to the terminal.
 
+    '--gallery' shows swatches of many themes page by page, e.g. `xthematic theme 'base16*' -g`.
+    Neither this nor viewing a single theme changes the terminal's colors.
+
     The '--activate' and '--permanent' options are used for activating themes.
     While the '--save' and '--overwrite' options for saving.
+
+    '--similar' and '--near' list the closest saved themes together with their
+    perceptual distance (lower is closer).
+
+    '--from-image' saves a theme generated from a wallpaper, e.g.
+    `xthematic theme forest --from-image forest.jpg`. Given a directory it saves a theme
+    for every image in it, named after the file and prefixed with THEME_NAME if it is given.
     """
-    if not theme_name:
+    if image and os.path.isdir(image):
+        report = xthematic.themes.themes_from_images(image, prefix=theme_name or '', jobs=jobs)
+        echo_import_report(report, verbose=True)
+    elif image:
+        if not theme_name:
+            raise click.UsageError('a theme name is required to generate a theme from an image')
+        xthematic.themes.theme_from_image(theme_name, image, overwrite=overwrite)
+    elif emit:
+        click.echo(xthematic.themes.theme_sequence(theme_name), nl=False, color=True)
+    elif gallery:
+        xthematic.display.echo_gallery(xthematic.themes.theme_palettes(pattern=theme_name))
+    elif similar_to or near:
+        if similar_to:
+            matches = xthematic.themes.similar_themes(similar_to, k=count)
+        else:
+            matches = xthematic.themes.themes_near_color(near, k=count)
+        for name, distance in matches:
+            click.echo(f'{name}\t{distance:.2f}')
+    elif not theme_name:
         xthematic.display.echo_theme()
     elif activate:
-        if xthematic.config.USER_THEME_LINK_FILE:
-            xthematic.themes.activate_theme(theme_name, permanent=permanent,
-                                            link_file=xthematic.config.USER_THEME_LINK_FILE)
-        else:
-            xthematic.themes.activate_theme(theme_name, permanent=permanent)
+        try:
+            if xthematic.config.USER_THEME_LINK_FILE:
+                xthematic.themes.activate_theme(theme_name, permanent=permanent,
+                                                link_file=xthematic.config.USER_THEME_LINK_FILE,
+                                                everywhere=all_terminals)
+            else:
+                xthematic.themes.activate_theme(theme_name, permanent=permanent, everywhere=all_terminals)
+        except xthematic.pipeline.PipelineError as e:
+            echo_step_errors(e)
+            raise click.ClickException(f'could not activate {theme_name}, the previous colors were restored')
     elif save:
         xthematic.themes.save_terminal_colors(theme_name, overwrite=overwrite)
     elif remove:
@@ -216,7 +446,7 @@ def theme(theme_name, remove, activate, permanent, save, overwrite):
 def reset_colors(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
-    xthematic.term.TERMINAL_COLORS.reset_customized()
+    xthematic.term.reset_customized()
     ctx.exit()
 
 
@@ -232,7 +462,7 @@ def reset_colors(ctx, param, value):
 @click.option('-t', '--theme-name', help='set or view inside theme',
               type=XThemeType(),
               cls=MutuallyExclusiveOption, mutually_exclusive=['xresources_file', 'all_terminals'])
-@click.option('-a', '--all-terminals', help='set or view the color in all open terminals',
+@click.option('-a', '--all-terminals', help='set the color in all open terminals (every pane and client inside tmux)',
               is_flag=True, default=False,
               cls=MutuallyExclusiveOption, mutually_exclusive=['theme_name', 'xresources_file'])
 def color(color_id, color, xresources_file, theme_name, all_terminals):
@@ -241,6 +471,10 @@ def color(color_id, color, xresources_file, theme_name, all_terminals):
     The command takes two arguments - a color id and a hex color code, the latter of which is optional.
     If hex color code is not specified it displays the currently loaded terminal color for that id.
     Otherwise it sets the terminal color for that id to the hex code.
+
+    With '-x FILE' or '-t THEME' the color is viewed or set in that resources file or saved
+    theme instead of the terminal. Setting it only replaces the value of the color's resource
+    in the file and leaves the rest of the file as it is.
     """
     def display_color(color_):
         with xthematic.display.ColoredStream.open() as stream:
@@ -250,24 +484,293 @@ def color(color_id, color, xresources_file, theme_name, all_terminals):
         return
 
     if xresources_file:
-        # TODO
-        raise NotImplementedError()
+        if color:
+            xthematic.themes.set_resource_color(xresources_file, color_id, color)
+        else:
+            with open(xresources_file, mode='r', encoding='utf-8') as f:
+                palette = xthematic.palette.parse_resources(f.read())
+            if color_id.id not in palette:
+                raise click.ClickException(f'{xresources_file} has no resource for color {color_id.id}')
+            display_color(xthematic.colors.Color(palette[color_id.id]))
     elif theme_name:
-        # TODO
         if color:
-            raise NotImplementedError()
+            xthematic.themes.set_theme_color(theme_name, color_id, color)
         else:
             display_color(xthematic.themes.theme_colors(theme_name)[color_id])
 
     elif all_terminals:
-        # TODO
-        raise NotImplementedError()
+        if not color:
+            raise click.UsageError('--all-terminals needs a color to set')
+        try:
+            xthematic.term.apply_colors({color_id: color}, everywhere=True)
+        except xthematic.pipeline.PipelineError as e:
+            echo_step_errors(e)
+            raise click.ClickException(f'could not set color {color_id.id}, the previous colors were restored')
     else:
         if color:
-            xthematic.term.TERMINAL_COLORS[color_id] = color
+            try:
+                xthematic.term.set_color(color_id, color)
+            except xthematic.pipeline.PipelineError as e:
+                echo_step_errors(e)
+                raise click.ClickException(f'could not set color {color_id.id}, the previous colors were restored')
         else:
             display_color(xthematic.term.TERMINAL_COLORS[color_id])
 
 
-def edit():
-    raise NotImplementedError()
+@main.command()
+@click.argument('names', type=XThemeType(), nargs=-1)
+@click.option('-m', '--method', type=click.Choice(xthematic.contrast.METHODS), default='wcag',
+              help="WCAG 2 contrast ratio or APCA lightness contrast (default: wcag)")
+@click.option('--min', 'minimum', type=float, default=None,
+              help="contrast a pair needs to pass (default: 4.5 for wcag and 60 for apca)")
+@click.option('-v', '--verbose', is_flag=True, default=False,
+              help="list the failing foreground/background pairs of every theme")
+def audit(names, method, minimum, verbose):
+    """ check the readability of themes.
+
+    Measures the contrast of every foreground/background pair that `xthematic theme` shows
+    for the named themes, or for all saved themes if no names are given, and prints the
+    percentage of readable pairs of each theme.
+    """
+    results = xthematic.themes.audit_themes(names, method=method, minimum=minimum)
+    for result in results:
+        click.echo(f'{result.name}\t{result.score:.0f}%\t{len(result.failures)} failing')
+        if verbose:
+            for failure in result.failures:
+                click.echo(f'    color{failure.fg} on color{failure.bg}: {failure.contrast:.2f}')
+    if len(results) > 1:
+        readable = sum(1 for result in results if not result.failures)
+        mean = sum(result.score for result in results) / len(results)
+        click.echo(f'audited {len(results)} themes, {readable} fully readable, mean score {mean:.0f}%')
+
+
+@main.command()
+@click.argument('bundle_file', type=click.Path(dir_okay=False))
+@click.argument('theme_name', required=False)
+@click.option('-w', '--write', is_flag=True, default=False,
+              help="write the saved themes, or those matching THEME_NAME as a pattern, to BUNDLE_FILE")
+@click.option('--verify', is_flag=True, default=False,
+              help="check BUNDLE_FILE against its content hash")
+def bundle(bundle_file, theme_name, write, verify):
+    """ list, view or write a bundle of themes.
+
+    A bundle packs many themes into one binary file that is read without parsing, so
+    listing it or viewing one of its themes takes the same time for ten themes as for
+    ten thousand. Without options the theme names in BUNDLE_FILE are listed and with
+    THEME_NAME the colors of that theme are printed. Bundles are imported with
+    `xthematic import BUNDLE_FILE`.
+    """
+    if write:
+        content_hash = xthematic.themes.export_bundle(bundle_file, pattern=theme_name)
+        click.echo(content_hash)
+        return
+    with xthematic.bundle.Bundle(bundle_file) as bundle_:
+        if verify:
+            if not bundle_.verify():
+                raise click.ClickException(f'{bundle_file} does not match its content hash')
+            click.echo(f'{bundle_.content_hash} {len(bundle_)} themes')
+        elif theme_name:
+            try:
+                palette = bundle_.palette(theme_name)
+            except KeyError:
+                raise click.ClickException(f'there is no theme {theme_name!r} in {bundle_file}')
+            xthematic.display.echo_palette(palette)
+        else:
+            click.echo(' '.join(bundle_))
+
+
+def parse_export_formats(ctx, param, value):
+    try:
+        return xthematic.exporters.parse_formats(value)
+    except xthematic.exporters.ExportError as e:
+        raise click.BadParameter(str(e), ctx=ctx, param=param)
+
+
+@main.command()
+@click.argument('theme_name', type=XThemeType(), required=False)
+@click.option('--to', 'formats', required=True, callback=parse_export_formats,
+              help=f"comma separated formats to export to: {', '.join(xthematic.exporters.FORMATS)}")
+@click.option('-o', '--output-dir', type=click.Path(file_okay=False),
+              help="write THEME.EXTENSION files to this directory (default: the current one)")
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=None,
+              help="number of processes used for compiling (default: number of cores)")
+@click.option('-v', '--verbose', is_flag=True, default=False,
+              help="list every written file")
+def export(theme_name, formats, output_dir, jobs, verbose):
+    """ export themes to the theme formats of other terminals.
+
+    A single theme in a single format is printed, e.g. `xthematic export dark --to kitty`.
+    Otherwise the saved themes - all of them, or those matching THEME_NAME as a pattern -
+    are written to the output directory in every format, e.g.
+    `xthematic export --to kitty,alacritty,foot,windows-terminal,base16 -o ~/themes`.
+    Compiled themes are cached and files that are already up to date aren't written again.
+    """
+    if output_dir is None and theme_name and len(formats) == 1 and not set('*?[').intersection(theme_name):
+        click.echo(xthematic.themes.export_theme(theme_name, formats[0]), nl=False)
+        return
+    report = xthematic.themes.export_themes(output_dir or '.', formats, pattern=theme_name, jobs=jobs)
+    if verbose:
+        for path in report.written:
+            click.echo(f'wrote {path}')
+    click.echo(f'wrote {len(report.written)} files, {len(report.unchanged)} were up to date')
+
+
+@main.command()
+@click.argument('query', required=False)
+@click.option('--near', type=ColorType(),
+              help="list the names of the colors closest to this color instead")
+@click.option('-k', '--count', type=click.IntRange(min=1), default=10,
+              help="number of names listed by --near and for misspelled queries")
+def names(query, near, count):
+    """ look up color names.
+
+    Every option and argument that takes a hex code also takes a name from the CSS colors,
+    the X11 rgb.txt or the user's own list in ~/.config/xthematic/colornames (lines of
+    'name #rrggbb' or in the rgb.txt format). Lists the names starting with QUERY, or the
+    closest spellings if there are none, and all names without QUERY.
+    """
+    database = color_names()
+    if near:
+        matches = database.nearest(near.hex, limit=count)
+        click.echo('\n'.join(f'{m.name}\t{m.hex}\t{m.distance:.2f}' for m in matches))
+        return
+    matches = database.prefixed(query or '')
+    if not matches and query:
+        matches = database.fuzzy(query, limit=count, cutoff=0.6)
+    if not matches:
+        raise click.ClickException(f'there is no color named like {query!r}')
+    click.echo('\n'.join(f'{m.name}\t{m.hex}' for m in matches))
+
+
+@main.command()
+@click.argument('steps', type=click.IntRange(min=1), default=1)
+def undo(steps):
+    """ undo the last palette changes of this terminal.
+
+    Takes an optional number of changes to undo (1 by default). Every color set and
+    theme activation in a terminal session counts as one change.
+    """
+    done = xthematic.term.undo(steps)
+    if done < steps:
+        click.echo(f'undid {done} change(s) - nothing more to undo', err=True)
+
+
+@main.command()
+@click.argument('steps', type=click.IntRange(min=1), default=1)
+def redo(steps):
+    """ redo palette changes that were undone."""
+    done = xthematic.term.redo(steps)
+    if done < steps:
+        click.echo(f'redid {done} change(s) - nothing more to redo', err=True)
+
+
+@main.command()
+def history():
+    """ list the palette changes of this terminal.
+
+    The '>' marks the last change that is in effect, the ones after it can be redone.
+    """
+    records, applied = xthematic.term.session_journal().records()
+    if applied == 0:
+        click.echo('>  0 start')
+    for number, record in enumerate(records, start=1):
+        marker = '>' if number == applied else ' '
+        if record.kind == xthematic.journal.THEME_CHANGE:
+            summary = f'theme  {len(record.changes)} colors'
+        else:
+            summary = 'color  ' + ', '.join(f'color{c.slot} {c.old} -> {c.new}' for c in record.changes)
+        click.echo(f'{marker}{number:>3} {summary}')
+
+
+@main.command()
+@click.argument('file', type=click.File(mode='r', encoding='utf-8'), default='-')
+@click.option('-k', '--keep-going', is_flag=True, default=False,
+              help="run the remaining commands after one fails")
+@click.pass_context
+def batch(ctx, file, keep_going):
+    """ run many commands in one process.
+
+    Reads xthematic commands, one per line and without the program name, from FILE or
+    stdin, e.g. `color 3 FF0000` or `theme dark -a`. Blank lines and lines starting with # are ignored.
+    Startup costs and the queries of the current colors are paid once and all palette
+    changes are applied together after the last command - with one write to the terminal,
+    one journal record (undone by a single `xthematic undo`) and one load of the resources.
+    Stops at the first failing command unless '--keep-going' is given.
+    """
+    try:
+        failed = _run_batch(file, keep_going)
+    except xthematic.pipeline.PipelineError as e:
+        echo_step_errors(e)
+        click.echo('Error: could not apply the batched changes, the previous colors were restored', err=True)
+        failed = 1
+    if failed:
+        ctx.exit(1)
+
+
+def _run_batch(file, keep_going):
+    """ Run the commands of file inside batched() and return the number of failed commands."""
+    failed = 0
+    with xthematic.term.batched():
+        for number, line in enumerate(file, start=1):
+            try:
+                # only whole line comments - '#' also starts hex codes like in `color 1 #ff0000`
+                if line.lstrip().startswith('#'):
+                    continue
+                args = shlex.split(line)
+                if not args:
+                    continue
+                parsed = xthematic.fastpath.parse(args)
+                if parsed:
+                    command, kwargs = parsed
+                    code = xthematic.fastpath.COMMANDS[command](**kwargs)
+                else:
+                    code = main.main(args=args, prog_name='xthematic', standalone_mode=False)
+            except click.ClickException as e:
+                e.show()
+                code = e.exit_code
+            except click.Abort:
+                code = 1
+            except xthematic.pipeline.PipelineError as e:
+                echo_step_errors(e)
+                code = 1
+            except (OSError, ValueError) as e:
+                click.echo(f'Error: {e}', err=True)
+                code = 1
+            if code:
+                failed += 1
+                click.echo(f'line {number}: {line.strip()!r} failed', err=True)
+                if not keep_going:
+                    break
+    return failed
+
+
+@main.command()
+@click.argument('theme_name', type=XThemeType(), required=False)
+def edit(theme_name):
+    """ edit the terminal's colors, or the theme THEME_NAME, interactively.
+
+    Up and down select a color, left and right (or clicks on the sliders) change the selected
+    red, green or blue value and every change is shown in the terminal right away. 's' saves
+    the colors - as the terminal's custom colors, and also to THEME_NAME if given - and 'q'
+    quits, restoring the colors of the last save.
+    """
+    import xthematic.editor
+    # the terminal may not report every slot, the editor needs all of them
+    current = xthematic.palette.from_colormap(xthematic.backends.default_palette())
+    current.update(xthematic.palette.from_colormap(xthematic.term.TERMINAL_COLORS))
+    palette = dict(current)
+    if theme_name:
+        palette.update(xthematic.palette.from_colormap(xthematic.themes.theme_colors(theme_name)))
+    kind = xthematic.journal.THEME_CHANGE if theme_name else xthematic.journal.COLOR_CHANGE
+
+    applied = dict(current)
+
+    def save(edited):
+        # the theme is only written once the terminal took the colors
+        changed = {slot: hex_code for slot, hex_code in edited.items() if applied.get(slot) != hex_code}
+        xthematic.term.apply_colors(xthematic.palette.to_colormap(changed), kind=kind)
+        applied.update(changed)
+        if theme_name:
+            xthematic.themes.save_theme(theme_name, xthematic.palette.to_colormap(edited), overwrite=True)
+
+    xthematic.editor.run(palette, save=save, restore=current, backend=xthematic.term.TERMINAL_COLORS.backend)
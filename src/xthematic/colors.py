@@ -30,17 +30,7 @@ class Color:
 
     @property
     def rgb(self):
-        if self.hex.startswith('#'):
-            hex_code = self.hex[1:]
-        else:
-            hex_code = self.hex
-        colors = []
-        hex_code = iter(hex_code)
-        for a in hex_code:
-            b = next(hex_code)
-            ci = int(a+b, base=16)
-            colors.append(ci)
-        return tuple(colors)
+        return tuple(bytes.fromhex(self.hex.lstrip('#')))
 
     @property
     def rgb_percentage(self):
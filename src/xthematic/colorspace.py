@@ -0,0 +1,27 @@
+""" Color space constants shared by the modules that measure colors.
+
+xthematic.similarity, xthematic.contrast and xthematic.extract all start from linear sRGB
+and some of them go on to CIE XYZ under a D65 white point. They also all use numpy when it
+is installed, which is imported only when it is first needed because it is slow to import.
+"""
+
+
+def _linear(channel):
+    c = channel / 255
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+
+# linear value of every 8 bit sRGB channel value
+SRGB_LINEAR = [_linear(k) for k in range(256)]
+
+# CIE XYZ of the D65 white point, with Y = 1
+D65_WHITE = (0.95047, 1.0, 1.08883)
+
+
+def optional_numpy():
+    """ Return the numpy module if it is installed, otherwise None."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
@@ -1,9 +1,25 @@
+import atexit
 import logging
+import logging.handlers
 import os
 import pathlib
+import queue
+
+import xthematic.profiling
+
+
+def log_level_from_env(default=logging.INFO):
+    level = logging.getLevelName(os.environ.get('XTHEMATIC_LOG_LEVEL', '').upper())
+    return level if isinstance(level, int) else default
+
+
+LOG_LEVEL = log_level_from_env()
+LOG_FILE_MAX_BYTES = 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 3
 
 root_logger = logging.getLogger()
-root_logger.setLevel(logging.DEBUG)
+# records below every handler's level are dropped before they are ever formatted
+root_logger.setLevel(min(LOG_LEVEL, logging.WARNING))
 CONSOLE_HANDLER = logging.StreamHandler()
 CONSOLE_HANDLER.setLevel(logging.WARNING)
 CONSOLE_HANDLER.setFormatter(logging.Formatter(fmt='{levelname}: {message}', style='{'))
@@ -25,6 +41,7 @@ def file_state_ok(file, default_text=''):
     return True
 
 
+@xthematic.profiling.traced('config.get_safe_file', category='file')
 def get_safe_file(file, backup=None, default_text=''):
     """ Get a safe file path that is guaranteed to exist and have r/w access.
 
@@ -44,12 +61,45 @@ def get_safe_file(file, backup=None, default_text=''):
             raise RuntimeError("can't r/w to file %s or backup %s", file, backup)
 
 
+@xthematic.profiling.traced('config.get_safe_dir', category='file')
 def get_safe_dir(path):
     if not path.exists():
         path.mkdir(exist_ok=True)
     return path
 
 
+class LazyLogFileHandler(logging.handlers.RotatingFileHandler):
+    """ Rotating log file handler that chooses and opens its file on the first record.
+
+    The file is the first of file and backup for which get_safe_file succeeds.
+    """
+
+    def __init__(self, file, backup=None, **kwargs):
+        super().__init__(str(file), delay=True, **kwargs)
+        self.file = file
+        self.backup = backup
+
+    def _open(self):
+        self.baseFilename = os.path.abspath(str(get_safe_file(self.file, backup=self.backup)))
+        return super()._open()
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """ Queue handler that starts its listener thread when the first record is queued."""
+
+    def __init__(self, *handlers):
+        super().__init__(queue.Queue())
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self._started = False
+
+    def enqueue(self, record):
+        if not self._started:
+            self._started = True
+            self.listener.start()
+            atexit.register(self.listener.stop)
+        super().enqueue(record)
+
+
 def get_multiple(dct, keys, default=None):
     for key in keys:
         if key in dct:
@@ -80,15 +130,29 @@ USER_CONFIG_FILE = get_safe_file(USER_CONFIG_DIR / 'config')
 USER_CUSTOM_FILE = get_safe_file(USER_CONFIG_DIR / 'custom', default_text='{}')
 USER_OLD_THEME_FILE = get_safe_file(USER_CONFIG_DIR / 'old_theme')
 USER_XRESOURCES_FILE = get_safe_file(pathlib.Path(os.environ['HOME'], '.Xresources'))
-
-LOG_FILE = get_safe_file(pathlib.Path('/var/log/xthematic.log'),
-                         backup=pathlib.Path(USER_CONFIG_DIR / 'logs'))
-
-LOG_FILE_HANDLER = logging.FileHandler(str(LOG_FILE))
-LOG_FILE_HANDLER.setLevel(logging.DEBUG)
+USER_INDEX_FILE = USER_CONFIG_DIR / 'index.json'
+USER_OFFSETS_FILE = USER_CONFIG_DIR / 'offsets.json'
+USER_EXPORT_CACHE_DIR = USER_CONFIG_DIR / 'exports'
+USER_VECTORS_FILE = USER_CONFIG_DIR / 'vectors.bin'
+USER_SEQUENCE_FILE = USER_CONFIG_DIR / 'sequences'
+USER_JOURNAL_DIR = get_safe_dir(USER_CONFIG_DIR / 'journal')
+USER_XRDB_CACHE_FILE = USER_CONFIG_DIR / 'xrdb.json'
+USER_COLOR_NAMES_FILE = USER_CONFIG_DIR / 'colornames'
+USER_COLOR_NAMES_INDEX_FILE = USER_CONFIG_DIR / 'colornames.json'
+
+LOG_FILE_HANDLER = LazyLogFileHandler(pathlib.Path('/var/log/xthematic.log'),
+                                      backup=pathlib.Path(USER_CONFIG_DIR / 'logs'),
+                                      maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT)
+LOG_FILE_HANDLER.setLevel(LOG_LEVEL)
 fmt_s = '{asctime} ' + TERMINAL_SESSION_ID[-4:] + ' {module}.{funcName} line {lineno}: {levelname}: {message}'
 LOG_FILE_HANDLER.setFormatter(logging.Formatter(fmt=fmt_s, style='{'))
-root_logger.addHandler(LOG_FILE_HANDLER)
+# the file is written from a background thread so logging stays off the command's critical path
+LOG_QUEUE_HANDLER = LazyQueueHandler(LOG_FILE_HANDLER)
+LOG_QUEUE_HANDLER.setLevel(LOG_LEVEL)
+root_logger.addHandler(LOG_QUEUE_HANDLER)
 
 _xlf = os.environ.get('XTHEME_LINK_FILE', None)
 USER_THEME_LINK_FILE = pathlib.Path(_xlf) if _xlf else _xlf
+
+# ask the terminal for its palette instead of keeping track of loaded and customized colors
+LIVE_PALETTE = os.environ.get('XTHEMATIC_LIVE_PALETTE', '') not in ('', '0')
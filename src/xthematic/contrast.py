@@ -0,0 +1,139 @@
+""" Readability of the foreground/background pairs of palettes.
+
+Contrast is measured either as the WCAG 2 contrast ratio (1 to 21, 4.5 is the AA minimum
+for normal text) or as the absolute APCA lightness contrast (0 to about 108, 60 is the
+recommended minimum for body text). The pairs audited are the ones `xthematic theme`
+draws - every one of the 16 colors on each of the 8 normal colors - except a color on
+itself, which is invisible by design.
+
+numpy is used to audit all palettes at once when it is installed.
+"""
+import collections
+
+import xthematic.backends
+import xthematic.colorspace
+
+SLOTS = 16
+BACKGROUNDS = 8
+METHODS = ('wcag', 'apca')
+MINIMUMS = {'wcag': 4.5, 'apca': 60}
+
+AuditResult = collections.namedtuple('AuditResult', ['name', 'score', 'failures'])
+Failure = collections.namedtuple('Failure', ['fg', 'bg', 'contrast'])
+
+_APCA_COEFFICIENTS = (0.2126729, 0.7151522, 0.0721750)
+_APCA_POWER = [(k / 255) ** 2.4 for k in range(256)]
+
+
+def _rgb(hex_code):
+    hex_code = hex_code.lstrip('#')
+    return int(hex_code[0:2], 16), int(hex_code[2:4], 16), int(hex_code[4:6], 16)
+
+
+def relative_luminance(hex_code):
+    """ WCAG 2 relative luminance of a '#rrggbb' color."""
+    r, g, b = (xthematic.colorspace.SRGB_LINEAR[c] for c in _rgb(hex_code))
+    return 0.2126 * r + 0.7152 * g + 0.0722 * b
+
+
+def apca_luminance(hex_code):
+    """ Screen luminance of a '#rrggbb' color as estimated by APCA."""
+    return sum(k * _APCA_POWER[c] for k, c in zip(_APCA_COEFFICIENTS, _rgb(hex_code)))
+
+
+def wcag_ratio(fg, bg):
+    """ WCAG 2 contrast ratio of two relative luminances."""
+    high, low = max(fg, bg), min(fg, bg)
+    return (high + 0.05) / (low + 0.05)
+
+
+def apca_lc(fg, bg):
+    """ APCA (0.0.98G) lightness contrast of text luminance fg on background luminance bg.
+
+    Positive for dark text on light backgrounds and negative the other way around.
+    """
+    fg, bg = (y + (0.022 - y) ** 1.414 if y < 0.022 else y for y in (fg, bg))
+    if abs(bg - fg) < 0.0005:
+        return 0.0
+    if bg > fg:
+        sapc = (bg ** 0.56 - fg ** 0.57) * 1.14
+        return 0.0 if sapc < 0.1 else (sapc - 0.027) * 100
+    sapc = (bg ** 0.65 - fg ** 0.62) * 1.14
+    return 0.0 if sapc > -0.1 else (sapc + 0.027) * 100
+
+
+def wcag_contrast(hex_a, hex_b):
+    """ WCAG 2 contrast ratio of two '#rrggbb' colors."""
+    return wcag_ratio(relative_luminance(hex_a), relative_luminance(hex_b))
+
+
+def _full(palette):
+    return [palette.get(slot, xthematic.backends.DEFAULT_PALETTE[slot]) for slot in range(SLOTS)]
+
+
+def _contrast_grids(palettes, method):
+    """ Return a (themes, 16, 8) array, or nested lists without numpy, of fg x bg contrasts where higher is better."""
+    numpy = xthematic.colorspace.optional_numpy()
+    if numpy is None:
+        luminance = relative_luminance if method == 'wcag' else apca_luminance
+        measure = wcag_ratio if method == 'wcag' else (lambda fg, bg: abs(apca_lc(fg, bg)))
+        grids = []
+        for palette in palettes:
+            y = [luminance(hex_code) for hex_code in _full(palette)]
+            grids.append([[measure(y[fg], y[bg]) for bg in range(BACKGROUNDS)] for fg in range(SLOTS)])
+        return grids
+
+    data = ''.join(hex_code.lstrip('#') for palette in palettes for hex_code in _full(palette))
+    rgb = numpy.frombuffer(bytes.fromhex(data), dtype=numpy.uint8).reshape(-1, SLOTS, 3)
+    if method == 'wcag':
+        table = numpy.asarray(xthematic.colorspace.SRGB_LINEAR)
+        y = table[rgb] @ numpy.array([0.2126, 0.7152, 0.0722])
+        fg, bg = y[:, :, None], y[:, None, :BACKGROUNDS]
+        return (numpy.maximum(fg, bg) + 0.05) / (numpy.minimum(fg, bg) + 0.05)
+    y = numpy.asarray(_APCA_POWER)[rgb] @ numpy.array(_APCA_COEFFICIENTS)
+    y = numpy.where(y < 0.022, y + numpy.abs(0.022 - y) ** 1.414, y)
+    fg, bg = y[:, :, None], y[:, None, :BACKGROUNDS]
+    normal = (bg ** 0.56 - fg ** 0.57) * 1.14
+    reverse = (bg ** 0.65 - fg ** 0.62) * 1.14
+    lc = numpy.where(bg > fg,
+                     numpy.where(normal < 0.1, 0, normal - 0.027),
+                     numpy.where(reverse > -0.1, 0, reverse + 0.027)) * 100
+    return numpy.where(numpy.abs(bg - fg) < 0.0005, 0, numpy.abs(lc))
+
+
+def _failures(grids, minimum):
+    """ Return a list of Failure lists, one for every grid."""
+    numpy = xthematic.colorspace.optional_numpy()
+    if numpy is None:
+        return [[Failure(fg, bg, grid[fg][bg]) for fg in range(SLOTS) for bg in range(BACKGROUNDS)
+                 if fg != bg and grid[fg][bg] < minimum]
+                for grid in grids]
+    failing = grids < minimum
+    failing[:, range(BACKGROUNDS), range(BACKGROUNDS)] = False
+    failures = [[] for _ in range(len(grids))]
+    themes, fgs, bgs = numpy.nonzero(failing)
+    for theme, fg, bg, value in zip(themes.tolist(), fgs.tolist(), bgs.tolist(), grids[failing].tolist()):
+        failures[theme].append(Failure(fg, bg, value))
+    return failures
+
+
+def audit(named_palettes, method='wcag', minimum=None):
+    """ Audit the readability of (name, palette) pairs.
+
+    Missing slots are filled with the xterm defaults.
+
+    :param method: 'wcag' or 'apca'
+    :param minimum: the contrast a pair needs to pass, by default MINIMUMS[method]
+    :return: list of AuditResult with the percentage of passing pairs as score and the
+    failing pairs as Failure(fg slot, bg slot, contrast)
+    """
+    if method not in METHODS:
+        raise ValueError(f'unknown contrast method {method!r}')
+    minimum = MINIMUMS[method] if minimum is None else minimum
+    named_palettes = list(named_palettes)
+    if not named_palettes:
+        return []
+    grids = _contrast_grids([palette for _, palette in named_palettes], method)
+    pairs = SLOTS * BACKGROUNDS - BACKGROUNDS
+    return [AuditResult(name, 100 * (pairs - len(failures)) / pairs, failures)
+            for (name, _), failures in zip(named_palettes, _failures(grids, minimum))]
@@ -1,19 +1,31 @@
 import contextlib
+import functools
+import itertools
+import shutil
 
 import click
 import sty
 
 import xthematic.colors
+import xthematic.term
 import xthematic.themes
 from xthematic.term import TERMINAL_COLORS
 
 
 class ColoredContext:
+    """ Shows colors that aren't in the terminal's palette by borrowing the slots it doesn't use.
+
+    Borrowed colors are only written to the terminal. They don't become custom colors, aren't
+    cached or journaled and TERMINAL_COLORS keeps the colors they cover. All colors registered
+    before a commit() are set with one write and unregister_all() restores them with another.
+    """
     all_color_identifiers = set(xthematic.colors.ColorIdentifier.all_four_bit_colors())
 
     def __init__(self):
         self.used_color_ids = set()
         self.overwritten_colors = {}
+        self.borrowed = {}  # id -> registered color
+        self.pending = {}  # id -> registered color that isn't written yet
 
     @property
     def registered_ids(self):
@@ -24,30 +36,48 @@ class ColoredContext:
         return self.all_color_identifiers - self.registered_ids - self.used_color_ids
 
     def register_color(self, color):
-        if len(self.free) < 0:
+        if not self.free:
             raise RuntimeError("cannot register any more color values.")
-        elif color in xthematic.term.TERMINAL_COLORS.values():
+        elif color in self.printable_colors():
             raise ValueError(f"color {color} is already defined in the terminal's colors")
 
         id_ = self.free.pop()
-        self.overwritten_colors[id_] = xthematic.term.TERMINAL_COLORS[id_]
+        self.overwritten_colors[id_] = TERMINAL_COLORS[id_]
+        self.borrowed[id_] = self.pending[id_] = color
+
+    def commit(self):
+        """ Set the colors registered since the last commit in the terminal."""
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
         try:
-            xthematic.term.TERMINAL_COLORS[id_] = color
+            self._write(pending)
         except Exception:
-            del self.overwritten_colors[id_]
+            for id_ in pending:
+                self.overwritten_colors.pop(id_, None)
+                self.borrowed.pop(id_, None)
             raise
 
     def unregister_color(self, color):
         id_ = self.id_for_color(color)
-        xthematic.term.TERMINAL_COLORS[id_] = self.overwritten_colors[id_]
+        if self.pending.pop(id_, None) is None:
+            self._write({id_: self.overwritten_colors[id_]})
+        del self.borrowed[id_]
         del self.overwritten_colors[id_]
         self.used_color_ids.remove(id_)
 
     def unregister_all(self):
-        for id_ in self.registered_ids:
-            xthematic.term.TERMINAL_COLORS[id_] = self.overwritten_colors[id_]
+        written = {id_: color for id_, color in self.overwritten_colors.items() if id_ not in self.pending}
+        self.pending.clear()
+        self.borrowed.clear()
         self.overwritten_colors.clear()
         self.used_color_ids.clear()
+        if written:
+            self._write(written)
+
+    @staticmethod
+    def _write(colors):
+        TERMINAL_COLORS.backend.apply_batch(xthematic.term.sorted_colors(colors))
 
     def format_string_for_ids(self, fg_id=None, bg_id=None):
         s = '{}' + sty.rs.all
@@ -64,17 +94,18 @@ class ColoredContext:
         bg_id = self.id_for_color(bg_color) if bg_color else None
         return self.format_string_for_ids(fg_id=fg_id, bg_id=bg_id)
 
-    @staticmethod
-    def printable_colors():
-        return xthematic.term.TERMINAL_COLORS.values()
+    def printable_colors(self):
+        return self._shown().values()
 
-    @staticmethod
-    def id_for_color(color):
-        for id_, value in xthematic.term.TERMINAL_COLORS.items():
+    def id_for_color(self, color):
+        for id_, value in self._shown().items():
             if value == color:
                 return id_
         raise ValueError(f"there is no registered {color}")
 
+    def _shown(self):
+        return {**dict(TERMINAL_COLORS), **self.borrowed}
+
 
 class ColoredStream:
     def __init__(self, context):
@@ -84,8 +115,10 @@ class ColoredStream:
     @contextlib.contextmanager
     def open(cls):
         cc = ColoredContext()
-        yield cls(context=cc)
-        cc.unregister_all()
+        try:
+            yield cls(context=cc)
+        finally:
+            cc.unregister_all()
 
     def echo_by_id(self, text, nl=True, fg_id=None, bg_id=None):
         s = self.context.format_string_for_ids(fg_id=fg_id, bg_id=bg_id)
@@ -96,6 +129,7 @@ class ColoredStream:
             self.context.register_color(fg)
         if bg and bg not in self.context.printable_colors():
             self.context.register_color(bg)
+        self.context.commit()
         s = self.context.format_string_for_colors(fg_color=fg, bg_color=bg)
         click.echo(s.format(text), nl=nl)
 
@@ -105,7 +139,128 @@ def escape_sequence_index_string(fg_id, bg_id):
     return f'{fg_bright};{30+(fg_id.id % 8)};{40+(bg_id.id % 8)}'
 
 
+@functools.lru_cache(maxsize=1024)
+def truecolor(hex_code, background=False):
+    """ SGR sequence for a 24 bit color - doesn't depend on the terminal's palette."""
+    r, g, b = bytes.fromhex(hex_code.lstrip('#'))
+    return f'\033[{48 if background else 38};2;{r};{g};{b}m'
+
+
+def truecolor_text(text, fg=None, bg=None):
+    """ Return text wrapped in truecolor SGR sequences for the fg and bg hex codes."""
+    prefix = (truecolor(fg) if fg else '') + (truecolor(bg, background=True) if bg else '')
+    return prefix + text + sty.rs.all if prefix else text
+
+
+VIEW_CHUNK_LINES = 256
+
+
+def color_view_lines(color_views, foreground=None, background=None, text=''):
+    """ Yield a truecolor line for every color view, filling in the defaults of missing parts."""
+    for cv in color_views:
+        fg = cv.foreground or foreground
+        bg = cv.background or background
+        yield truecolor_text(cv.text or text, fg=fg.hex if fg else None, bg=bg.hex if bg else None)
+
+
+def echo_lines(lines, chunk_lines=VIEW_CHUNK_LINES, ready=None, pager=False):
+    """ Print lines as they are produced, holding at most chunk_lines of them at once.
+
+    Lines are written chunk by chunk with one write each. If ready is given it is called
+    after every line and a chunk is written early when it returns False, so that lines
+    produced slowly show up right away. With pager the lines go through click's pager.
+    """
+    if pager:
+        click.echo_via_pager(line + '\n' for line in lines)
+        return
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_lines or (ready is not None and not ready()):
+            click.echo('\n'.join(chunk))
+            chunk.clear()
+    if chunk:
+        click.echo('\n'.join(chunk))
+
+
+GALLERY_SLOT_WIDTH = 3
+GALLERY_CELL_WIDTH = 8 * GALLERY_SLOT_WIDTH
+GALLERY_GAP = '  '
+
+
+def gallery_cell(name, palette):
+    """ Return the three lines of a theme's swatch - its name, normal and bright colors."""
+    label = name if len(name) <= GALLERY_CELL_WIDTH else name[:GALLERY_CELL_WIDTH - 1] + '~'
+    rows = [label.ljust(GALLERY_CELL_WIDTH)]
+    for start in (0, 8):
+        row = ''
+        for number in range(start, start + 8):
+            hex_code = palette.get(number)
+            block = ' ' * GALLERY_SLOT_WIDTH
+            row += truecolor_text(block, bg=hex_code) if hex_code else block
+        rows.append(row)
+    return rows
+
+
+def gallery_pages(themes, columns=None, rows=None):
+    """ Yield pages of rendered lines for an iterable of (name, palette) pairs.
+
+    Only the themes of the current page are consumed from the iterable.
+    """
+    width, height = shutil.get_terminal_size()
+    columns = columns or max(1, (width + len(GALLERY_GAP)) // (GALLERY_CELL_WIDTH + len(GALLERY_GAP)))
+    rows = rows or max(1, (height - 1) // 4)
+    themes = iter(themes)
+    while True:
+        page = list(itertools.islice(themes, columns * rows))
+        if not page:
+            return
+        lines = []
+        for k in range(0, len(page), columns):
+            cells = [gallery_cell(name, palette) for name, palette in page[k:k + columns]]
+            lines.extend(GALLERY_GAP.join(parts) for parts in zip(*cells))
+            lines.append('')
+        yield lines
+
+
+def echo_gallery(themes, interactive=None):
+    """ Print swatches of (name, palette) pairs page by page without changing the palette.
+
+    When interactive (by default if stdout is a terminal) waits for a key between pages
+    and stops on 'q'.
+    """
+    interactive = click.get_text_stream('stdout').isatty() if interactive is None else interactive
+    pages = gallery_pages(themes)
+    page = next(pages, None)
+    while page is not None:
+        click.echo('\n'.join(page), nl=False)
+        page = next(pages, None)
+        if page is not None and interactive:
+            click.echo('-- any key for more, q to quit --', nl=False)
+            key = click.getchar()
+            click.echo('\r\033[K', nl=False)
+            if key in ('q', 'Q', '\x1b', '\x03'):
+                return
+
+
+def echo_palette(palette):
+    """ Print the fg x bg grid of echo_theme for a palette using truecolor sequences."""
+    ids = list(xthematic.colors.ColorIdentifier.all_four_bit_colors())
+    for row_id in ids:
+        for col_id in ids[:8]:
+            text = escape_sequence_index_string(fg_id=row_id, bg_id=col_id)
+            click.echo(truecolor_text(text, fg=palette.get(row_id.id), bg=palette.get(col_id.id)), nl=False)
+            click.echo(' ', nl=False)
+        click.echo(nl=True)
+
+
 def echo_theme(theme_name=None):
+    if theme_name:
+        index = xthematic.themes.theme_index()
+        if theme_name not in index or index.palette(theme_name) is None:
+            raise FileNotFoundError(f"there is no valid theme {theme_name!r}")
+        echo_palette(index.palette(theme_name))
+        return
     with ColoredStream.open() as stream:
         for row_id in xthematic.colors.ColorIdentifier.all_four_bit_colors():
             for col_id in list(xthematic.colors.ColorIdentifier.all_four_bit_colors())[:8]:
@@ -0,0 +1,337 @@
+""" Interactive palette editor, see `xthematic edit`.
+
+The editor works on its own copy of the palette - a xthematic.palette style dict of slot
+number -> '#rrggbb'. Key presses only change that copy. A FrameWriter collects the changed
+slots and sends them to the terminal with at most one write per frame, and only the rows
+of changed slots are redrawn, so holding a key down costs one escape sequence per frame
+instead of a tput process and a rewrite of the custom colors per step. Nothing is saved
+until the user asks for it and quitting without saving restores the terminal's colors.
+"""
+import curses
+import time
+
+import xthematic.pipeline
+
+SLOTS = 16
+CHANNELS = 'RGB'
+FRAME_SECONDS = 1 / 30
+BIG_STEP = 16
+
+HEADER_ROWS = 2
+SWATCH_X = 3
+SLIDERS_X = 17
+SLIDER_WIDTH = 12
+SLIDER_SPAN = SLIDER_WIDTH + 7  # 'R ' + bar + ' 255 '
+
+HELP = 'up/down slot  left/right value  PgUp/PgDn x16  tab/r/g/b channel  u revert  s save  q quit'
+
+SAVE = 'save'
+QUIT = 'quit'
+
+
+class FrameWriter:
+    """ Coalesces palette changes into at most one write every interval seconds."""
+
+    def __init__(self, write, interval=FRAME_SECONDS, clock=time.monotonic):
+        """ :param write: called with a slot -> hex code dict of the changes to send"""
+        self.write = write
+        self.interval = interval
+        self.clock = clock
+        self.pending = {}
+        self.last_write = None
+        self.writes = 0
+
+    def add(self, colors):
+        self.pending.update(colors)
+
+    def due_in(self):
+        """ Return the seconds until the pending changes can be written, or None if there are none."""
+        if not self.pending:
+            return None
+        if self.last_write is None:
+            return 0.0
+        return max(0.0, self.last_write + self.interval - self.clock())
+
+    def flush(self, force=False):
+        """ Write the pending changes if a frame has passed since the last write and return whether it did."""
+        if not self.pending or (not force and self.due_in() > 0):
+            return False
+        pending, self.pending = self.pending, {}
+        self.write(pending)
+        self.last_write = self.clock()
+        self.writes += 1
+        return True
+
+
+def _hex(rgb):
+    return '#{:02x}{:02x}{:02x}'.format(*rgb)
+
+
+class PaletteEditor:
+    """ State of the editor and what the keys do to it - drawing is left to EditorScreen."""
+
+    def __init__(self, palette):
+        self.saved = dict(palette)
+        self.palette = dict(palette)
+        self.slot = 0
+        self.channel = 0
+        self.changed = set()  # slots changed since take_changes()
+        self.message = ''
+
+    def rgb(self, slot):
+        return list(bytes.fromhex(self.palette[slot][1:]))
+
+    def set_color(self, slot, hex_code):
+        if self.palette.get(slot) != hex_code:
+            self.palette[slot] = hex_code
+            self.changed.add(slot)
+
+    def set_channel(self, value, slot=None, channel=None):
+        slot = self.slot if slot is None else slot
+        channel = self.channel if channel is None else channel
+        rgb = self.rgb(slot)
+        rgb[channel] = min(255, max(0, value))
+        self.set_color(slot, _hex(rgb))
+
+    def adjust(self, delta):
+        self.set_channel(self.rgb(self.slot)[self.channel] + delta)
+
+    def select(self, slot, channel=None):
+        self.slot = slot % SLOTS
+        if channel is not None:
+            self.channel = channel % len(CHANNELS)
+
+    def modified(self):
+        """ Return the slots whose color differs from the last saved one."""
+        return sorted(slot for slot, hex_code in self.palette.items() if self.saved.get(slot) != hex_code)
+
+    def take_changes(self):
+        """ Return a slot -> hex code dict of the changes since the last call."""
+        changed, self.changed = self.changed, set()
+        return {slot: self.palette[slot] for slot in sorted(changed)}
+
+    def mark_saved(self):
+        self.saved = dict(self.palette)
+
+    def handle_key(self, key):
+        """ Apply a key press and return SAVE, QUIT or None."""
+        if key in (curses.KEY_UP, ord('k')):
+            self.select(self.slot - 1)
+        elif key in (curses.KEY_DOWN, ord('j')):
+            self.select(self.slot + 1)
+        elif key in (curses.KEY_LEFT, ord('h')):
+            self.adjust(-1)
+        elif key in (curses.KEY_RIGHT, ord('l')):
+            self.adjust(1)
+        elif key in (curses.KEY_PPAGE, ord('L')):
+            self.adjust(BIG_STEP)
+        elif key in (curses.KEY_NPAGE, ord('H')):
+            self.adjust(-BIG_STEP)
+        elif key == ord('\t'):
+            self.select(self.slot, self.channel + 1)
+        elif key == curses.KEY_BTAB:
+            self.select(self.slot, self.channel - 1)
+        elif key in (ord('r'), ord('g'), ord('b')):
+            self.select(self.slot, 'rgb'.index(chr(key)))
+        elif key == ord('u') and self.slot in self.saved:
+            self.set_color(self.slot, self.saved[self.slot])
+        elif key == ord('s'):
+            return SAVE
+        elif key == ord('q'):
+            return QUIT
+        return None
+
+    def click(self, x, y):
+        """ Select the slot of row y and set the channel of the slider under x to its value there."""
+        slot = y - HEADER_ROWS
+        if not 0 <= slot < SLOTS:
+            return
+        self.select(slot)
+        for channel in range(len(CHANNELS)):
+            start = SLIDERS_X + channel * SLIDER_SPAN + 2
+            if start <= x < start + SLIDER_WIDTH:
+                self.select(slot, channel)
+                self.set_channel(round((x - start) * 255 / (SLIDER_WIDTH - 1)))
+
+
+class EditorScreen:
+    """ Draws a PaletteEditor, redrawing only the rows that changed."""
+
+    def __init__(self, window, editor):
+        self.window = window
+        self.editor = editor
+        self.swatches = curses.has_colors() and curses.COLORS >= SLOTS
+        if self.swatches:
+            curses.use_default_colors()
+            for slot in range(SLOTS):
+                curses.init_pair(slot + 1, -1, slot)
+        self.drawn_selection = None
+        self.drawn_message = None
+
+    def _put(self, y, x, text, attr=curses.A_NORMAL):
+        try:
+            self.window.addstr(y, x, text, attr)
+        except curses.error:
+            pass  # the text didn't fit into the window
+
+    def _clear_line(self, y):
+        try:
+            self.window.move(y, 0)
+            self.window.clrtoeol()
+        except curses.error:
+            pass
+
+    def draw_row(self, slot):
+        y = HEADER_ROWS + slot
+        selected = slot == self.editor.slot
+        self._clear_line(y)
+        self._put(y, 0, f'{slot:>2}', curses.A_BOLD if selected else curses.A_NORMAL)
+        # the swatch is painted by the terminal with the slot's palette color, so it shows
+        # every write to the palette without being redrawn
+        self._put(y, SWATCH_X, '    ', curses.color_pair(slot + 1) if self.swatches else curses.A_REVERSE)
+        self._put(y, SWATCH_X + 5, self.editor.palette[slot])
+        for channel, value in enumerate(self.editor.rgb(slot)):
+            x = SLIDERS_X + channel * SLIDER_SPAN
+            filled = round(value * SLIDER_WIDTH / 255)
+            attr = curses.A_REVERSE if selected and channel == self.editor.channel else curses.A_NORMAL
+            self._put(y, x, CHANNELS[channel], attr)
+            self._put(y, x + 2, '=' * filled + '-' * (SLIDER_WIDTH - filled))
+            self._put(y, x + 2 + SLIDER_WIDTH, f' {value:>3}')
+
+    def draw_all(self):
+        self.window.erase()
+        self._put(0, 0, HELP, curses.A_DIM)
+        for slot in range(SLOTS):
+            self.draw_row(slot)
+        self.drawn_selection = (self.editor.slot, self.editor.channel)
+        self.draw_status()
+
+    def draw_status(self):
+        modified = len(self.editor.modified())
+        status = f'{modified} unsaved change(s)' if modified else 'no unsaved changes'
+        if self.editor.message:
+            status = f'{status} - {self.editor.message}'
+        self._clear_line(HEADER_ROWS + SLOTS + 1)
+        self._put(HEADER_ROWS + SLOTS + 1, 0, status)
+        self.drawn_message = self.editor.message
+
+    def update(self, changed):
+        """ Redraw the rows of the changed slots and of the old and new selection."""
+        rows = set(changed)
+        selection = (self.editor.slot, self.editor.channel)
+        if selection != self.drawn_selection:
+            rows.update({self.drawn_selection[0], selection[0]})
+            self.drawn_selection = selection
+        for slot in sorted(rows):
+            self.draw_row(slot)
+        if rows or self.editor.message != self.drawn_message:
+            self.draw_status()
+        self.window.noutrefresh()
+        curses.doupdate()
+
+
+def preview_backend(backend):
+    """ Return a backend that writes a batch to the terminal without starting processes."""
+    import xthematic.backends
+    if type(backend) is xthematic.backends.SubprocessBackend:
+        return xthematic.backends.TtyBackend(tty=backend.tty)
+    return backend
+
+
+def _read_keys(window, timeout):
+    """ Wait up to timeout seconds (None for ever) for a key and return it with every key already typed."""
+    window.timeout(-1 if timeout is None else max(1, int(timeout * 1000)))
+    keys = [window.getch()]
+    window.nodelay(True)
+    key = window.getch()
+    while key != -1:
+        keys.append(key)
+        key = window.getch()
+    window.nodelay(False)
+    return [k for k in keys if k != -1]
+
+
+def _loop(window, editor, writer, save):
+    try:
+        curses.curs_set(0)
+    except curses.error:
+        pass
+    window.keypad(True)
+    curses.mousemask(curses.BUTTON1_PRESSED | curses.BUTTON1_CLICKED)
+    screen = EditorScreen(window, editor)
+    writer.add(editor.take_changes())
+    writer.flush()
+    screen.draw_all()
+    window.noutrefresh()
+    curses.doupdate()
+    while True:
+        for key in _read_keys(window, writer.due_in()):
+            if key == curses.KEY_MOUSE:
+                try:
+                    _, x, y, _, _ = curses.getmouse()
+                except curses.error:
+                    continue
+                editor.click(x, y)
+                continue
+            if key == curses.KEY_RESIZE:
+                screen.draw_all()
+                continue
+            editor.message = ''
+            action = editor.handle_key(key)
+            if action == QUIT:
+                return
+            if action == SAVE:
+                writer.add(editor.take_changes())
+                writer.flush(force=True)
+                try:
+                    save(dict(editor.palette))
+                except xthematic.pipeline.PipelineError as e:
+                    editor.message = 'not saved: ' + '; '.join(e.describe())
+                    # the failed apply restored the terminal's colors, show the edited ones again
+                    writer.add(dict(editor.palette))
+                    writer.flush(force=True)
+                except (OSError, ValueError) as e:
+                    editor.message = f'not saved: {e}'
+                else:
+                    editor.mark_saved()
+                    editor.message = 'saved'
+        changes = editor.take_changes()
+        writer.add(changes)
+        writer.flush()
+        screen.update(changes)
+
+
+def run(palette, save, restore, backend):
+    """ Edit palette in a curses screen until the user quits.
+
+    :param palette: slot -> '#rrggbb' dict of the colors to start with
+    :param save: called with the edited palette when the user saves, may raise OSError or ValueError
+    :param restore: slot -> '#rrggbb' dict of the terminal's colors to restore on quit
+    :param backend: xthematic.backends.PaletteBackend that previews the changes in the terminal
+    :return: whether anything was saved
+    """
+    import xthematic.palette
+    backend = preview_backend(backend)
+    shown = dict(restore)  # what the terminal displays
+
+    def write(colors):
+        backend.apply_batch(xthematic.palette.to_colormap(colors))
+        shown.update(colors)
+
+    writer = FrameWriter(write)
+    editor = PaletteEditor(palette)
+    editor.changed.update(slot for slot in palette if restore.get(slot) != palette[slot])
+    saved = []
+
+    def save_and_remember(edited):
+        save(edited)
+        saved.append(edited)
+
+    try:
+        curses.wrapper(_loop, editor, writer, save_and_remember)
+    finally:
+        baseline = saved[-1] if saved else restore
+        unsaved = {slot: hex_code for slot, hex_code in baseline.items() if shown.get(slot) != hex_code}
+        if unsaved:
+            write(unsaved)
+    return bool(saved)
@@ -0,0 +1,156 @@
+""" Compiling palettes to the theme formats of other terminals.
+
+Every format is a function of a theme name and a complete palette that returns the text of
+the theme file. Themes only store the 16 colors, so the foreground and background that
+most formats want are taken from color7 and color0, and slots a theme doesn't set are the
+xterm defaults.
+
+Compiled texts are cached in an ExportCache under a key of the palette hash, the format
+and - for formats that embed it - the theme name, so exporting unchanged themes again is
+a lookup.
+
+Like xthematic.palette this module doesn't read any configuration.
+"""
+import collections
+import hashlib
+import json
+import os
+
+import xthematic.backends
+import xthematic.palette
+
+EXPORTER_VERSION = 2
+
+NAMES = ('black', 'red', 'green', 'yellow', 'blue', 'magenta', 'cyan', 'white')
+
+Format = collections.namedtuple('Format', ['name', 'extension', 'compile', 'uses_name'])
+
+
+class ExportError(ValueError):
+    pass
+
+
+def complete(palette):
+    """ Return palette with the slots it doesn't set filled with xterm's default colors."""
+    full = {number: hex_code.lower() for number, hex_code in enumerate(xthematic.backends.DEFAULT_PALETTE)}
+    full.update((number, xthematic.palette.normalize_hex(hex_code)) for number, hex_code in palette.items())
+    return full
+
+
+HEADER = '# exported by xthematic\n'
+
+
+def kitty(name, palette):
+    lines = [f'foreground {palette[7]}', f'background {palette[0]}']
+    lines.extend(f'color{number} {palette[number]}' for number in range(16))
+    return HEADER + ''.join(line + '\n' for line in lines)
+
+
+def alacritty(name, palette):
+    sections = [('primary', [('background', palette[0]), ('foreground', palette[7])]),
+                ('normal', [(NAMES[k], palette[k]) for k in range(8)]),
+                ('bright', [(NAMES[k], palette[k + 8]) for k in range(8)])]
+    return HEADER + '\n'.join(
+        f'[colors.{section}]\n' + ''.join(f'{key} = "{value}"\n' for key, value in values)
+        for section, values in sections)
+
+
+def foot(name, palette):
+    lines = ['[colors]', f'foreground={palette[7][1:]}', f'background={palette[0][1:]}']
+    lines.extend(f'regular{k}={palette[k][1:]}' for k in range(8))
+    lines.extend(f'bright{k}={palette[k + 8][1:]}' for k in range(8))
+    return HEADER + ''.join(line + '\n' for line in lines)
+
+
+def windows_terminal(name, palette):
+    names = ['black', 'red', 'green', 'yellow', 'blue', 'purple', 'cyan', 'white']
+    scheme = {'name': name, 'background': palette[0], 'foreground': palette[7], 'cursorColor': palette[7]}
+    scheme.update((names[k], palette[k]) for k in range(8))
+    scheme.update(('bright' + names[k].capitalize(), palette[k + 8]) for k in range(8))
+    return json.dumps(scheme, indent=4) + '\n'
+
+
+def _mix(first, second, weight):
+    a, b = bytes.fromhex(first[1:]), bytes.fromhex(second[1:])
+    return '#' + bytes(round(x + (y - x) * weight) for x, y in zip(a, b)).hex()
+
+
+# base16 slot -> terminal color as base16-shell maps them, the grays in between are blended
+BASE16_SLOTS = {'base00': 0, 'base03': 8, 'base05': 7, 'base07': 15, 'base08': 1, 'base09': 9,
+                'base0A': 3, 'base0B': 2, 'base0C': 6, 'base0D': 4, 'base0E': 5, 'base0F': 13}
+
+
+def base16(name, palette):
+    scheme = {key: palette[number] for key, number in BASE16_SLOTS.items()}
+    scheme['base01'] = _mix(palette[0], palette[8], 1 / 3)
+    scheme['base02'] = _mix(palette[0], palette[8], 2 / 3)
+    scheme['base04'] = _mix(palette[8], palette[7], 1 / 2)
+    scheme['base06'] = _mix(palette[7], palette[15], 1 / 2)
+    lines = [f'scheme: {json.dumps(name)}', 'author: "xthematic"']
+    lines.extend(f'{key}: "{scheme[key][1:]}"' for key in sorted(scheme))
+    return ''.join(line + '\n' for line in lines)
+
+
+FORMATS = {f.name: f for f in (
+    Format('kitty', 'conf', kitty, False),
+    Format('alacritty', 'toml', alacritty, False),
+    Format('foot', 'ini', foot, False),
+    Format('windows-terminal', 'json', windows_terminal, True),
+    Format('base16', 'yaml', base16, True),
+)}
+
+
+def parse_formats(value):
+    """ Return the list of format names in a comma separated value like 'kitty,foot'."""
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in FORMATS]
+    if unknown or not names:
+        raise ExportError(f"unknown export format {', '.join(unknown) or value!r}, "
+                          f"choose from {', '.join(FORMATS)}")
+    return list(dict.fromkeys(names))
+
+
+def cache_key(name, palette_hash, format_name):
+    """ Return the key of the compiled text of the palette with palette_hash in format_name."""
+    parts = [str(EXPORTER_VERSION), format_name, palette_hash]
+    # the formats that don't embed the theme name share their cached texts between themes
+    if FORMATS[format_name].uses_name:
+        parts.append(name)
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def compile_palette(name, palette, formats):
+    """ Return a dict of format name -> text of palette in every format."""
+    full = complete(palette)
+    return {format_name: FORMATS[format_name].compile(name, full) for format_name in formats}
+
+
+def compile_job(job):
+    """ compile_palette for worker processes - job is a (name, palette, formats) tuple."""
+    name, palette, formats = job
+    return name, compile_palette(name, palette, formats)
+
+
+class ExportCache:
+    """ Compiled texts stored as one file per cache key in directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(str(self.directory), key)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), mode='r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key, text):
+        os.makedirs(str(self.directory), exist_ok=True)
+        path = self._path(key)
+        tmp = f'{path}.tmp'
+        with open(tmp, mode='w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
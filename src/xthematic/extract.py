@@ -0,0 +1,203 @@
+""" Generate palettes from images.
+
+The image is decoded at a reduced size (JPEG files are decoded directly at a fraction of
+their resolution), its pixels are converted to CIELAB and clustered with a vectorized
+k-means. The clusters are then assigned to the 16 terminal slots: the darkest and lightest
+ones become background and foreground and for each of the six ANSI hues the closest
+cluster is picked and adjusted until it is readable against the background.
+
+Requires numpy and Pillow (`pip install xthematic[image]`). Like xthematic.palette this
+module doesn't read any configuration so it can be used from worker processes.
+"""
+import math
+
+import xthematic.colorspace
+import xthematic.contrast
+
+SAMPLE_SIDE = 160  # longest side of the image after downsampling, in pixels
+CLUSTERS = 16
+ITERATIONS = 16
+MIN_CONTRAST = 4.5  # WCAG AA for normal text
+
+# hue angles of the ANSI colors in CIELAB (those of the sRGB primaries and secondaries)
+ANSI_HUES = {1: 40, 2: 136, 3: 100, 4: 300, 5: 330, 6: 197}
+MAX_HUE_SHIFT = 30
+MIN_CHROMA = 35
+
+_SRGB_TO_XYZ = ((0.4124, 0.3576, 0.1805),
+                (0.2126, 0.7152, 0.0722),
+                (0.0193, 0.1192, 0.9505))
+_EPSILON = 216 / 24389
+_KAPPA = 24389 / 27
+
+
+def _numpy():
+    numpy = xthematic.colorspace.optional_numpy()
+    if numpy is None:
+        raise ImportError('generating themes from images requires numpy - pip install xthematic[image]')
+    return numpy
+
+
+def _pillow():
+    try:
+        import PIL.Image
+    except ImportError as e:
+        raise ImportError('generating themes from images requires Pillow - pip install xthematic[image]') from e
+    return PIL.Image
+
+
+def load_pixels(path, side=SAMPLE_SIDE):
+    """ Return the pixels of the image at path, downsampled to at most side pixels, as an (N, 3) uint8 array."""
+    numpy = _numpy()
+    Image = _pillow()
+    with Image.open(path) as image:
+        image.draft('RGB', (side, side))  # no-op for formats other than JPEG
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGB')
+        image.thumbnail((side, side), resample=Image.BILINEAR, reducing_gap=2.0)
+        return numpy.asarray(image.convert('RGB'), dtype=numpy.uint8).reshape(-1, 3)
+
+
+def rgb_to_lab(rgb):
+    """ Vectorized xthematic.similarity.rgb_to_lab of an (N, 3) uint8 array."""
+    numpy = _numpy()
+    linear = numpy.asarray(xthematic.colorspace.SRGB_LINEAR, dtype=numpy.float32)[rgb]
+    xyz = linear @ numpy.asarray(_SRGB_TO_XYZ, dtype=numpy.float32).T
+    xyz /= numpy.asarray(xthematic.colorspace.D65_WHITE, dtype=numpy.float32)
+    f = numpy.where(xyz > _EPSILON, numpy.cbrt(xyz), (_KAPPA * xyz + 16) / 116)
+    return numpy.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=1)
+
+
+def lab_to_rgb(lab):
+    """ Convert an (N, 3) array of CIELAB colors to sRGB, clipping the ones outside of the gamut."""
+    numpy = _numpy()
+    lab = numpy.asarray(lab, dtype=numpy.float64).reshape(-1, 3)
+    fy = (lab[:, 0] + 16) / 116
+    f = numpy.stack([fy + lab[:, 1] / 500, fy, fy - lab[:, 2] / 200], axis=1)
+    xyz = numpy.where(f ** 3 > _EPSILON, f ** 3, (116 * f - 16) / _KAPPA)
+    xyz[:, 1] = numpy.where(lab[:, 0] > _KAPPA * _EPSILON, fy ** 3, lab[:, 0] / _KAPPA)
+    xyz *= xthematic.colorspace.D65_WHITE
+    linear = numpy.clip(xyz @ numpy.linalg.inv(_SRGB_TO_XYZ).T, 0, 1)
+    srgb = numpy.where(linear <= 0.0031308, 12.92 * linear, 1.055 * linear ** (1 / 2.4) - 0.055)
+    return numpy.rint(srgb * 255).astype(numpy.uint8)
+
+
+def kmeans(points, k=CLUSTERS, iterations=ITERATIONS, seed=0):
+    """ Cluster an (N, 3) float array into k clusters.
+
+    Centers are seeded with k-means++ from a fixed seed so the same image always gives the
+    same palette. Returns the (k, 3) centers and the number of points in each cluster.
+    """
+    numpy = _numpy()
+    points = numpy.asarray(points, dtype=numpy.float32)
+    k = min(k, len(points))
+    rng = numpy.random.default_rng(seed)
+
+    centers = numpy.empty((k, 3), dtype=numpy.float32)
+    centers[0] = points[rng.integers(len(points))]
+    closest = ((points - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        choice = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centers[i] = points[choice]
+        closest = numpy.minimum(closest, ((points - centers[i]) ** 2).sum(axis=1))
+
+    squared_norms = (points ** 2).sum(axis=1)[:, None]
+    for _ in range(iterations):
+        distances = squared_norms - 2 * points @ centers.T + (centers ** 2).sum(axis=1)
+        labels = distances.argmin(axis=1)
+        counts = numpy.bincount(labels, minlength=k)
+        sums = numpy.stack([numpy.bincount(labels, weights=points[:, c], minlength=k) for c in range(3)], axis=1)
+        updated = numpy.where(counts[:, None] > 0, sums / numpy.maximum(counts, 1)[:, None], centers)
+        updated = updated.astype(numpy.float32)
+        converged = numpy.abs(updated - centers).max() < 0.1
+        centers = updated
+        if converged:
+            break
+    return centers, counts
+
+
+def _hex(lab):
+    r, g, b = lab_to_rgb([lab])[0]
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def _hue_difference(a, b):
+    return (a - b + 180) % 360 - 180
+
+
+def _lch(lab):
+    l, a, b = (float(v) for v in lab)
+    return l, math.hypot(a, b), math.degrees(math.atan2(b, a)) % 360
+
+
+def _lab(l, c, h):
+    return l, c * math.cos(math.radians(h)), c * math.sin(math.radians(h))
+
+
+def _readable(l, c, h, background, step):
+    """ Move the lightness of an LCh color away from the background until it's readable."""
+    hex_code = _hex(_lab(l, c, h))
+    while xthematic.contrast.wcag_contrast(hex_code, background) < MIN_CONTRAST and 0 < l + step < 100:
+        l += step
+        hex_code = _hex(_lab(l, c, h))
+    return l, hex_code
+
+
+def palette_from_clusters(centers, counts):
+    """ Assign k-means clusters in CIELAB to the 16 terminal colors.
+
+    Images that are mostly light give light themes. Every color except the bright black
+    reaches a contrast ratio of MIN_CONTRAST with the background when that is possible
+    without leaving its hue.
+    """
+    clusters = [_lch(center) for center, count in zip(centers, counts) if count]
+    weights = [int(count) for count in counts if count]
+    mean_lightness = sum(l * w for (l, _, _), w in zip(clusters, weights)) / sum(weights)
+    light = mean_lightness > 70
+    step = -3 if light else 3  # direction from background towards foreground
+
+    by_lightness = sorted(clusters)
+    bg_l, bg_c, bg_h = by_lightness[-1] if light else by_lightness[0]
+    fg_l, fg_c, fg_h = by_lightness[0] if light else by_lightness[-1]
+    bg_l = max(bg_l, 92) if light else min(bg_l, 12)
+    background = _hex(_lab(bg_l, min(bg_c, 12), bg_h))
+    fg_l = min(fg_l, 25) if light else max(fg_l, 80)
+    fg_l, foreground = _readable(fg_l, min(fg_c, 15), fg_h, background, step)
+
+    palette = {0: background, 7: foreground}
+    palette[8] = _hex(_lab(bg_l + 8 * step, min(bg_c, 12), bg_h))
+    palette[15] = _hex(_lab(min(max(fg_l + 3 * step, 0), 100), min(fg_c, 10), fg_h))
+
+    for slot, target in ANSI_HUES.items():
+        # the cluster closest in hue wins, with saturated clusters preferred over gray ones
+        l, c, h = min(clusters, key=lambda lch: abs(_hue_difference(lch[2], target)) - 0.5 * lch[1])
+        # meet the cluster half way so that neighbouring hues picking the same cluster stay apart
+        shift = _hue_difference(h, target) / 2
+        h = target + max(-MAX_HUE_SHIFT, min(MAX_HUE_SHIFT, shift))
+        c = max(c, MIN_CHROMA)
+        l = min(max(l, 30), 60) if light else min(max(l, 45), 75)
+        l, palette[slot] = _readable(l, c, h, background, step)
+        _, palette[slot + 8] = _readable(min(max(l + 3 * step, 0), 100), c + 10, h, background, step)
+    return dict(sorted(palette.items()))
+
+
+def palette_from_image(path):
+    """ Return the palette generated from the image at path."""
+    pixels = load_pixels(path)
+    if not len(pixels):
+        raise ValueError(f'{path} has no pixels')
+    centers, counts = kmeans(rgb_to_lab(pixels))
+    return palette_from_clusters(centers, counts)
+
+
+def extract_palette(path):
+    """ Generate a palette for use in worker processes.
+
+    Returns a (path, palette, error message) tuple where exactly one of palette and
+    error message is None.
+    """
+    try:
+        return path, palette_from_image(path), None
+    except (OSError, ValueError) as e:
+        return path, None, str(e)
@@ -0,0 +1,114 @@
+""" Entry point of the xthematic executable.
+
+The most frequent invocations - `color N HEX`, `theme NAME -a [-p]`, `theme -l` and
+`bundle FILE` - are recognized by a small hand written parser and run without importing
+click, sty or xrp.
+Everything else, including --help and malformed arguments, is handed to xthematic.cli.
+"""
+import sys
+
+import xthematic.colors
+
+ACTIVATE_FLAGS = {'-a': 'activate', '--activate': 'activate', '-p': 'permanent', '--permanent': 'permanent'}
+
+
+def parse(args):
+    """ Return a (command, kwargs) pair if args can be run by the fast path, otherwise None."""
+    if not args:
+        return None
+    command, rest = args[0], args[1:]
+    if command == 'color' and len(rest) == 2:
+        return _parse_color(*rest)
+    if command == 'theme':
+        if rest in (['-l'], ['--list']):
+            return 'list_themes', {}
+        return _parse_activate(rest)
+    if command == 'bundle' and len(rest) == 1 and not rest[0].startswith('-'):
+        return 'list_bundle', {'path': rest[0]}
+    return None
+
+
+def _parse_color(color_id, hex_code):
+    if not color_id.isdigit() or not xthematic.colors.ColorIdentifier.is_valid(int(color_id)):
+        return None
+    if not hex_code.startswith('#'):
+        hex_code = '#' + hex_code
+    if not xthematic.colors.Color.is_valid_hex_code(hex_code):
+        return None
+    return 'set_color', {'color_id': int(color_id), 'hex_code': hex_code}
+
+
+def _parse_activate(args):
+    names = [a for a in args if not a.startswith('-')]
+    flags = set()
+    for a in args:
+        if not a.startswith('-'):
+            continue
+        if a in ACTIVATE_FLAGS:
+            flags.add(ACTIVATE_FLAGS[a])
+        elif len(a) > 2 and not a.startswith('--') and all('-' + c in ACTIVATE_FLAGS for c in a[1:]):
+            flags.update(ACTIVATE_FLAGS['-' + c] for c in a[1:])  # combined short flags like -ap
+        else:
+            return None
+    if len(names) != 1 or 'activate' not in flags:
+        return None
+    return 'activate_theme', {'name': names[0], 'permanent': 'permanent' in flags}
+
+
+def set_color(color_id, hex_code):
+    import xthematic.pipeline
+    import xthematic.term
+    color_id = xthematic.colors.ColorIdentifier(color_id)
+    try:
+        xthematic.term.set_color(color_id, xthematic.colors.Color(hex_code))
+    except xthematic.pipeline.PipelineError as e:
+        return _report_failed_steps(e, f'could not set color {color_id.id}')
+    return 0
+
+
+def activate_theme(name, permanent):
+    import xthematic.config
+    import xthematic.pipeline
+    import xthematic.themes
+    try:
+        if xthematic.config.USER_THEME_LINK_FILE:
+            xthematic.themes.activate_theme(name, permanent=permanent,
+                                            link_file=xthematic.config.USER_THEME_LINK_FILE)
+        else:
+            xthematic.themes.activate_theme(name, permanent=permanent)
+    except xthematic.pipeline.PipelineError as e:
+        return _report_failed_steps(e, f'could not activate {name}')
+    return 0
+
+
+def _report_failed_steps(error, message):
+    """ Report a PipelineError like the commands of xthematic.cli do, without importing click."""
+    for line in error.describe():
+        sys.stderr.write(f'error: {line}\n')
+    sys.stderr.write(f'Error: {message}, the previous colors were restored\n')
+    return 1
+
+
+def list_themes():
+    import xthematic.themes
+    sys.stdout.write(' '.join(xthematic.themes.all_themes()) + '\n')
+
+
+def list_bundle(path):
+    import xthematic.bundle
+    with xthematic.bundle.Bundle(path) as bundle:
+        sys.stdout.write(' '.join(bundle) + '\n')
+
+
+COMMANDS = {'set_color': set_color, 'activate_theme': activate_theme, 'list_themes': list_themes,
+            'list_bundle': list_bundle}
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    parsed = parse(args)
+    if parsed is None:
+        import xthematic.cli
+        return xthematic.cli.main(args=args)
+    command, kwargs = parsed
+    return COMMANDS[command](**kwargs)
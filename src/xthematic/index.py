@@ -0,0 +1,142 @@
+""" Index of saved themes keyed by the content hash of their palettes.
+
+The index is a JSON cache next to the configuration that stores, for every file in the
+theme directory, its size, modification time, parsed palette and the palette's hash.
+Refreshing it only re-parses files whose stat changed, and looking up which themes have
+a given palette is a single dict access.
+"""
+import json
+import os
+
+import xthematic.palette
+
+INDEX_VERSION = 1
+
+
+class ThemeIndex:
+    """ Mapping of theme names to palettes with a reverse mapping of palette hashes to names."""
+
+    def __init__(self, file, theme_dir):
+        self.file = file
+        self.theme_dir = theme_dir
+        self.entries = {}  # name -> {'hash', 'mtime_ns', 'size', 'palette'}
+        self.by_hash = {}  # palette hash -> sorted list of names
+        self.dirty = False
+
+    @classmethod
+    def load(cls, file, theme_dir):
+        """ Load the index stored in file, or an empty one if it is missing or outdated."""
+        index = cls(file=file, theme_dir=theme_dir)
+        try:
+            with open(file, mode='r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return index
+        if data.get('version') != INDEX_VERSION or data.get('theme_dir') != str(theme_dir):
+            return index
+        for name, entry in data['themes'].items():
+            if entry['palette'] is not None:
+                entry['palette'] = {int(k): v for k, v in entry['palette'].items()}
+            index._set_entry(name, entry)
+        return index
+
+    def refresh(self):
+        """ Bring the index up to date with the theme directory.
+
+        Every file is stat'ed - the directory's modification time doesn't change when a theme
+        is edited in place - but only the files whose size or modification time changed are
+        parsed again.
+        """
+        seen = set()
+        with os.scandir(self.theme_dir) as it:
+            for dir_entry in it:
+                if not dir_entry.is_file():
+                    continue
+                seen.add(dir_entry.name)
+                stat = dir_entry.stat()
+                old = self.entries.get(dir_entry.name)
+                if old and old['mtime_ns'] == stat.st_mtime_ns and old['size'] == stat.st_size:
+                    continue
+                _, palette, _ = xthematic.palette.parse_theme_file(dir_entry.path)
+                self._set_entry(dir_entry.name, self._entry(palette, stat))
+                self.dirty = True
+        for name in set(self.entries) - seen:
+            self._del_entry(name)
+            self.dirty = True
+        return self
+
+    def save(self):
+        """ Write the index to its file if it changed since it was loaded."""
+        if not self.dirty:
+            return
+        data = {
+            'version': INDEX_VERSION,
+            'theme_dir': str(self.theme_dir),
+            'themes': self.entries,
+        }
+        tmp = f'{self.file}.tmp'
+        with open(tmp, mode='w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.file)
+        self.dirty = False
+
+    def add(self, name, palette):
+        """ Record that the theme file name was just written with palette."""
+        stat = os.stat(os.path.join(self.theme_dir, name))
+        self._set_entry(name, self._entry(palette, stat))
+        self.dirty = True
+
+    def remove(self, name):
+        """ Record that the theme file name was just removed."""
+        self._del_entry(name)
+        self.dirty = True
+
+    def names_for(self, palette):
+        """ Return the sorted names of themes whose palette is exactly palette."""
+        return list(self.by_hash.get(xthematic.palette.palette_hash(palette), ()))
+
+    def names_for_hash(self, palette_hash):
+        return list(self.by_hash.get(palette_hash, ()))
+
+    def palette(self, name):
+        return self.entries[name]['palette']
+
+    def palettes(self):
+        """ Yield (name, palette) pairs of all themes that could be parsed."""
+        for name, entry in self.entries.items():
+            if entry['palette'] is not None:
+                yield name, entry['palette']
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __iter__(self):
+        yield from sorted(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _entry(palette, stat):
+        return {
+            'hash': xthematic.palette.palette_hash(palette) if palette else None,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'palette': palette,
+        }
+
+    def _set_entry(self, name, entry):
+        self._del_entry(name)
+        self.entries[name] = entry
+        if entry['hash']:
+            names = self.by_hash.setdefault(entry['hash'], [])
+            names.append(name)
+            names.sort()
+
+    def _del_entry(self, name):
+        entry = self.entries.pop(name, None)
+        if entry and entry['hash']:
+            names = self.by_hash[entry['hash']]
+            names.remove(name)
+            if not names:
+                del self.by_hash[entry['hash']]
@@ -0,0 +1,140 @@
+""" Append-only journal of palette changes for undo and redo.
+
+The journal is a small binary file per terminal session. After a 12 byte header (magic and
+the byte offset of the cursor) come the records, each holding only the slots that changed:
+
+    kind (1 byte) | count (1 byte) | count * (slot, old rgb, new rgb) (7 bytes each) | count (1 byte)
+
+The trailing count lets undo find the start of the record before the cursor without
+scanning, so recording, undoing and redoing a change each cost a constant number of
+reads and writes. Recording a change after an undo discards the records that could have
+been redone.
+"""
+import collections
+import os
+import struct
+
+MAGIC = b'XTJ1'
+HEADER = struct.Struct('<4sQ')
+ENTRY = struct.Struct('<B3s3s')
+RECORD_HEAD = struct.Struct('<BB')
+
+COLOR_CHANGE = 0
+THEME_CHANGE = 1
+
+Change = collections.namedtuple('Change', ['slot', 'old', 'new'])
+Record = collections.namedtuple('Record', ['kind', 'changes'])
+
+
+def _rgb(hex_code):
+    return bytes.fromhex(hex_code.lstrip('#'))
+
+
+def _hex(rgb):
+    return '#' + rgb.hex()
+
+
+class Journal:
+    """ Palette change journal stored in file. Hex codes are '#rrggbb' strings."""
+
+    def __init__(self, file):
+        self.file = file
+
+    def _open(self):
+        try:
+            f = open(self.file, mode='r+b')
+        except FileNotFoundError:
+            f = open(self.file, mode='w+b')
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size or HEADER.unpack(header)[0] != MAGIC:
+            f.seek(0)
+            f.truncate()
+            f.write(HEADER.pack(MAGIC, HEADER.size))
+            return f, HEADER.size
+        return f, HEADER.unpack(header)[1]
+
+    @staticmethod
+    def _set_cursor(f, cursor):
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, cursor))
+
+    def record(self, changes, kind=COLOR_CHANGE):
+        """ Append a record of (slot, old hex, new hex) changes after the cursor."""
+        changes = [Change(*c) for c in changes if c[1].lower() != c[2].lower()]
+        if not changes:
+            return
+        if len(changes) > 255:
+            raise ValueError('a record can hold at most 255 changes')
+        body = b''.join(ENTRY.pack(c.slot, _rgb(c.old), _rgb(c.new)) for c in changes)
+        data = RECORD_HEAD.pack(kind, len(changes)) + body + bytes([len(changes)])
+        f, cursor = self._open()
+        with f:
+            f.seek(cursor)
+            f.truncate()
+            f.write(data)
+            self._set_cursor(f, cursor + len(data))
+
+    def _read_record(self, f, start):
+        f.seek(start)
+        kind, count = RECORD_HEAD.unpack(f.read(RECORD_HEAD.size))
+        body = f.read(count * ENTRY.size)
+        changes = [Change(slot, _hex(old), _hex(new)) for slot, old, new in ENTRY.iter_unpack(body)]
+        return Record(kind, changes), start + RECORD_HEAD.size + len(body) + 1
+
+    def undo(self):
+        """ Move the cursor one record back and return that record, or None at the start."""
+        f, cursor = self._open()
+        with f:
+            if cursor <= HEADER.size:
+                return None
+            f.seek(cursor - 1)
+            count = f.read(1)[0]
+            start = cursor - 1 - count * ENTRY.size - RECORD_HEAD.size
+            record, _ = self._read_record(f, start)
+            self._set_cursor(f, start)
+        return record
+
+    def undo_steps(self, kind):
+        """ Return how many undo() calls it takes to undo the last record of kind before the cursor.
+
+        Returns 0 if there is no such record.
+        """
+        f, cursor = self._open()
+        with f:
+            steps = 0
+            while cursor > HEADER.size:
+                f.seek(cursor - 1)
+                count = f.read(1)[0]
+                cursor -= 1 + count * ENTRY.size + RECORD_HEAD.size
+                f.seek(cursor)
+                steps += 1
+                if f.read(1)[0] == kind:
+                    return steps
+        return 0
+
+    def redo(self):
+        """ Move the cursor one record forward and return that record, or None at the end."""
+        f, cursor = self._open()
+        with f:
+            f.seek(0, os.SEEK_END)
+            if cursor >= f.tell():
+                return None
+            record, end = self._read_record(f, cursor)
+            self._set_cursor(f, end)
+        return record
+
+    def records(self):
+        """ Return (list of all records, number of records before the cursor)."""
+        f, cursor = self._open()
+        records, position, applied = [], HEADER.size, 0
+        with f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            while position < end:
+                if position == cursor:
+                    applied = len(records)
+                record, position = self._read_record(f, position)
+                records.append(record)
+        if cursor >= end:
+            applied = len(records)
+        return records, applied
@@ -0,0 +1,241 @@
+""" Color names like 'blue' or 'DarkSlateGray'.
+
+Names come from the CSS named colors, which are built in, the X11 rgb.txt of the system
+and optionally a user list in the rgb.txt format or with '#rrggbb' codes. Later sources
+override earlier ones, so 'green' is the X11 #00ff00 rather than the CSS #008000.
+Lookups ignore case, spaces, underscores and hyphens.
+
+Like xthematic.palette this module doesn't read any configuration. Names are only parsed
+when a ColorNames is created, see database(). Given a cache file the parsed index is stored
+there together with the stat of its sources and loaded from it while they are unchanged.
+"""
+import bisect
+import collections
+import heapq
+import itertools
+import json
+import os
+import re
+
+INDEX_VERSION = 1
+
+X11_RGB_FILES = ('/usr/share/X11/rgb.txt', '/etc/X11/rgb.txt', '/usr/lib/X11/rgb.txt')
+
+NameMatch = collections.namedtuple('NameMatch', ['name', 'hex', 'distance'])
+
+RGB_LINE_RE = re.compile(r'^\s*(\d+)\s+(\d+)\s+(\d+)\s+(\S.*?)\s*$')
+NAME_HEX_RE = re.compile(r'^\s*(\S.*?)[\s,:=]*#([0-9A-Fa-f]{6})\s*$')
+HEX_NAME_RE = re.compile(r'^\s*#([0-9A-Fa-f]{6})[\s,:=]+(\S.*?)\s*$')
+SEPARATORS_RE = re.compile(r'[\s_-]+')
+
+CSS_COLORS = '''
+aliceblue f0f8ff antiquewhite faebd7 aqua 00ffff aquamarine 7fffd4 azure f0ffff beige f5f5dc
+bisque ffe4c4 black 000000 blanchedalmond ffebcd blue 0000ff blueviolet 8a2be2 brown a52a2a
+burlywood deb887 cadetblue 5f9ea0 chartreuse 7fff00 chocolate d2691e coral ff7f50
+cornflowerblue 6495ed cornsilk fff8dc crimson dc143c cyan 00ffff darkblue 00008b
+darkcyan 008b8b darkgoldenrod b8860b darkgray a9a9a9 darkgreen 006400 darkgrey a9a9a9
+darkkhaki bdb76b darkmagenta 8b008b darkolivegreen 556b2f darkorange ff8c00 darkorchid 9932cc
+darkred 8b0000 darksalmon e9967a darkseagreen 8fbc8f darkslateblue 483d8b darkslategray 2f4f4f
+darkslategrey 2f4f4f darkturquoise 00ced1 darkviolet 9400d3 deeppink ff1493 deepskyblue 00bfff
+dimgray 696969 dimgrey 696969 dodgerblue 1e90ff firebrick b22222 floralwhite fffaf0
+forestgreen 228b22 fuchsia ff00ff gainsboro dcdcdc ghostwhite f8f8ff gold ffd700
+goldenrod daa520 gray 808080 green 008000 greenyellow adff2f grey 808080 honeydew f0fff0
+hotpink ff69b4 indianred cd5c5c indigo 4b0082 ivory fffff0 khaki f0e68c lavender e6e6fa
+lavenderblush fff0f5 lawngreen 7cfc00 lemonchiffon fffacd lightblue add8e6 lightcoral f08080
+lightcyan e0ffff lightgoldenrodyellow fafad2 lightgray d3d3d3 lightgreen 90ee90
+lightgrey d3d3d3 lightpink ffb6c1 lightsalmon ffa07a lightseagreen 20b2aa lightskyblue 87cefa
+lightslategray 778899 lightslategrey 778899 lightsteelblue b0c4de lightyellow ffffe0
+lime 00ff00 limegreen 32cd32 linen faf0e6 magenta ff00ff maroon 800000
+mediumaquamarine 66cdaa mediumblue 0000cd mediumorchid ba55d3 mediumpurple 9370db
+mediumseagreen 3cb371 mediumslateblue 7b68ee mediumspringgreen 00fa9a mediumturquoise 48d1cc
+mediumvioletred c71585 midnightblue 191970 mintcream f5fffa mistyrose ffe4e1 moccasin ffe4b5
+navajowhite ffdead navy 000080 oldlace fdf5e6 olive 808000 olivedrab 6b8e23 orange ffa500
+orangered ff4500 orchid da70d6 palegoldenrod eee8aa palegreen 98fb98 paleturquoise afeeee
+palevioletred db7093 papayawhip ffefd5 peachpuff ffdab9 peru cd853f pink ffc0cb plum dda0dd
+powderblue b0e0e6 purple 800080 rebeccapurple 663399 red ff0000 rosybrown bc8f8f
+royalblue 4169e1 saddlebrown 8b4513 salmon fa8072 sandybrown f4a460 seagreen 2e8b57
+seashell fff5ee sienna a0522d silver c0c0c0 skyblue 87ceeb slateblue 6a5acd slategray 708090
+slategrey 708090 snow fffafa springgreen 00ff7f steelblue 4682b4 tan d2b48c teal 008080
+thistle d8bfd8 tomato ff6347 turquoise 40e0d0 violet ee82ee wheat f5deb3 white ffffff
+whitesmoke f5f5f5 yellow ffff00 yellowgreen 9acd32
+'''
+
+
+def normalize(name):
+    """ Return the lookup key of a color name."""
+    return SEPARATORS_RE.sub('', name).lower()
+
+
+def css_colors():
+    """ Return (name, hex code) pairs of the CSS named colors."""
+    words = CSS_COLORS.split()
+    return [(name, '#' + hex_code) for name, hex_code in zip(words[::2], words[1::2])]
+
+
+def parse_names(text):
+    """ Return (name, hex code) pairs of a list in the rgb.txt format or of names and '#rrggbb' codes.
+
+    Blank lines and lines starting with '!' or '#' followed by a space are skipped, as are
+    lines in neither format.
+    """
+    names = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('!') or stripped.startswith('# '):
+            continue
+        match = RGB_LINE_RE.match(line)
+        if match:
+            rgb = [int(c) for c in match.group(1, 2, 3)]
+            if max(rgb) < 256:
+                names.append((match.group(4), '#{:02x}{:02x}{:02x}'.format(*rgb)))
+            continue
+        match = NAME_HEX_RE.match(line)
+        if match:
+            names.append((match.group(1), '#' + match.group(2).lower()))
+            continue
+        match = HEX_NAME_RE.match(line)
+        if match:
+            names.append((match.group(2), '#' + match.group(1).lower()))
+    return names
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+
+def _read_names(path):
+    try:
+        with open(path, mode='r', encoding='utf-8', errors='replace') as f:
+            return parse_names(f.read())
+    except OSError:
+        return None
+
+
+class ColorNames:
+    """ Index of color names with exact, prefix, fuzzy and nearest color lookups."""
+
+    def __init__(self, names):
+        """ :param names: (name, hex code) pairs - of names with the same key the last one wins."""
+        self._hex = {}
+        self._names = {}  # key -> name as it was written in the winning source
+        for name, hex_code in names:
+            key = normalize(name)
+            if not key:
+                continue
+            self._hex[key] = hex_code.lower()
+            self._names[key] = name
+        self._keys = sorted(self._hex)
+        self._labs = None
+
+    @classmethod
+    def load(cls, x11_files=X11_RGB_FILES, extra_files=(), cache_file=None):
+        """ Index the CSS names, the first readable X11 rgb.txt and then every extra file.
+
+        With cache_file the index is read from that file if none of the source files changed
+        since it was written, and written to it otherwise.
+        """
+        sources = [[str(path), _stat_key(path)] for path in itertools.chain(x11_files, extra_files)]
+        if cache_file is not None:
+            index = cls._load_cache(cache_file, sources)
+            if index is not None:
+                return index
+        names = css_colors()
+        for path in x11_files:
+            x11 = _read_names(path)
+            if x11 is not None:
+                names.extend(x11)
+                break
+        for path in extra_files:
+            names.extend(_read_names(path) or ())
+        index = cls(names)
+        if cache_file is not None:
+            index._save_cache(cache_file, sources)
+        return index
+
+    @classmethod
+    def _load_cache(cls, cache_file, sources):
+        try:
+            with open(cache_file, mode='r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != INDEX_VERSION or data.get('sources') != sources:
+            return None
+        index = cls(())
+        index._keys = [key for key, _, _ in data['names']]
+        index._names = {key: name for key, name, _ in data['names']}
+        index._hex = {key: hex_code for key, _, hex_code in data['names']}
+        return index
+
+    def _save_cache(self, cache_file, sources):
+        data = {'version': INDEX_VERSION, 'sources': sources,
+                'names': [[key, self._names[key], self._hex[key]] for key in self._keys]}
+        tmp = f'{cache_file}.tmp'
+        with open(tmp, mode='w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, cache_file)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, name):
+        return normalize(name) in self._hex
+
+    def _match(self, key, distance=0.0):
+        return NameMatch(self._names[key], self._hex[key], distance)
+
+    def lookup(self, name):
+        """ Return the '#rrggbb' code of name or None."""
+        return self._hex.get(normalize(name))
+
+    def prefixed(self, prefix, limit=None):
+        """ Return NameMatch tuples of the names starting with prefix, in key order."""
+        prefix = normalize(prefix)
+        start = bisect.bisect_left(self._keys, prefix)
+        matches = []
+        for key in itertools.islice(self._keys, start, None):
+            if not key.startswith(prefix) or (limit is not None and len(matches) >= limit):
+                break
+            matches.append(self._match(key))
+        return matches
+
+    def fuzzy(self, name, limit=5, cutoff=0.7):
+        """ Return NameMatch tuples of the names most like name, best first.
+
+        The distance is 1 minus difflib's similarity ratio. Only names of about the same
+        length are compared, which keeps typos in large lists cheap to resolve.
+        """
+        import difflib
+
+        key = normalize(name)
+        candidates = [k for k in self._keys if abs(len(k) - len(key)) <= max(2, len(key) // 3)]
+        matches = difflib.get_close_matches(key, candidates, n=limit, cutoff=cutoff)
+        return [self._match(k, 1 - difflib.SequenceMatcher(None, key, k).ratio()) for k in matches]
+
+    def nearest(self, hex_code, limit=1):
+        """ Return NameMatch tuples of the names closest in CIELAB to hex_code with the Euclidean distance."""
+        import xthematic.similarity
+
+        if self._labs is None:
+            self._labs = [(xthematic.similarity.hex_to_lab(self._hex[key]), key) for key in self._keys]
+        l, a, b = xthematic.similarity.hex_to_lab(hex_code)
+        distances = (((l - l2) ** 2 + (a - a2) ** 2 + (b - b2) ** 2, key) for (l2, a2, b2), key in self._labs)
+        return [self._match(key, squared ** 0.5) for squared, key in heapq.nsmallest(limit, distances)]
+
+
+_databases = {}
+
+
+def database(extra_files=(), cache_file=None):
+    """ Return the ColorNames of the system's names and extra_files, indexed on first use.
+
+    See ColorNames.load for cache_file.
+    """
+    key = tuple(str(path) for path in extra_files)
+    if key not in _databases:
+        _databases[key] = ColorNames.load(extra_files=key, cache_file=cache_file)
+    return _databases[key]
@@ -0,0 +1,93 @@
+""" Palette helpers that are free of side effects.
+
+Unlike xthematic.term and xthematic.themes this module doesn't read any configuration
+or talk to X when imported, which makes it cheap to use from worker processes.
+
+A palette here is a dict of integer color ids (0-15) to lowercase '#rrggbb' strings.
+"""
+import hashlib
+import re
+
+import xthematic.colors
+
+RESOURCE_RE = re.compile(r'^\s*([^:!#]*?)color(\d+)\s*:\s*(\S+)')
+DEFINE_RE = re.compile(r'^\s*#\s*define\s+(\w+)\s+(\S+)')
+GENERIC_PREFIXES = ('', '*', '*.', '.')
+
+
+class PaletteError(ValueError):
+    pass
+
+
+def normalize_hex(value):
+    """ Return value as a lowercase '#rrggbb' string or raise PaletteError."""
+    if not xthematic.colors.Color.is_valid_hex_code(value):
+        raise PaletteError(f'{value!r} is not a valid hex code')
+    return '#' + value.lstrip('#').lower()
+
+
+def parse_resources(text):
+    """ Return the palette defined by the color resources of an .Xresources style text.
+
+    Resources with a generic prefix like '*color1' or '*.color1' take precedence over
+    class specific ones like 'URxvt*color1'. Values can refer to names from '#define' lines.
+    """
+    defines = {}
+    generic = {}
+    specific = {}
+    for line in text.splitlines():
+        match = DEFINE_RE.match(line)
+        if match:
+            defines[match.group(1)] = match.group(2)
+            continue
+        match = RESOURCE_RE.match(line)
+        if not match:
+            continue
+        prefix, number, value = match.groups()
+        number = int(number)
+        if not xthematic.colors.ColorIdentifier.is_valid(number):
+            continue
+        value = defines.get(value, value)
+        target = generic if prefix.strip() in GENERIC_PREFIXES else specific
+        target.setdefault(number, value)
+    merged = dict(specific)
+    merged.update(generic)
+    return {number: normalize_hex(value) for number, value in sorted(merged.items())}
+
+
+def parse_theme_file(path):
+    """ Parse a theme file for use in worker processes.
+
+    Returns a (path, palette, error message) tuple where exactly one of palette and
+    error message is None.
+    """
+    try:
+        with open(path, mode='r', encoding='utf-8') as f:
+            palette = parse_resources(f.read())
+    except (OSError, UnicodeDecodeError, PaletteError) as e:
+        return path, None, str(e)
+    if not palette:
+        return path, None, 'no color resources found'
+    return path, palette, None
+
+
+def from_colormap(colormap):
+    """ Convert a ColorIdentifier -> Color mapping to a palette."""
+    return {color_id.id: normalize_hex(color.hex) for color_id, color in sorted(colormap.items(), key=lambda i: i[0].id)}
+
+
+def to_colormap(palette):
+    """ Convert a palette to a ColorIdentifier -> Color dict."""
+    return {xthematic.colors.ColorIdentifier(number): xthematic.colors.Color(hex_code)
+            for number, hex_code in sorted(palette.items())}
+
+
+def palette_hash(palette):
+    """ Content hash of a palette that ignores the case of the hex codes and slot order."""
+    normalized = '\n'.join(f'{number}:{normalize_hex(hex_code)}' for number, hex_code in sorted(palette.items()))
+    return hashlib.sha1(normalized.encode('ascii')).hexdigest()
+
+
+def resource_text(palette):
+    """ Canonical .Xresources text of a palette - one '*colorN: #rrggbb' line per slot."""
+    return ''.join(f'*color{number}: {hex_code}\n' for number, hex_code in sorted(palette.items()))
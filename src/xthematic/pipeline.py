@@ -0,0 +1,70 @@
+""" Concurrent steps of a command.
+
+Commands that change the palette do their slow follow-up work - loading resources with
+xrdb, rewriting files - after the terminal already shows the new colors. Those steps
+don't depend on each other, so they are run at the same time in threads; they spend their
+time in subprocesses and file I/O, which release the GIL. Every step is timed and shows up
+in the --profile breakdown, and a failing step doesn't stop the others.
+"""
+import collections
+import threading
+import time
+
+import xthematic.profiling
+
+StepResult = collections.namedtuple('StepResult', ['name', 'seconds', 'error'])
+
+
+class PipelineError(Exception):
+    """ Raised with the results of all steps when at least one of them failed."""
+
+    def __init__(self, results):
+        self.results = results
+        failed = [r for r in results if r.error is not None]
+        super().__init__('; '.join(f'{r.name} failed: {r.error}' for r in failed))
+
+    @property
+    def errors(self):
+        return [r.error for r in self.results if r.error is not None]
+
+    def describe(self):
+        """ Return a line for each failed step with its name, time and error."""
+        return [f'{r.name} failed after {r.seconds:.3f}s: {r.error}' for r in self.results if r.error is not None]
+
+
+def _run_step(name, function, results, position):
+    start = time.perf_counter()
+    error = None
+    try:
+        with xthematic.profiling.span(name, category='pipeline'):
+            function()
+    except Exception as e:
+        error = e
+    results[position] = StepResult(name, time.perf_counter() - start, error)
+
+
+def run(steps):
+    """ Run (name, function) steps concurrently and return a StepResult for each, in order.
+
+    The first step runs in the calling thread. Exceptions of the steps are caught and put in
+    the results - use check() to raise them.
+    """
+    steps = list(steps)
+    results = [None] * len(steps)
+    threads = [threading.Thread(target=_run_step, args=(name, function, results, position),
+                                name=f'xthematic-{name}', daemon=True)
+               for position, (name, function) in enumerate(steps) if position]
+    for thread in threads:
+        thread.start()
+    if steps:
+        _run_step(*steps[0], results, 0)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def check(results):
+    """ Raise PipelineError if any of the results has an error, otherwise return them."""
+    if any(r.error is not None for r in results):
+        raise PipelineError(results)
+    return results
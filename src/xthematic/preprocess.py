@@ -0,0 +1,217 @@
+""" In-process preprocessing of resource files for `xrdb -nocpp`.
+
+xrdb runs every file it loads through the C preprocessor. The files xthematic writes only
+need `#include` and object-like `#define`, so those are resolved here and the flattened
+text is piped to `xrdb -nocpp`. The result is cached together with the stat of every file
+it was built from (and of every include candidate that didn't exist), and a load whose
+text is the same as the last one loaded into the same X server is skipped.
+
+Files with other directives - conditionals, function-like macros, C comments or the
+symbols xrdb predefines - are left to xrdb and its preprocessor.
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+
+import xthematic.profiling
+
+CACHE_VERSION = 1
+MAX_INCLUDE_DEPTH = 32
+
+INCLUDE_RE = re.compile(r'^\s*#\s*include\s+(?:"([^"]+)"|<([^>]+)>)\s*$')
+DEFINE_RE = re.compile(r'^\s*#\s*define\s+([A-Za-z_]\w*)(?:\s+(.*?))?\s*$')
+UNDEF_RE = re.compile(r'^\s*#\s*undef\s+([A-Za-z_]\w*)\s*$')
+DIRECTIVE_RE = re.compile(r'^\s*#')
+IDENTIFIER_RE = re.compile(r'[A-Za-z_]\w*')
+
+# symbols defined by xrdb before it runs the preprocessor, see xrdb(1)
+XRDB_SYMBOLS = frozenset([
+    'SERVERHOST', 'SRVR_name', 'HOST', 'DISPLAY_NUM', 'CLIENTHOST', 'CLNT_name', 'VERSION',
+    'REVISION', 'VENDOR', 'VNDR_name', 'EXT_name', 'NUM_SCREENS', 'SCREEN_NUM', 'BITS_PER_RGB',
+    'CLASS', 'CLASS_name', 'COLOR', 'HEIGHT', 'WIDTH', 'PLANES', 'X_RESOLUTION', 'Y_RESOLUTION',
+    'RELEASE',
+])
+
+
+class UnsupportedDirective(ValueError):
+    pass
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+
+def _substitute(line, defines):
+    for _ in range(MAX_INCLUDE_DEPTH):
+        replaced = IDENTIFIER_RE.sub(lambda m: defines.get(m.group(0), m.group(0)), line)
+        if replaced == line:
+            return line
+        line = replaced
+    raise UnsupportedDirective(f'recursive definition in {line!r}')
+
+
+def flatten(path, include_dirs=()):
+    """ Return the text of the resource file at path with includes and defines resolved.
+
+    Like cpp, "file" includes are searched for in the directory of the including file and
+    then in include_dirs, <file> includes only in include_dirs.
+
+    :return: (text, dependencies) where dependencies maps every path that was read or
+    looked for to its stat key (None for paths that don't exist)
+    :raises UnsupportedDirective: if the file needs the real preprocessor
+    """
+    dependencies = {}
+    defines = {}
+    out = []
+
+    def find(name, quoted, directory):
+        candidates = [name] if os.path.isabs(name) else []
+        if not candidates:
+            if quoted:
+                candidates.append(os.path.join(directory, name))
+            candidates.extend(os.path.join(str(d), name) for d in include_dirs)
+        for candidate in candidates:
+            key = _stat_key(candidate)
+            dependencies[candidate] = key
+            if key is not None:
+                return candidate
+        raise UnsupportedDirective(f'{name!r} is not in the include path')
+
+    def visit(file, depth):
+        if depth > MAX_INCLUDE_DEPTH:
+            raise UnsupportedDirective(f'includes nested too deep at {file}')
+        dependencies[file] = _stat_key(file)
+        with open(file, mode='r', encoding='utf-8') as f:
+            text = f.read()
+        if '/*' in text or '//' in text.replace('://', ''):
+            raise UnsupportedDirective(f'{file} has C comments')
+        for line in text.splitlines():
+            match = INCLUDE_RE.match(line)
+            if match:
+                quoted, angled = match.groups()
+                visit(find(quoted or angled, quoted is not None, os.path.dirname(file)), depth + 1)
+                continue
+            match = DEFINE_RE.match(line)
+            if match and not line[match.end(1):].startswith('('):
+                defines[match.group(1)] = match.group(2) or ''
+                continue
+            match = UNDEF_RE.match(line)
+            if match:
+                defines.pop(match.group(1), None)
+                continue
+            if DIRECTIVE_RE.match(line):
+                raise UnsupportedDirective(f'{line.strip()!r} in {file}')
+            if line.lstrip().startswith('!'):
+                out.append(line)
+                continue
+            if XRDB_SYMBOLS.intersection(IDENTIFIER_RE.findall(line)):
+                raise UnsupportedDirective(f'{file} uses symbols predefined by xrdb')
+            out.append(_substitute(line, defines) if defines else line)
+
+    visit(str(path), 0)
+    return ''.join(line + '\n' for line in out), dependencies
+
+
+class FlattenCache:
+    """ Flattened resource files and the last load, persisted as JSON in file."""
+
+    def __init__(self, file):
+        self.file = file
+        self.entries = {}  # json encoded [path, include dirs] -> {'dependencies', 'text'}
+        self.loaded = None  # {'server', 'hash'} of the last load
+        self.dirty = False
+
+    @classmethod
+    def load(cls, file):
+        cache = cls(file)
+        try:
+            with open(file, mode='r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cache
+        if data.get('version') == CACHE_VERSION:
+            cache.entries = data['entries']
+            cache.loaded = data['loaded']
+        return cache
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = f'{self.file}.tmp'
+        with open(tmp, mode='w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': self.entries, 'loaded': self.loaded}, f)
+        os.replace(tmp, self.file)
+        self.dirty = False
+
+    def flatten(self, path, include_dirs=()):
+        """ Cached flatten() that only returns the text."""
+        key = json.dumps([str(path), [str(d) for d in include_dirs]])
+        entry = self.entries.get(key)
+        if entry and all(_stat_key(p) == k for p, k in entry['dependencies'].items()):
+            return entry['text']
+        text, dependencies = flatten(path, include_dirs)
+        self.entries[key] = {'dependencies': dependencies, 'text': text}
+        self.dirty = True
+        return text
+
+    def is_loaded(self, text, server):
+        return server is not None and self.loaded == {'server': server, 'hash': _hash(text)}
+
+    def set_loaded(self, text, server):
+        """ Remember that text was loaded into server - None for text that wasn't flattened."""
+        self.loaded = {'server': server, 'hash': _hash(text) if text is not None else None}
+        self.dirty = True
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def server_id(display=None):
+    """ Identify the running local X server, or return None if it can't be identified.
+
+    The display's unix socket is recreated whenever the server starts, which makes its
+    inode and change time tell apart two servers on the same display.
+    """
+    display = os.environ.get('DISPLAY', '') if display is None else display
+    match = re.match(r'^(?:unix)?:(\d+)(?:\.\d+)?$', display)
+    if not match:
+        return None
+    try:
+        stat = os.stat(f'/tmp/.X11-unix/X{match.group(1)}')
+    except OSError:
+        return None
+    return [display, stat.st_ino, stat.st_ctime_ns]
+
+
+def xrdb_load(path, include_dirs=(), cache_file=None, force=False):
+    """ Load the resource file at path into the X server like `xrdb -I... -load path`.
+
+    Returns False if the load was skipped because the same text was already loaded.
+    """
+    cache = FlattenCache.load(cache_file) if cache_file else FlattenCache(None)
+    try:
+        with xthematic.profiling.span('resources.flatten', category='file'):
+            text = cache.flatten(path, include_dirs)
+    except UnsupportedDirective:
+        args = ['xrdb', *(f'-I{d}' for d in include_dirs), '-load', str(path)]
+        with xthematic.profiling.span('xrdb -load', category='subprocess'):
+            subprocess.check_call(args)
+        cache.set_loaded(None, None)
+        loaded = True
+    else:
+        server = server_id()
+        loaded = force or not cache.is_loaded(text, server)
+        if loaded:
+            with xthematic.profiling.span('xrdb -nocpp -load', category='subprocess'):
+                subprocess.run(['xrdb', '-nocpp', '-load'], input=text.encode('utf-8'), check=True)
+            cache.set_loaded(text, server)
+    if cache_file:
+        cache.save()
+    return loaded
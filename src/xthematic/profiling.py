@@ -0,0 +1,128 @@
+""" Timing spans for the --profile option.
+
+Instrumented code wraps its phases in span() or decorates functions with traced().
+While profiling is disabled both reduce to a flag check, so they can stay in hot paths.
+Recorded spans can be printed as a breakdown with report() or saved in the Chrome trace
+event format (chrome://tracing, https://ui.perfetto.dev) with write_chrome_trace().
+"""
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+# set before anything else is imported so import time work is included in the spans
+ORIGIN = time.perf_counter()
+ENABLED = bool(os.environ.get('XTHEMATIC_PROFILE'))
+
+Span = collections.namedtuple('Span', ['name', 'category', 'start', 'duration', 'thread'])
+
+_spans = []
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _TimedSpan:
+    __slots__ = ('name', 'category', 'start')
+
+    def __init__(self, name, category):
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, self.category, start=self.start)
+        return False
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def enable_if_requested(args):
+    """ Enable profiling if the --profile or --profile-trace options are among args."""
+    if any(a == '--profile' or a.startswith('--profile-trace') for a in args):
+        enable()
+    return ENABLED
+
+
+def span(name, category='app'):
+    """ Context manager that times its block under name."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _TimedSpan(name, category)
+
+
+def traced(name=None, category='app'):
+    """ Decorator that times every call of the decorated function."""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _TimedSpan(span_name, category):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record(name, category='app', start=ORIGIN, end=None):
+    """ Record a span that has already finished."""
+    end = time.perf_counter() if end is None else end
+    _spans.append(Span(name, category, start, end - start, threading.get_ident()))
+
+
+def spans():
+    return list(_spans)
+
+
+def summary():
+    """ Return (name, category, calls, total seconds) tuples sorted by total time."""
+    totals = {}
+    for s in _spans:
+        calls, total = totals.get((s.name, s.category), (0, 0.0))
+        totals[(s.name, s.category)] = (calls + 1, total + s.duration)
+    rows = [(name, cat, calls, total) for (name, cat), (calls, total) in totals.items()]
+    return sorted(rows, key=lambda r: r[3], reverse=True)
+
+
+def report():
+    """ Return a printable breakdown of where the time went."""
+    wall = time.perf_counter() - ORIGIN
+    lines = [f'{"span":<36} {"category":<10} {"calls":>5} {"total ms":>9} {"% wall":>7}']
+    for name, category, calls, total in summary():
+        lines.append(f'{name:<36} {category:<10} {calls:>5} {total * 1000:>9.2f} {100 * total / wall:>6.1f}%')
+    lines.append(f'{"wall time":<36} {"":<10} {"":>5} {wall * 1000:>9.2f}')
+    return '\n'.join(lines)
+
+
+def write_chrome_trace(path):
+    """ Write the recorded spans as Chrome trace event JSON."""
+    pid = os.getpid()
+    events = [
+        {'name': s.name, 'cat': s.category, 'ph': 'X', 'pid': pid, 'tid': s.thread,
+         'ts': (s.start - ORIGIN) * 1e6, 'dur': s.duration * 1e6}
+        for s in _spans
+    ]
+    with open(path, mode='w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
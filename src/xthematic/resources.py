@@ -0,0 +1,130 @@
+""" Editing single color resources of a file in place.
+
+Setting one color of a theme or of ~/.Xresources doesn't need the file parsed and written
+back out - only the bytes of the resource's value change. The byte offsets of every color
+value are found with one scan and kept in an OffsetIndex together with the stat of the
+file, so repeated edits of the same file go straight to the bytes to replace. The new
+content is written to a temporary file that replaces the old one, so readers never see a
+half written file.
+
+Like xthematic.palette this module doesn't read any configuration.
+"""
+import json
+import os
+import re
+
+import xthematic.palette
+
+INDEX_VERSION = 1
+
+VALUE_RE = re.compile(rb'^[ \t]*([^:!#\n]*?)color(\d+)[ \t]*:[ \t]*(\S+)', re.MULTILINE)
+
+
+def scan_offsets(data):
+    """ Return a dict of color id -> [start, end] byte offsets of the values in resource file data.
+
+    Of several resources of the same color the one xthematic.palette.parse_resources uses
+    is indexed - the first with a generic prefix like '*color1', else the first at all.
+    """
+    generic = {}
+    specific = {}
+    for match in VALUE_RE.finditer(data):
+        number = int(match.group(2))
+        if number not in range(16):
+            continue
+        prefix = match.group(1).strip().decode('utf-8', errors='replace')
+        target = generic if prefix in xthematic.palette.GENERIC_PREFIXES else specific
+        target.setdefault(number, [match.start(3), match.end(3)])
+    offsets = dict(specific)
+    offsets.update(generic)
+    return offsets
+
+
+def _stat_key(stat):
+    return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+
+def _is_value(data, start, end):
+    """ Return whether start:end still spans a whole resource value of data."""
+    if not 0 < start < end <= len(data) or data[start - 1:start] not in b' \t:':
+        return False
+    return end == len(data) or data[end:end + 1].isspace() and not data[start:end].isspace()
+
+
+class OffsetIndex:
+    """ Offsets of the color values in resource files, persisted as JSON in file."""
+
+    def __init__(self, file=None):
+        self.file = file
+        self.entries = {}  # path -> {'stat', 'offsets'}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, file):
+        index = cls(file)
+        try:
+            with open(file, mode='r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return index
+        if data.get('version') == INDEX_VERSION:
+            index.entries = data['entries']
+        return index
+
+    def save(self):
+        if not self.dirty or self.file is None:
+            return
+        tmp = f'{self.file}.tmp'
+        with open(tmp, mode='w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'entries': self.entries}, f)
+        os.replace(tmp, self.file)
+        self.dirty = False
+
+    def offsets(self, path, data, stat):
+        """ Return the value offsets of the file at path with content data and os.stat_result stat."""
+        entry = self.entries.get(path)
+        if entry and entry['stat'] == _stat_key(stat):
+            offsets = {int(k): v for k, v in entry['offsets'].items()}
+            if all(_is_value(data, start, end) for start, end in offsets.values()):
+                return offsets
+        offsets = scan_offsets(data)
+        self._set(path, offsets, stat)
+        return offsets
+
+    def _set(self, path, offsets, stat):
+        self.entries[path] = {'stat': _stat_key(stat), 'offsets': {str(k): v for k, v in offsets.items()}}
+        self.dirty = True
+
+    def set_color(self, path, color_id, hex_code):
+        """ Set the value of the color resource color_id of the file at path to hex_code.
+
+        Only the bytes of the old value are replaced. A color that has no resource in the
+        file yet is appended as '*colorN: hex_code'. Symbolic links are followed.
+        Returns the old value or None.
+        """
+        path = os.path.realpath(path)
+        value = xthematic.palette.normalize_hex(hex_code).encode('ascii')
+        with open(path, mode='rb') as f:
+            stat = os.fstat(f.fileno())
+            data = f.read()
+        offsets = self.offsets(path, data, stat)
+        if color_id in offsets:
+            start, end = offsets[color_id]
+            old = data[start:end].decode('utf-8')
+        else:
+            line = b'*color%d: ' % color_id
+            prefix = data if not data or data.endswith(b'\n') else data + b'\n'
+            start = end = len(prefix) + len(line)
+            data = prefix + line + b'\n'
+            old = None
+        new_data = data[:start] + value + data[end:]
+        tmp = f'{path}.tmp'
+        with open(tmp, mode='wb') as f:
+            f.write(new_data)
+        os.chmod(tmp, stat.st_mode & 0o7777)
+        os.replace(tmp, path)
+        shift = len(value) - (end - start)
+        offsets = {k: [s + shift, e + shift] if s >= end else [s, e] for k, (s, e) in offsets.items()}
+        offsets[color_id] = [start, start + len(value)]
+        self._set(path, offsets, os.stat(path))
+        return old
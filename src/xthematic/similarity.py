@@ -0,0 +1,220 @@
+""" Perceptual similarity search over saved themes.
+
+Every palette is turned into a 48 dimensional vector - the CIELAB coordinates of its 16
+colors - and themes are ranked by the mean CIE76 color difference of their slots.
+Vectors are kept in a small binary store keyed by palette hash that is updated when themes
+are saved or removed, so a query only computes the distances. numpy is used to read the
+store and compute the distances when it is installed.
+"""
+import heapq
+import os
+import struct
+
+import xthematic.backends
+import xthematic.colors
+import xthematic.colorspace
+
+SLOTS = 16
+DIMENSIONS = SLOTS * 3
+STORE_MAGIC = b'XTV1'
+RECORD = struct.Struct(f'<20s{DIMENSIONS}f')
+
+
+def _f(t):
+    return t ** (1 / 3) if t > 216 / 24389 else (24389 / 27 * t + 16) / 116
+
+
+def rgb_to_lab(r, g, b):
+    """ Convert 8 bit sRGB channels to CIELAB (D65)."""
+    linear, white = xthematic.colorspace.SRGB_LINEAR, xthematic.colorspace.D65_WHITE
+    r, g, b = linear[r], linear[g], linear[b]
+    x = (0.4124 * r + 0.3576 * g + 0.1805 * b) / white[0]
+    y = (0.2126 * r + 0.7152 * g + 0.0722 * b) / white[1]
+    z = (0.0193 * r + 0.1192 * g + 0.9505 * b) / white[2]
+    fx, fy, fz = _f(x), _f(y), _f(z)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+
+def hex_to_lab(hex_code):
+    return rgb_to_lab(*xthematic.colors.Color(hex_code).rgb)
+
+
+def palette_vector(palette):
+    """ Return the 48 Lab coordinates of a palette, using xterm defaults for missing slots."""
+    vector = []
+    for number in range(SLOTS):
+        vector.extend(hex_to_lab(palette.get(number, xthematic.backends.DEFAULT_PALETTE[number])))
+    return vector
+
+
+class VectorStore:
+    """ Palette vectors keyed by palette hash, persisted in a binary file.
+
+    The vectors are the rows of a float32 matrix. With numpy it is read straight from the
+    records of the file with numpy.frombuffer, otherwise it is a list of lists. The store is
+    updated when themes are saved or removed, so queries only index into the matrix.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.hashes = []  # palette hash of every row
+        self.rows = {}  # palette hash -> row
+        numpy = xthematic.colorspace.optional_numpy()
+        self.matrix = [] if numpy is None else numpy.empty((0, DIMENSIONS), dtype=numpy.float32)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, file):
+        store = cls(file)
+        try:
+            with open(file, mode='rb') as f:
+                data = f.read()
+        except OSError:
+            return store
+        if data[:len(STORE_MAGIC)] != STORE_MAGIC or (len(data) - len(STORE_MAGIC)) % RECORD.size:
+            return store
+        numpy = xthematic.colorspace.optional_numpy()
+        if numpy is None:
+            for digest, *vector in RECORD.iter_unpack(data[len(STORE_MAGIC):]):
+                store.hashes.append(digest.hex())
+                store.matrix.append(vector)
+        else:
+            records = numpy.frombuffer(data, dtype=_record_dtype(numpy), offset=len(STORE_MAGIC))
+            digests = records['hash'].tobytes()
+            store.hashes = [digests[k:k + 20].hex() for k in range(0, len(digests), 20)]
+            store.matrix = records['vector']
+        store.rows = {palette_hash: row for row, palette_hash in enumerate(store.hashes)}
+        return store
+
+    @property
+    def vectors(self):
+        """ Dict of palette hash -> vector as a list."""
+        return {palette_hash: list(self.matrix[row]) for palette_hash, row in self.rows.items()}
+
+    def __contains__(self, palette_hash):
+        return palette_hash in self.rows
+
+    def add(self, palettes):
+        """ Add the vectors of the palettes in a dict of palette hash -> palette the store doesn't have yet."""
+        new = [(palette_hash, palette) for palette_hash, palette in palettes.items() if palette_hash not in self.rows]
+        if not new:
+            return
+        vectors = [palette_vector(palette) for _, palette in new]
+        numpy = xthematic.colorspace.optional_numpy()
+        if isinstance(self.matrix, list):
+            self.matrix = self.matrix + vectors
+        else:
+            self.matrix = numpy.concatenate([self.matrix, numpy.asarray(vectors, dtype=numpy.float32)])
+        for palette_hash, _ in new:
+            self.rows[palette_hash] = len(self.hashes)
+            self.hashes.append(palette_hash)
+        self.dirty = True
+
+    def discard(self, palette_hashes):
+        """ Drop the vectors of palette_hashes."""
+        drop = {palette_hash for palette_hash in palette_hashes if palette_hash in self.rows}
+        if not drop:
+            return
+        keep = [row for row, palette_hash in enumerate(self.hashes) if palette_hash not in drop]
+        if isinstance(self.matrix, list):
+            self.matrix = [self.matrix[row] for row in keep]
+        else:
+            self.matrix = self.matrix[keep]
+        self.hashes = [self.hashes[row] for row in keep]
+        self.rows = {palette_hash: row for row, palette_hash in enumerate(self.hashes)}
+        self.dirty = True
+
+    def sync(self, index):
+        """ Add vectors for new palettes of index and drop the ones no theme uses anymore."""
+        wanted = {}
+        for name, palette in index.palettes():
+            wanted.setdefault(index.entries[name]['hash'], palette)
+        self.discard(set(self.rows) - set(wanted))
+        self.add(wanted)
+        return self
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = f'{self.file}.tmp'
+        with open(tmp, mode='wb') as f:
+            f.write(STORE_MAGIC)
+            if isinstance(self.matrix, list):
+                for palette_hash, vector in zip(self.hashes, self.matrix):
+                    f.write(RECORD.pack(bytes.fromhex(palette_hash), *vector))
+            else:
+                numpy = xthematic.colorspace.optional_numpy()
+                records = numpy.empty(len(self.hashes), dtype=_record_dtype(numpy))
+                records['hash'] = numpy.frombuffer(b''.join(bytes.fromhex(h) for h in self.hashes),
+                                                   dtype=numpy.uint8).reshape(-1, 20)
+                records['vector'] = self.matrix
+                f.write(records.tobytes())
+        os.replace(tmp, self.file)
+        self.dirty = False
+
+
+def _record_dtype(numpy):
+    """ The numpy dtype of a RECORD."""
+    return numpy.dtype([('hash', numpy.uint8, (20,)), ('vector', '<f4', (DIMENSIONS,))])
+
+
+def _candidates(index, store, exclude):
+    """ Return the names of the themes of index not in exclude and their rows of store.matrix."""
+    if any(entry['hash'] and entry['hash'] not in store for entry in index.entries.values()):
+        store.sync(index)  # the store file was removed or is from before the themes were indexed
+    names, rows = [], []
+    for name, entry in index.entries.items():
+        if entry['hash'] and name not in exclude:
+            names.append(name)
+            rows.append(store.rows[entry['hash']])
+    if isinstance(store.matrix, list):
+        return names, [store.matrix[row] for row in rows]
+    return names, store.matrix[rows]
+
+
+def _palette_distances(vectors, target):
+    if not isinstance(vectors, list):
+        numpy = xthematic.colorspace.optional_numpy()
+        matrix = vectors.reshape(-1, SLOTS, 3)
+        t = numpy.asarray(target, dtype=numpy.float32).reshape(SLOTS, 3)
+        return numpy.sqrt(((matrix - t) ** 2).sum(axis=2)).mean(axis=1).tolist()
+    distances = []
+    for v in vectors:
+        total = 0.0
+        for k in range(0, DIMENSIONS, 3):
+            total += ((v[k] - target[k]) ** 2 + (v[k + 1] - target[k + 1]) ** 2 + (v[k + 2] - target[k + 2]) ** 2) ** 0.5
+        distances.append(total / SLOTS)
+    return distances
+
+
+def _color_distances(vectors, lab):
+    if not isinstance(vectors, list):
+        numpy = xthematic.colorspace.optional_numpy()
+        matrix = vectors.reshape(-1, SLOTS, 3)
+        return numpy.sqrt(((matrix - numpy.asarray(lab, dtype=numpy.float32)) ** 2).sum(axis=2)).min(axis=1).tolist()
+    l, a, b = lab
+    return [min(((v[k] - l) ** 2 + (v[k + 1] - a) ** 2 + (v[k + 2] - b) ** 2) ** 0.5 for k in range(0, DIMENSIONS, 3))
+            for v in vectors]
+
+
+def _nearest(names, distances, k):
+    return heapq.nsmallest(k, zip(names, distances), key=lambda pair: (pair[1], pair[0]))
+
+
+def similar_themes(index, store, palette, k=10, exclude=()):
+    """ Return (name, distance) pairs of the k themes closest to palette.
+
+    The distance is the mean CIE76 difference between colors of the same slot.
+    """
+    names, vectors = _candidates(index, store, exclude=set(exclude))
+    if not names:
+        return []
+    return _nearest(names, _palette_distances(vectors, palette_vector(palette)), k)
+
+
+def themes_near_color(index, store, hex_code, k=10):
+    """ Return (name, distance) pairs of the k themes that have a color closest to hex_code."""
+    names, vectors = _candidates(index, store, exclude=set())
+    if not names:
+        return []
+    return _nearest(names, _color_distances(vectors, hex_to_lab(hex_code)), k)
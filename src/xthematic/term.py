@@ -1,13 +1,17 @@
+import collections.abc
+import contextlib
 import functools
 import json
 import logging
+import os
 import re
-import subprocess
-
-import collections
 
+import xthematic.backends
 import xthematic.colors
 import xthematic.config
+import xthematic.journal
+import xthematic.pipeline
+import xthematic.profiling
 
 logger = logging.getLogger(__name__)
 
@@ -22,60 +26,70 @@ def keep_updated(method):
     return new_method
 
 
-class _LoadedColors(collections.Mapping):
+class _LoadedColors(collections.abc.Mapping):
+    """ Colors loaded in the X resource database - queried on first access."""
 
-    def __init__(self):
-        self._colors = {}
-        self.update()
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._colors = None
         logger.debug('initialized %s', object.__repr__(self))
 
-    @staticmethod
-    def colors_from_xrdb(output):
-        lines = output.splitlines()
-        matches = (re.match(pattern=b'.*color(\d+):\t([^ ]+)', string=l) for l in lines)
-        grouped = (m.groups() for m in matches)
-        cast = ((int(num), byte_arr.decode(encoding='ascii')) for num, byte_arr in grouped)
-        colors = {}
-        for number, hex_code in sorted(cast):
-            if number in colors and hex_code != colors[number]:
-                raise RuntimeError(f"color{number} has more than one value")
-            cid = xthematic.colors.ColorIdentifier(number)
-            c = xthematic.colors.Color(hex_code)
-            colors[cid] = c
-        return colors  # values are sorted by keys
+    colors_from_xrdb = staticmethod(xthematic.backends.colors_from_xrdb)
+
+    @property
+    def backend(self):
+        return self._backend or xthematic.backends.get_backend()
+
+    def is_outdated(self):
+        return self._colors is None
 
+    @keep_updated
     def __iter__(self):
         yield from self._colors
 
+    @keep_updated
     def __len__(self):
         return len(self._colors)
 
+    @keep_updated
     def __getitem__(self, k):
         return self._colors[k]
 
     def update(self):
-        queried = subprocess.Popen(['xrdb', '-query'], stdout=subprocess.PIPE)
-        grepped = subprocess.check_output(['grep', 'color'], stdin=queried.stdout)
-        queried.wait()
-        self._colors = self.colors_from_xrdb(grepped)
+        self._colors = self.backend.read_loaded()
         logger.debug('updated colors of %s', object.__repr__(self))
 
 
 LOADED_COLORS = _LoadedColors()
 
 
-class _CustomColors(collections.MutableMapping):
+class _CustomColors(collections.abc.MutableMapping):
+    """ Colors customized in this terminal session - read from USER_CUSTOM_FILE on first access."""
+
     def __init__(self, session_id=xthematic.config.TERMINAL_SESSION_ID):
         self._session_id = session_id
+        self._colors = None
+        logger.debug('initialized %s instance %s', self.__class__.__name__, object.__repr__(self))
+
+    def is_outdated(self):
+        return self._colors is None
+
+    def update(self):
         self._colors = self.read_customized_colors(self._session_id)
-        logger.debug('initialized %s instance %s', self.__class__.__name__, self)
-        logging.info('custom colors are %s', self._colors)
+        logger.debug('custom colors are %s', self._colors)
 
     @staticmethod
+    @xthematic.profiling.traced('custom.read', category='file')
     def custom_dict():
         with open(xthematic.config.USER_CUSTOM_FILE) as f:
             return json.load(f)
 
+    @staticmethod
+    @xthematic.profiling.traced('custom.write', category='file')
+    def write_custom_dict(json_dict):
+        with open(xthematic.config.USER_CUSTOM_FILE, mode='w') as f:
+            json.dump(obj=json_dict, fp=f)
+
     @staticmethod
     def read_customized_colors(session_id=xthematic.config.TERMINAL_SESSION_ID):
         json_dict = _CustomColors.custom_dict()
@@ -86,25 +100,29 @@ class _CustomColors(collections.MutableMapping):
             colors[xthematic.colors.ColorIdentifier(index)] = xthematic.colors.Color(hex_code)
         return colors
 
+    @keep_updated
     def __len__(self) -> int:
         return len(self._colors)
 
+    @keep_updated
     def __iter__(self):
         yield from self._colors
 
+    @keep_updated
     def __getitem__(self, item):
         return self._colors[item]
 
+    @keep_updated
     def __setitem__(self, color_id, color):
         json_dict = self.__class__.custom_dict()
         color_hexes = json_dict.get(self._session_id, {})
         color_hexes[str(color_id.id)] = str(color.hex)
         json_dict[xthematic.config.TERMINAL_SESSION_ID] = color_hexes
-        with open(xthematic.config.USER_CUSTOM_FILE, mode='w', ) as f:
-            json.dump(obj=json_dict, fp=f)
+        self.__class__.write_custom_dict(json_dict)
         self._colors[color_id] = color
         logger.info('set custom color %s to %s', color_id, color)
 
+    @keep_updated
     def __delitem__(self, color_id):
         json_dict = self.__class__.custom_dict()
         color_hexes = json_dict.get(self._session_id, {})
@@ -112,33 +130,81 @@ class _CustomColors(collections.MutableMapping):
         assert color == self._colors[color_id].hex
         del color_hexes[str(color_id.id)]
         json_dict[xthematic.config.TERMINAL_SESSION_ID] = color_hexes
-        with open(xthematic.config.USER_CUSTOM_FILE, mode='w') as f:
-            json.dump(obj=json_dict, fp=f)
+        self.__class__.write_custom_dict(json_dict)
         logger.info('removed custom color %s with hex %s', color_id, color)
         del self._colors[color_id]
 
+    @keep_updated
+    def update_colors(self, colors, save=True):
+        """ Set several custom colors, or remove those mapped to None, with a single write.
+
+        If save is False only the colors in memory are changed until save() is called.
+        """
+        for color_id, color in colors.items():
+            if color is None:
+                self._colors.pop(color_id, None)
+            else:
+                self._colors[color_id] = color
+        if save:
+            self.save()
+        logger.info('updated custom colors %s', colors)
+
+    @keep_updated
+    def save(self):
+        """ Write the custom colors of the session to USER_CUSTOM_FILE."""
+        json_dict = self.__class__.custom_dict()
+        json_dict[self._session_id] = {str(color_id.id): str(color.hex) for color_id, color in self._colors.items()}
+        self.__class__.write_custom_dict(json_dict)
+
+    @keep_updated
     def clear(self):
         json_dict = self.__class__.custom_dict()
         if self._session_id in json_dict:
             del json_dict[self._session_id]
-        with open(xthematic.config.USER_CUSTOM_FILE, mode='w') as f:
-            json.dump(obj=json_dict, fp=f)
+        self.__class__.write_custom_dict(json_dict)
         logger.info('reset all custom colors')
-        logger.info('removed colors: ', self._colors)
+        logger.info('removed colors: %s', self._colors)
         self._colors.clear()
 
 
 CUSTOM_COLORS = _CustomColors()
 
 
-class _TermColors(collections.MutableMapping):
-    """ Interface to terminal colors."""
+class _TermColors(collections.abc.MutableMapping):
+    """ Interface to terminal colors.
 
-    def __init__(self):
+    By default the colors are the loaded resources overridden by the colors customized in this
+    session. In live mode the terminal is asked for its palette instead, which also sees the
+    changes of other programs and skips the xrdb query and the bookkeeping of custom colors.
+    """
+
+    def __init__(self, backend=None, live=None):
         # TODO include defaults for missing customized colors
+        self._backend = backend
+        self.live = xthematic.config.LIVE_PALETTE if live is None else live
         self.loaded = LOADED_COLORS
         self.custom = CUSTOM_COLORS
-        self.colors = DictView(self.loaded, self.custom)
+        self._tracked = DictView(self.loaded, self.custom)
+        self._queried = None
+        self.pending = None  # colors set inside xthematic.term.batched() that aren't applied yet
+
+    @property
+    def backend(self):
+        return self._backend or xthematic.backends.get_backend()
+
+    @property
+    def colors(self):
+        if self.pending:
+            return DictView(self._applied, self.pending)
+        return self._applied
+
+    @property
+    def _applied(self):
+        if not self.live:
+            return self._tracked
+        if self._queried is None:
+            self._queried = self.backend.query_current()
+        return self._queried
 
     def __iter__(self):
         yield from self.colors
@@ -150,43 +216,84 @@ class _TermColors(collections.MutableMapping):
         return self.colors[color_id]
 
     def __setitem__(self, color_id, color):
-        if self.colors[color_id] == color:
-            logger.debug('%s is already set to %s', color_id, color)
-            return
+        self.apply({color_id: color})
 
-        index = str(color_id.id)
-        r, g, b = map(str, color.rgb_large_percentage)
-        initc = subprocess.run(['tput', 'initc', index, r, g, b])
-        initc.check_returncode()
-        logger.info('set terminal color %s to %s', color_id, color)
-        if self.loaded[color_id] == color and color_id in self.custom:
-            del self.custom[color_id]
-        elif self.loaded[color_id] == color:
-            msg = f'{color} is not a custom color, but previously {color_id} was overwrited in loaded'
-            logger.critical(msg)
-            assert False, msg
-        else:
-            self.custom[color_id] = color
+    def apply(self, colors):
+        """ Set several colors with one write to the terminal and one write of the custom colors."""
+        previous = {color_id: self._applied[color_id] for color_id in colors if color_id in self._applied}
+        save = self.write(colors)
+        if save is None:
+            return
+        try:
+            save()
+        except BaseException:
+            # keep the terminal in line with the custom colors
+            self.write(previous)
+            raise
+
+    def write(self, colors):
+        """ Set several colors in the terminal with one write and return the function that saves them.
+
+        The colors are tracked in memory right away, only writing the custom colors to disk is
+        left to the returned function. None is returned if there is nothing to save.
+        """
+        colors = {color_id: color for color_id, color in colors.items()
+                  if not same_color(self._applied.get(color_id), color)}
+        if not colors:
+            return None
+        self.backend.apply_batch(colors)
+        logger.info('set terminal colors %s', colors)
+        if self.live:
+            self._queried.update(colors)
+            return None
+        custom = {color_id: None if same_color(self.loaded.get(color_id), color) else color
+                  for color_id, color in colors.items()}
+        if not any(color is not None or color_id in self.custom for color_id, color in custom.items()):
+            return None
+        self.custom.update_colors(custom, save=False)
+        return self.custom.save
 
     def __delitem__(self, color_id):
         raise NotImplementedError()
 
     def reset_customized(self):
-        for color_id in list(self.custom.keys()):
+        for color_id in self.customized():
             self[color_id] = self.loaded[color_id]
 
+    def customized(self):
+        """ Return the ids of colors that differ from the loaded resources."""
+        if self.live:
+            # the terminal answers in lowercase while resources keep the case they were written in
+            return [color_id for color_id, color in self.colors.items()
+                    if color_id in self.loaded and not same_color(self.loaded[color_id], color)]
+        return list(self.custom.keys())
+
     def __repr__(self):
         return "{self.__class__}({colors})".format(
             self=self, colors=repr(self.colors)[1:-1]
         )
 
 
-class DictView(collections.Mapping):
+def same_color(first, second):
+    """ Return whether two Colors, or None, have the same hex code regardless of its case.
+
+    Loaded resources keep the case they were written in while colors from the journal or
+    the terminal are lowercase.
+    """
+    if first is None or second is None:
+        return first is second
+    return first.hex.lstrip('#').lower() == second.hex.lstrip('#').lower()
+
+
+class DictView(collections.abc.Mapping):
 
     def __init__(self, *dictionaries):
         self.dictionaries = dictionaries
+
+    @property
+    def all_keys(self):
         dct_keys = (dct.keys() for dct in self.dictionaries)
-        self.all_keys = functools.reduce(lambda a, b: a.union(b), dct_keys, set())
+        return functools.reduce(lambda a, b: a.union(b), dct_keys, set())
 
     def __len__(self):
         return len(self.all_keys)
@@ -203,3 +310,318 @@ class DictView(collections.Mapping):
 
 
 TERMINAL_COLORS = _TermColors()
+
+
+def set_color(color_id, color):
+    """ Set a color of the current terminal and keep the sequence cache up to date."""
+    apply_colors({color_id: color})
+
+
+def apply_colors(colors, kind=xthematic.journal.COLOR_CHANGE, record=True, everywhere=False, steps=()):
+    """ Set several colors of the current terminal.
+
+    Unless record is False the change is appended to the session's journal so it can be undone.
+    If everywhere is True the colors are also sent to every other terminal of the user (or
+    to every pane and client of the tmux session) and the number of those is returned.
+
+    The terminal is written to first. The bookkeeping - saving the custom colors and the
+    sequence cache - and the (name, function) steps run after it at the same time, see
+    xthematic.pipeline. If any of them fails the old colors are restored and
+    xthematic.pipeline.PipelineError is raised with the results of all of them. The change is
+    only journaled once all of them succeeded.
+
+    Inside batched() the change is only queued and None is returned. Of the steps only the
+    last one of each name is run at the end of the block.
+    """
+    colors = sorted_colors(colors)
+    old = {color_id: TERMINAL_COLORS[color_id] for color_id in colors if color_id in TERMINAL_COLORS}
+    if _batch is not None:
+        _batch.add(colors, old, kind, record, everywhere, steps)
+        return None
+    return _commit(colors, old, kind, record, everywhere, steps)
+
+
+def _commit(colors, old, kind, record, everywhere, steps=()):
+    """ Apply colors and run the bookkeeping and steps, restoring the old colors if any of it fails."""
+    save = TERMINAL_COLORS.write(colors)
+    reached = []
+    pipeline = []
+    if save is not None:
+        pipeline.append(('custom colors', save))
+    if colors:
+        current = {**TERMINAL_COLORS._applied, **colors}
+        pipeline.append(('sequence cache', functools.partial(refresh_sequence_cache, current)))
+    if everywhere:
+        pipeline.append(('other terminals', lambda: reached.append(TERMINAL_COLORS.backend.apply_everywhere(colors))))
+    pipeline.extend(steps)
+    try:
+        xthematic.pipeline.check(xthematic.pipeline.run(pipeline))
+    except BaseException:
+        _restore(old, everywhere)
+        raise
+    changes = [(color_id.id, old[color_id].hex, color.hex) for color_id, color in colors.items()
+               if color_id in old and old[color_id] != color]
+    if record and changes:
+        with xthematic.profiling.span('journal', category='file'):
+            session_journal().record(changes, kind=kind)
+    return reached[0] if everywhere else None
+
+
+def _restore(old, everywhere):
+    steps = [functools.partial(TERMINAL_COLORS.apply, old), refresh_sequence_cache]
+    if everywhere:
+        steps.append(functools.partial(TERMINAL_COLORS.backend.apply_everywhere, old))
+    for step in steps:
+        try:
+            step()
+        except Exception:
+            logger.exception('could not restore the colors %s', old)
+
+
+class _Batch:
+    """ Palette changes queued by apply_colors inside batched()."""
+
+    def __init__(self):
+        self.colors = {}
+        self.old = {}
+        self.kind = xthematic.journal.COLOR_CHANGE
+        self.record = True
+        self.everywhere = False
+        self.deferred = {}
+
+    def add(self, colors, old, kind, record, everywhere, steps=()):
+        if self.colors and (record, everywhere) != (self.record, self.everywhere):
+            self.flush_colors()
+        self.record, self.everywhere = record, everywhere
+        for color_id, color in old.items():
+            self.old.setdefault(color_id, color)
+        self.colors.update(colors)
+        if kind == xthematic.journal.THEME_CHANGE:
+            self.kind = kind
+        for name, function in steps:
+            self.deferred.pop(name, None)
+            self.deferred[name] = function
+        TERMINAL_COLORS.pending = self.colors
+
+    def flush_colors(self, steps=()):
+        colors, old = sorted_colors(self.colors), self.old
+        kind, record, everywhere = self.kind, self.record, self.everywhere
+        self.colors, self.old, self.kind = {}, {}, xthematic.journal.COLOR_CHANGE
+        TERMINAL_COLORS.pending = None
+        if colors or steps:
+            _commit(colors, old, kind, record, everywhere, steps)
+
+    def flush(self):
+        deferred, self.deferred = self.deferred, {}
+        self.flush_colors(steps=list(deferred.items()))
+
+
+_batch = None
+
+
+@contextlib.contextmanager
+def batched():
+    """ Coalesce the palette changes made inside the block.
+
+    All apply_colors calls - and so set_color, theme activations and resets - are queued and
+    applied at the end of the block with one write to the terminal, one write of the custom
+    colors, one journal record and one refresh of the sequence cache. Reads of TERMINAL_COLORS
+    inside the block already see the queued colors. Nested blocks join the outermost one.
+    """
+    global _batch
+    if _batch is not None:
+        yield _batch
+        return
+    _batch = _Batch()
+    try:
+        yield _batch
+    finally:
+        batch, _batch = _batch, None
+        batch.flush()
+
+
+def flush():
+    """ Apply the changes queued by batched() so far."""
+    if _batch is not None:
+        _batch.flush()
+
+
+class Session(collections.abc.MutableMapping):
+    """ Palette changes that are applied together or not at all.
+
+    Colors set on a session are only collected - reading them back returns the collected
+    values - until commit() applies them with one write to the terminal and one round of
+    bookkeeping. rollback() drops the collected changes and restores the colors the
+    committed ones replaced. Used as a context manager the session commits when the block
+    ends and rolls back when it raises.
+
+    Keys are ColorIdentifier or int color ids and values Color or hex codes.
+    """
+
+    def __init__(self, kind=xthematic.journal.COLOR_CHANGE, record=True, everywhere=False):
+        self.kind = kind
+        self.record = record
+        self.everywhere = everywhere
+        self.changes = {}
+        self.originals = {}  # colors replaced by the committed changes
+
+    @staticmethod
+    def _color_id(color_id):
+        if isinstance(color_id, xthematic.colors.ColorIdentifier):
+            return color_id
+        return xthematic.colors.ColorIdentifier(color_id)
+
+    def __getitem__(self, color_id):
+        color_id = self._color_id(color_id)
+        if color_id in self.changes:
+            return self.changes[color_id]
+        return TERMINAL_COLORS[color_id]
+
+    def __setitem__(self, color_id, color):
+        if not isinstance(color, xthematic.colors.Color):
+            color = xthematic.colors.Color(color)
+        self.changes[self._color_id(color_id)] = color
+
+    def __delitem__(self, color_id):
+        """ Drop a collected change - a committed color can only be restored with rollback()."""
+        del self.changes[self._color_id(color_id)]
+
+    def __iter__(self):
+        yield from set(TERMINAL_COLORS).union(self.changes)
+
+    def __len__(self):
+        return len(set(TERMINAL_COLORS).union(self.changes))
+
+    def commit(self, steps=()):
+        """ Apply the collected changes and return the number of terminals reached like apply_colors.
+
+        steps are run after the terminal is written to, together with the bookkeeping. If they
+        fail apply_colors already restored the colors of this commit, so only those of earlier
+        commits are left for rollback().
+        """
+        changes, self.changes = self.changes, {}
+        new = [color_id for color_id in changes if color_id not in self.originals and color_id in TERMINAL_COLORS]
+        for color_id in new:
+            self.originals[color_id] = TERMINAL_COLORS[color_id]
+        try:
+            return apply_colors(changes, kind=self.kind, record=self.record, everywhere=self.everywhere,
+                                steps=steps)
+        except xthematic.pipeline.PipelineError:
+            for color_id in new:
+                del self.originals[color_id]
+            raise
+
+    def rollback(self):
+        """ Drop the collected changes and restore the colors of the committed ones."""
+        originals, self.originals = self.originals, {}
+        self.changes.clear()
+        if originals:
+            apply_colors(originals, record=self.record, everywhere=self.everywhere)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.rollback()
+            return
+        try:
+            self.commit()
+        except BaseException:
+            self.rollback()
+            raise
+
+
+def session(kind=xthematic.journal.COLOR_CHANGE, record=True, everywhere=False):
+    """ Return a Session for changing several colors of the current terminal at once.
+
+        with xthematic.session() as palette:
+            palette[1] = '#cc6666'
+            palette[2] = '#b5bd68'
+
+    :param kind: journal record kind of the changes, see xthematic.journal
+    :param record: whether the changes are journaled so that `xthematic undo` can revert them
+    :param everywhere: also apply the changes to all other terminals of the user
+    """
+    return Session(kind=kind, record=record, everywhere=everywhere)
+
+
+def reset_customized():
+    """ Reset every customized color of this session to its loaded value."""
+    flush()
+    apply_colors({color_id: LOADED_COLORS[color_id] for color_id in TERMINAL_COLORS.customized()})
+
+
+def session_journal():
+    """ Return the xthematic.journal.Journal of this terminal session."""
+    name = re.sub(r'[^\w.-]', '_', xthematic.config.TERMINAL_SESSION_ID)
+    return xthematic.journal.Journal(xthematic.config.USER_JOURNAL_DIR / name)
+
+
+def _replay(record, undo):
+    colors = {xthematic.colors.ColorIdentifier(c.slot): xthematic.colors.Color(c.old if undo else c.new)
+              for c in record.changes}
+    apply_colors(colors, record=False)
+
+
+def undo(steps=1, until_kind=None):
+    """ Undo the last steps journaled palette changes and return how many were undone.
+
+    If until_kind is given undo until the last record of that kind has been undone instead,
+    or nothing if there is no such record.
+    """
+    flush()
+    journal = session_journal()
+    if until_kind is not None:
+        steps = journal.undo_steps(until_kind)
+    done = 0
+    while done < steps:
+        record = journal.undo()
+        if record is None:
+            break
+        _replay(record, undo=True)
+        done += 1
+    return done
+
+
+def redo(steps=1):
+    """ Redo up to steps undone palette changes and return how many were redone."""
+    flush()
+    journal = session_journal()
+    done = 0
+    while done < steps:
+        record = journal.redo()
+        if record is None:
+            break
+        _replay(record, undo=False)
+        done += 1
+    return done
+
+
+def sorted_colors(colors):
+    return dict(sorted(colors.items(), key=lambda item: item[0].id))
+
+
+@xthematic.profiling.traced('sequences.refresh', category='file')
+def refresh_sequence_cache(colors=None):
+    """ Store the escape sequence that sets colors (TERMINAL_COLORS by default) in USER_SEQUENCE_FILE.
+
+    The file is rewritten only if the sequence changed. Shells can `cat` it into new terminals
+    to theme them without running python.
+    Returns True if the file was rewritten.
+    """
+    colors = TERMINAL_COLORS if colors is None else colors
+    sequence = xthematic.backends.osc4_sequence(sorted_colors(colors))
+    file = xthematic.config.USER_SEQUENCE_FILE
+    try:
+        with open(file, mode='r', encoding='ascii') as f:
+            if f.read() == sequence:
+                return False
+    except (OSError, ValueError):
+        pass
+    tmp = f'{file}.tmp'
+    with open(tmp, mode='w', encoding='ascii') as f:
+        f.write(sequence)
+    os.replace(tmp, file)
+    logger.debug('rewrote escape sequence cache %s', file)
+    return True
@@ -1,14 +1,31 @@
+import collections
+import fnmatch
+import functools
 import itertools
+import json
+import logging
 import os
-import subprocess
-
-import xrp
-import xrp.parser
+import pathlib
+import re
 
+import xthematic.backends
+import xthematic.bundle
 import xthematic.colors
 import xthematic.config
+import xthematic.contrast
+import xthematic.exporters
+import xthematic.index
+import xthematic.journal
+import xthematic.palette
+import xthematic.pipeline
+import xthematic.preprocess
+import xthematic.profiling
+import xthematic.resources
+import xthematic.similarity
 import xthematic.term
 
+logger = logging.getLogger(__name__)
+
 AUTO_GENERATED_TEMPLATE = (
     "! auto generated colors from xthematic\n"
     "!\n"
@@ -42,16 +59,10 @@ class ThemeContents:
         return cls(colormap=dct, _text=string)
 
     @staticmethod
+    @xthematic.profiling.traced('theme.parse', category='parse')
     def colors_of_string(string):
-        parsed = xrp.parse(string)
-        dct = {}
-        for color_id in xthematic.colors.ColorIdentifier.all_resources():
-            try:
-                hex_code = parsed.resources['*' + color_id.resource_id]
-                dct[color_id] = xthematic.colors.Color(hex_code)
-            except KeyError:
-                pass
-        return dct
+        # the same parser as the theme index, so both see the same palette in a file
+        return xthematic.palette.to_colormap(xthematic.palette.parse_resources(string))
 
     @staticmethod
     def string_from_colors(colormap):
@@ -66,50 +77,517 @@ class ThemeContents:
         return self._text
 
 
+_theme_index = None
+
+
+def theme_index():
+    """ Return the xthematic.index.ThemeIndex of USER_THEME_DIR.
+
+    The index is brought up to date with the theme directory once per process, when it is
+    first needed. The functions of this module that write or remove themes update it
+    themselves, so later lookups are dict accesses no matter how many themes there are.
+    """
+    global _theme_index
+    if _theme_index is None:
+        with xthematic.profiling.span('index.load', category='file'):
+            index = xthematic.index.ThemeIndex.load(xthematic.config.USER_INDEX_FILE,
+                                                    xthematic.config.USER_THEME_DIR)
+        with xthematic.profiling.span('index.refresh', category='file'):
+            index.refresh()
+            changed = index.dirty
+            index.save()
+        if changed:
+            # themes were edited outside of xthematic since the last run
+            store = _vector_store()
+            store.sync(index)
+            store.save()
+        _theme_index = index
+    return _theme_index
+
+
+def theme_palettes(pattern=None):
+    """ Yield (name, palette) pairs of the valid saved themes in name order.
+
+    :param pattern: optional shell style pattern the theme names must match
+    """
+    index = theme_index()
+    for name in index:
+        if pattern and not fnmatch.fnmatchcase(name, pattern):
+            continue
+        palette = index.palette(name)
+        if palette is not None:
+            yield name, palette
+
+
+def current_theme_names():
+    """ Return the names of saved themes whose colors are the current terminal colors."""
+    palette = xthematic.palette.from_colormap(xthematic.term.TERMINAL_COLORS)
+    return theme_index().names_for(palette)
+
+
+def audit_themes(names=(), method='wcag', minimum=None):
+    """ Return the xthematic.contrast.AuditResult of every named theme, or of all saved themes."""
+    index = theme_index()
+    if names:
+        for name in names:
+            if name not in index or index.palette(name) is None:
+                raise FileNotFoundError(f"there is no valid theme {name!r}")
+        named_palettes = [(name, index.palette(name)) for name in names]
+    else:
+        named_palettes = list(theme_palettes())
+    with xthematic.profiling.span('audit', category='compute'):
+        return xthematic.contrast.audit(named_palettes, method=method, minimum=minimum)
+
+
+def _vector_store():
+    return xthematic.similarity.VectorStore.load(xthematic.config.USER_VECTORS_FILE)
+
+
+def _update_vectors(index, palettes=(), old_hashes=()):
+    """ Add the vectors of just saved palettes and drop those of old_hashes no theme has anymore."""
+    store = _vector_store()
+    store.add({xthematic.palette.palette_hash(palette): palette for palette in palettes})
+    store.discard(palette_hash for palette_hash in old_hashes if not index.names_for_hash(palette_hash))
+    store.save()
+
+
+def _palette_hash_of(index, name):
+    return index.entries[name]['hash'] if name in index else None
+
+
+def similar_themes(theme_name, k=10):
+    """ Return (name, distance) pairs of the k saved themes that look the most like theme_name."""
+    index = theme_index()
+    if theme_name not in index or index.palette(theme_name) is None:
+        raise FileNotFoundError(f"there is no valid theme {theme_name!r}")
+    store = _vector_store()
+    with xthematic.profiling.span('similarity.search', category='search'):
+        result = xthematic.similarity.similar_themes(index, store, index.palette(theme_name), k=k,
+                                                     exclude=[theme_name])
+    store.save()
+    return result
+
+
+def themes_near_color(color, k=10):
+    """ Return (name, distance) pairs of the k saved themes with a color closest to color."""
+    store = _vector_store()
+    with xthematic.profiling.span('similarity.search', category='search'):
+        result = xthematic.similarity.themes_near_color(theme_index(), store, color.hex, k=k)
+    store.save()
+    return result
+
+
 def save_terminal_colors(theme_name, overwrite=False):
+    save_theme(theme_name, xthematic.term.TERMINAL_COLORS, overwrite=overwrite)
+
+
+def save_theme(theme_name, colormap, overwrite=False):
+    """ Save a ColorIdentifier -> Color mapping as a theme.
+
+    Raises FileExistsError if the theme exists and overwrite is False or if another
+    theme already has exactly the same colors.
+    """
     theme_file = xthematic.config.USER_THEME_DIR / theme_name
     if theme_file.exists() and not overwrite:
-        raise FileExistsError(r'there already exists a theme {theme_name!r}')
-    string = AUTO_GENERATED_TEMPLATE.format(ThemeContents.string_from_colors(xthematic.term.TERMINAL_COLORS))
+        raise FileExistsError(f'there already exists a theme {theme_name!r}')
+    palette = xthematic.palette.from_colormap(colormap)
+    index = theme_index()
+    duplicates = [name for name in index.names_for(palette) if name != theme_name]
+    if duplicates:
+        raise FileExistsError(f'the colors are already saved as theme {duplicates[0]!r}')
+    string = AUTO_GENERATED_TEMPLATE.format(xthematic.palette.resource_text(palette))
+    old_hash = _palette_hash_of(index, theme_name)
     try:
         _write_text(theme_file, string)
     except Exception:
         if theme_file.exists():
             os.remove(theme_file)
         raise
+    index.add(theme_name, palette)
+    index.save()
+    _update_vectors(index, [palette], [old_hash])
+
+
+ImportReport = collections.namedtuple('ImportReport', ['imported', 'duplicates', 'errors'])
+
+
+class UnsupportedSource(ValueError):
+    pass
+
+
+def import_themes(source, jobs=None):
+    """ Import every theme file from a directory, a tar/zip archive or a bundle into USER_THEME_DIR.
+
+    Files are parsed across a pool of jobs processes (number of cores by default) and
+    written in the canonical format. Palettes that are already saved are skipped.
+
+    :param source: path to a directory or archive of .Xresources style files
+    :return: ImportReport of (source path, theme name) pairs for imported and duplicate
+    themes and (source path, message) pairs for files that couldn't be parsed.
+    Raises UnsupportedSource if source is neither a directory, a bundle nor an archive.
+    """
+    import tempfile
+
+    source = pathlib.Path(source)
+    if source.is_dir():
+        return _import_from_dir(source, jobs=jobs)
+    if xthematic.bundle.is_bundle(source):
+        return _import_from_bundle(source)
+    with tempfile.TemporaryDirectory() as tmp:
+        _extract_archive(source, tmp)
+        report = _import_from_dir(pathlib.Path(tmp), jobs=jobs)
+    return ImportReport(
+        imported=[(_archive_member(source, tmp, p), n) for p, n in report.imported],
+        duplicates=[(_archive_member(source, tmp, p), n) for p, n in report.duplicates],
+        errors=[(_archive_member(source, tmp, p), e) for p, e in report.errors],
+    )
+
+
+def _import_from_dir(directory, jobs=None):
+    files = sorted(str(p) for p in directory.rglob('*') if p.is_file() and not p.name.startswith('.'))
+    with xthematic.profiling.span('import.parse', category='parse'):
+        parsed = _parse_files(files, parse=xthematic.palette.parse_theme_file, jobs=jobs)
+    return _save_parsed(parsed, name_for=lambda path: _theme_name_for(pathlib.Path(path)))
+
+
+def _import_from_bundle(path):
+    with xthematic.bundle.Bundle(path) as bundle:
+        names = {f'{path}:{name}': name for name in bundle}
+        parsed = [(f'{path}:{name}', palette, None) for name, palette in bundle.items()]
+    return _save_parsed(parsed, name_for=lambda member: _safe_theme_name(names[member]))
+
+
+def export_bundle(path, pattern=None):
+    """ Write the saved themes, or those whose names match pattern, to a bundle at path.
+
+    :return: the content hash of the bundle
+    """
+    named_palettes = list(theme_palettes(pattern))
+    with xthematic.profiling.span('bundle.write', category='file'):
+        return xthematic.bundle.write_bundle(path, named_palettes)
+
+
+def _save_parsed(parsed, name_for):
+    """ Save (path, palette, error message) results under unique names and return an ImportReport."""
+    index = theme_index()
+    imported, duplicates, errors = [], [], []
+    for path, palette, error in parsed:
+        if error:
+            errors.append((path, error))
+            continue
+        existing = index.names_for(palette)
+        if existing:
+            duplicates.append((path, existing[0]))
+            continue
+        name = _unique_theme_name(name_for(path))
+        text = AUTO_GENERATED_TEMPLATE.format(xthematic.palette.resource_text(palette))
+        _write_text(xthematic.config.USER_THEME_DIR / name, text)
+        index.add(name, palette)
+        imported.append((path, name, palette))
+    index.save()
+    _update_vectors(index, [palette for _, _, palette in imported])
+    imported = [(path, name) for path, name, _ in imported]
+    return ImportReport(imported=imported, duplicates=duplicates, errors=errors)
+
+
+def _parse_files(paths, parse, jobs=None, min_per_job=2):
+    """ Return a list of parse(path) results in the order of paths.
+
+    parse must be a module level function returning (path, palette, error message) tuples
+    like xthematic.palette.parse_theme_file so that it can be called in worker processes.
+    """
+    return _map_jobs(parse, paths, jobs=jobs, min_per_job=min_per_job)
+
+
+def _map_jobs(function, items, jobs=None, min_per_job=2):
+    """ Return [function(item) for item in items], computed across a pool of jobs processes
+    (number of cores by default) if there are at least min_per_job items per job.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(items) < min_per_job * jobs:
+        return [function(item) for item in items]
+    import concurrent.futures
+
+    chunksize = max(1, len(items) // (jobs * 4))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(function, items, chunksize=chunksize))
+
+
+ExportReport = collections.namedtuple('ExportReport', ['written', 'unchanged'])
+
+
+def export_theme(theme_name, format_name):
+    """ Return the text of the saved theme theme_name in the format format_name of xthematic.exporters."""
+    index = theme_index()
+    if theme_name not in index or index.palette(theme_name) is None:
+        raise FileNotFoundError(f"there is no theme {theme_name!r}")
+    palette = index.palette(theme_name)
+    cache = xthematic.exporters.ExportCache(xthematic.config.USER_EXPORT_CACHE_DIR)
+    key = xthematic.exporters.cache_key(theme_name, xthematic.palette.palette_hash(palette), format_name)
+    text = cache.get(key)
+    if text is None:
+        text = xthematic.exporters.compile_palette(theme_name, palette, [format_name])[format_name]
+        cache.put(key, text)
+    return text
+
+
+def export_themes(directory, formats, pattern=None, jobs=None):
+    """ Write the saved themes, or those whose names match pattern, to directory in every format.
+
+    Files are named THEME.EXTENSION. A file is only written if its theme changed since it
+    was last exported there or if the file itself was changed or removed. Texts that aren't
+    cached yet are compiled across a pool of jobs processes when there are many of them.
+
+    :return: ExportReport of the paths written and the paths that were already up to date
+    """
+    directory = os.path.abspath(str(directory))
+    os.makedirs(directory, exist_ok=True)
+    cache = xthematic.exporters.ExportCache(xthematic.config.USER_EXPORT_CACHE_DIR)
+    manifest_file = os.path.join(str(xthematic.config.USER_EXPORT_CACHE_DIR), 'manifest.json')
+    manifest = _read_json(manifest_file)
+    outputs, unchanged = [], []  # (name, palette, format name, key, path)
+    for name, palette in theme_palettes(pattern):
+        palette_hash = xthematic.palette.palette_hash(palette)
+        for format_name in formats:
+            path = os.path.join(directory, f'{name}.{xthematic.exporters.FORMATS[format_name].extension}')
+            key = xthematic.exporters.cache_key(name, palette_hash, format_name)
+            if manifest.get(path) == [key, _file_stat(path)]:
+                unchanged.append(path)
+            else:
+                outputs.append((name, palette, format_name, key, path))
+    texts = {key: cache.get(key) for _, _, _, key, _ in outputs}
+    missing = collections.OrderedDict()  # name -> (name, palette, format names)
+    keys = {}  # (name, format name) -> key
+    for name, palette, format_name, key, _ in outputs:
+        if texts[key] is None:
+            missing.setdefault(name, (name, palette, []))[2].append(format_name)
+            keys[name, format_name] = key
+    with xthematic.profiling.span('export.compile', category='parse'):
+        compiled = _map_jobs(xthematic.exporters.compile_job, list(missing.values()), jobs=jobs, min_per_job=64)
+    for name, format_texts in compiled:
+        for format_name, text in format_texts.items():
+            key = keys[name, format_name]
+            cache.put(key, text)
+            texts[key] = text
+    with xthematic.profiling.span('export.write', category='file'):
+        for _, _, _, key, path in outputs:
+            _write_text(path, texts[key])
+            manifest[path] = [key, _file_stat(path)]
+    if outputs:
+        os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+        _write_json(manifest_file, manifest)
+    return ExportReport(written=[path for *_, path in outputs], unchanged=unchanged)
+
+
+def _file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _read_json(file):
+    try:
+        with open(file, mode='r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(file, data):
+    tmp = f'{file}.tmp'
+    with open(tmp, mode='w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, file)
+
+
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.tif', '.tiff')
+
+
+def theme_from_image(theme_name, image, overwrite=False):
+    """ Generate a theme from the colors of an image and save it as theme_name.
+
+    Raises FileExistsError like save_theme.
+    """
+    import xthematic.extract
+
+    with xthematic.profiling.span('extract', category='parse'):
+        palette = xthematic.extract.palette_from_image(image)
+    save_theme(theme_name, xthematic.palette.to_colormap(palette), overwrite=overwrite)
+    return palette
+
+
+def themes_from_images(directory, prefix='', jobs=None):
+    """ Generate a theme for every image in directory, extracting palettes across a process pool.
 
+    Themes are named after the image files, prefixed with prefix. Palettes that are already
+    saved are skipped.
 
-def activate_theme(name, permanent=True, link_file=None):
+    :return: ImportReport like import_themes
+    """
+    import xthematic.extract
+
+    directory = pathlib.Path(directory)
+    files = sorted(str(p) for p in directory.rglob('*')
+                   if p.is_file() and p.suffix.lower() in IMAGE_SUFFIXES and not p.name.startswith('.'))
+    with xthematic.profiling.span('extract', category='parse'):
+        # decoding an image costs far more than starting a worker, so the pool is used sooner
+        extracted = _parse_files(files, parse=xthematic.extract.extract_palette, jobs=jobs, min_per_job=1)
+    return _save_parsed(extracted, name_for=lambda path:
+                        prefix + _theme_name_for(pathlib.Path(path).with_suffix('')))
+
+
+def _theme_name_for(path):
+    name = path.name
+    for suffix in ('.Xresources', '.xresources', '.Xdefaults', '.txt'):
+        if name.endswith(suffix) and len(name) > len(suffix):
+            name = name[:-len(suffix)]
+            break
+    if name in ('colors', 'theme'):
+        # generic names like pywal's colors.Xresources are named after their directory
+        name = f'{path.parent.name}-{name}'
+    return _safe_theme_name(name)
+
+
+def _safe_theme_name(name):
+    return re.sub(r'[^\w.+-]', '_', name).lstrip('.') or 'theme'
+
+
+def _unique_theme_name(name):
+    candidate = name
+    for k in itertools.count(2):
+        if not (xthematic.config.USER_THEME_DIR / candidate).exists():
+            return candidate
+        candidate = f'{name}-{k}'
+
+
+def _extract_archive(archive, directory):
+    import tarfile
+    import zipfile
+
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            zf.extractall(directory)
+    elif tarfile.is_tarfile(archive):
+        with tarfile.open(archive) as tf:
+            members = [m for m in tf.getmembers() if m.isfile() and _is_safe_member(m.name)]
+            tf.extractall(directory, members=members)
+    else:
+        raise UnsupportedSource(f"{archive} is neither a directory, a bundle nor a tar or zip archive")
+
+
+def _is_safe_member(name):
+    parts = pathlib.PurePosixPath(name).parts
+    return not name.startswith('/') and '..' not in parts
+
+
+def _archive_member(archive, tmp, path):
+    return f'{archive}:{os.path.relpath(path, tmp)}'
+
+
+def activate_theme(name, permanent=True, link_file=None, everywhere=False):
     """
     :param name: name of the theme file in xthematic.config.USER_THEME_DIR
     :param permanent: boolean flag whether the resources should be loaded and
     the theme included in the ~/.Xresources file
     :param link_file: a link_file to configure pointing to the theme file. Does not modify
     the ~/.Xresources file if parameter is present.
+    :param everywhere: also activate the theme in all other open terminals
     :return: None
+
+    The palette is written to the terminal first. Making the theme permanent - including it in
+    the resources or relinking link_file and loading them with xrdb - then runs at the same time
+    as the rest of the bookkeeping, see xthematic.term.apply_colors. If any of it fails the
+    terminal's old colors and the old resources are restored and
+    xthematic.pipeline.PipelineError is raised.
     """
-    terminal_theme = ThemeContents(xthematic.term.TERMINAL_COLORS)
-    activate_theme_in_terminal(name)
-    if permanent:
-        if link_file:
+    with _theme_session(everywhere) as palette:
+        palette.update(theme_colors(theme_name=name))
+        if permanent:
+            undo = []
+            make_permanent = functools.partial(_make_permanent, name, link_file, undo)
+            try:
+                palette.commit(steps=[('resources', make_permanent)])
+            except xthematic.pipeline.PipelineError:
+                for function in undo:
+                    function()
+                raise
+
+
+def _make_permanent(name, link_file=None, undo=None):
+    """ Include the theme in the resources, or point link_file at it, and load the resources.
+
+    If loading the resources fails the change is reverted right away, otherwise the function
+    that reverts it is appended to undo - for when one of the other steps fails.
+    """
+    if link_file:
+        previous = os.readlink(link_file) if os.path.islink(link_file) else None
+        tmp = backup_file_path(file_path=link_file)
+        os.symlink(xthematic.config.USER_THEME_DIR / name, tmp)
+        os.rename(src=tmp, dst=link_file)
+        revert = functools.partial(_restore_link, link_file, previous)
+        include_dirs = ()
+    else:
+        resource_file = xthematic.config.USER_XRESOURCES_FILE
+        previous = _read_text(resource_file)
+        include_theme_in_resources(name, resource_file)
+        revert = functools.partial(_restore_resources, previous)
+        include_dirs = [xthematic.config.USER_THEME_DIR]
+    try:
+        load_resources(include_dirs=include_dirs)
+    except BaseException:
+        revert()
+        raise
+    if undo is not None:
+        undo.append(revert)
+
+
+def _restore_link(link_file, target):
+    try:
+        if target is None:
+            os.remove(link_file)
+        else:
             tmp = backup_file_path(file_path=link_file)
-            os.symlink(xthematic.config.USER_THEME_DIR / name, tmp)
+            os.symlink(target, tmp)
             os.rename(src=tmp, dst=link_file)
-            subprocess.check_call(['xrdb', '-load', xthematic.config.USER_XRESOURCES_FILE])
-        else:
-            include_theme_in_resources(name, xthematic.config.USER_XRESOURCES_FILE)
-            include = '-I' + str(xthematic.config.USER_THEME_DIR)
-            subprocess.check_call(['xrdb', include, '-load', xthematic.config.USER_XRESOURCES_FILE])
-        _write_text(xthematic.config.USER_OLD_THEME_FILE, '')  # truncate
-    else:
-        _write_text(xthematic.config.USER_OLD_THEME_FILE, terminal_theme.text)
+            load_resources()
+    except Exception:
+        logger.exception('could not point %s back to %s', link_file, target)
+
+
+def _restore_resources(text):
+    try:
+        _write_text(xthematic.config.USER_XRESOURCES_FILE, text)
+        load_resources(include_dirs=[xthematic.config.USER_THEME_DIR])
+    except Exception:
+        logger.exception('could not restore %s', xthematic.config.USER_XRESOURCES_FILE)
+
+
+def _theme_session(everywhere=False):
+    return xthematic.term.session(kind=xthematic.journal.THEME_CHANGE, everywhere=everywhere)
+
+
+def load_resources(include_dirs=()):
+    """ Load the user's ~/.Xresources into the X server, skipping the load if nothing changed."""
+    xthematic.preprocess.xrdb_load(xthematic.config.USER_XRESOURCES_FILE, include_dirs=include_dirs,
+                                   cache_file=xthematic.config.USER_XRDB_CACHE_FILE)
 
 
 def deactivate_theme():
-    """ Deactivate a temporary theme."""
-    for color_id, color in old_theme_colors().items():
-        xthematic.term.TERMINAL_COLORS[color_id] = color
+    """ Deactivate the last activated theme.
 
+    Undoes the journaled palette changes up to and including the last theme activation,
+    temporary or permanent. Only the terminal's colors are undone - the resources included or
+    linked by a permanent activation stay loaded and new terminals still start with the theme.
+    Without a journaled activation the snapshot of older versions is restored, if there is one.
+    """
+    if xthematic.term.undo(until_kind=xthematic.journal.THEME_CHANGE):
+        return
+    # snapshot left by versions that didn't keep a journal
+    old_colors = old_theme_colors()
+    if old_colors:
+        xthematic.term.apply_colors(old_colors, record=False)
     _write_text(xthematic.config.USER_OLD_THEME_FILE, '')  # truncate
 
 
@@ -117,10 +595,46 @@ def remove_theme(name):
     t = xthematic.config.USER_THEME_DIR / name
     if t.exists():
         os.remove(t)
+        index = theme_index()
+        old_hash = _palette_hash_of(index, name)
+        index.remove(name)
+        index.save()
+        _update_vectors(index, old_hashes=[old_hash])
     else:
         raise FileNotFoundError("can't remove a theme that doesn't exist.")
 
 
+def set_resource_color(resource_file, color_id, color):
+    """ Set one color resource of resource_file in place and return its old value or None.
+
+    See xthematic.resources - the offsets of the values are cached in USER_OFFSETS_FILE.
+    """
+    index = xthematic.resources.OffsetIndex.load(xthematic.config.USER_OFFSETS_FILE)
+    with xthematic.profiling.span('resources.set_color', category='file'):
+        old = index.set_color(str(resource_file), color_id.id, color.hex)
+    index.save()
+    return old
+
+
+def set_theme_color(theme_name, color_id, color):
+    """ Set one color of the saved theme theme_name in place and return its old value or None."""
+    theme_file = xthematic.config.USER_THEME_DIR / theme_name
+    if not theme_file.is_file():
+        raise FileNotFoundError(f"there is no theme {theme_name!r}")
+    index = theme_index()
+    old = set_resource_color(theme_file, color_id, color)
+    palette = index.palette(theme_name) if theme_name in index else None
+    if palette is not None:
+        palette = dict(palette)
+        palette[color_id.id] = xthematic.palette.normalize_hex(color.hex)
+        old_hash = _palette_hash_of(index, theme_name)
+        index.add(theme_name, palette)
+        index.save()
+        _update_vectors(index, [palette], [old_hash])
+    return old
+
+
+@xthematic.profiling.traced('resources.include_theme', category='file')
 def include_theme_in_resources(name, resource_file):
     """ Includes a theme in a resource file using an include statement.
 
@@ -129,6 +643,7 @@ def include_theme_in_resources(name, resource_file):
     theme_file = xthematic.config.USER_THEME_DIR / name
     if not theme_file.is_file():
         raise FileNotFoundError("theme file doesn't exist")
+    import xrp.parser
     incl_string = str(xrp.parser.XIncludeStatement(include_file=name))
     output_file = backup_file_path(resource_file, suffix='.out')
     with open(resource_file, mode='r', encoding='utf-8') as input_:
@@ -139,10 +654,16 @@ def include_theme_in_resources(name, resource_file):
     os.rename(output_file, resource_file)
 
 
-def activate_theme_in_terminal(name):
-    for color_id, color in theme_colors(theme_name=name).items():
-        # TODO activating a theme sets all of the themes colors as custom - perhaps rethink activation
-        xthematic.term.TERMINAL_COLORS[color_id] = color
+def activate_theme_in_terminal(name, everywhere=False):
+    # TODO activating a theme sets all of the themes colors as custom - perhaps rethink activation
+    with _theme_session(everywhere) as palette:
+        palette.update(theme_colors(theme_name=name))
+
+
+def theme_sequence(theme_name=None):
+    """ Return the escape sequence that sets the colors of a theme (the current colors by default)."""
+    colors = theme_colors(theme_name) if theme_name else xthematic.term.TERMINAL_COLORS
+    return xthematic.backends.osc4_sequence(xthematic.term.sorted_colors(colors))
 
 
 def all_themes():
@@ -210,12 +731,14 @@ def backup_file_path(file_path, suffix='.backup', can_exist=False):
         raise RuntimeError("wtf")
 
 
+@xthematic.profiling.traced('file.write', category='file')
 def _write_text(file, text):
     """ Write to file in utf-8 encoding."""
     with open(file, mode='w', encoding='utf-8') as f:
         return f.write(text)
 
 
+@xthematic.profiling.traced('file.read', category='file')
 def _read_text(file):
     """ Read a file in utf-8 encoding."""
     with open(file, mode='r', encoding='utf-8') as f:
@@ -0,0 +1,247 @@
+""" Fixtures for running the xthematic executable against fake xrdb/tput binaries.
+
+Every benchmark gets a private HOME with its own config and theme directories and a
+bin directory that shadows the real `xrdb` and `tput` executables. The fakes keep
+the resource database in a plain file so that `xrdb -query` returns whatever dump
+a fixture wrote and `xrdb -load` replaces it.
+"""
+import json
+import os
+import pathlib
+import pty
+import select
+import statistics
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+SRC_DIR = ROOT / 'src'
+DEFAULT_BASELINES = pathlib.Path(__file__).with_name('baselines.json')
+SESSION_ID = 'bench-session-0000'
+
+FAKE_XRDB = '''\
+#!{python}
+import os, sys
+
+def resources(text, include_dirs):
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#include'):
+            name = line.split(None, 1)[1].strip('"<>')
+            for d in include_dirs:
+                if os.path.isfile(os.path.join(d, name)):
+                    with open(os.path.join(d, name)) as f:
+                        yield from resources(f.read(), include_dirs)
+                    break
+        elif line and line[0] not in '!#' and ':' in line:
+            key, value = line.split(':', 1)
+            yield key.strip() + ':\\t' + value.strip()
+
+db = os.environ['XTHEMATIC_FAKE_XRDB_DB']
+args = sys.argv[1:]
+if '-query' in args:
+    with open(db) as f:
+        sys.stdout.write(f.read())
+elif '-load' in args or '-merge' in args:
+    files = [a for a in args if not a.startswith('-')]
+    dirs = [a[2:] for a in args if a.startswith('-I')]
+    if files:
+        dirs.append(os.path.dirname(files[-1]))
+        with open(files[-1]) as f:
+            data = f.read()
+    else:
+        data = sys.stdin.read()
+    with open(db, 'w') as f:
+        f.writelines(r + '\\n' for r in resources(data, dirs))
+'''
+
+FAKE_TPUT = '''\
+#!{python}
+import os, sys
+with open(os.environ['XTHEMATIC_FAKE_TPUT_LOG'], 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\\n')
+'''
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--bench'):
+        return
+    skip = pytest.mark.skip(reason='benchmarks only run with --bench')
+    for item in items:
+        if 'benchmarks' in item.nodeid.split('/'):
+            item.add_marker(skip)
+
+
+def hex_of(k):
+    return '#{:06X}'.format((k * 2654435761) & 0xFFFFFF)
+
+
+def xrdb_dump(filler_lines=0):
+    """ Return an `xrdb -query` style dump with all 16 colors and filler resources."""
+    lines = [f'XTerm*resource{k}:\tvalue{k}' for k in range(filler_lines)]
+    lines.extend(f'*color{k}:\t{hex_of(k)}' for k in range(16))
+    return '\n'.join(lines) + '\n'
+
+
+def theme_text(seed):
+    return ''.join(f'*color{k}: {hex_of(seed * 16 + k)}\n' for k in range(16))
+
+
+class Sandbox:
+    """ An isolated environment for running the xthematic executable."""
+
+    def __init__(self, root):
+        self.root = root
+        self.home = root / 'home'
+        self.bin = root / 'bin'
+        self.config_dir = self.home / '.config' / 'xthematic'
+        self.theme_dir = self.config_dir / 'themes'
+        self.xrdb_db = root / 'xrdb.db'
+        self.tput_log = root / 'tput.log'
+        for d in (self.bin, self.theme_dir):
+            d.mkdir(parents=True, exist_ok=True)
+        self._install('xrdb', FAKE_XRDB)
+        self._install('tput', FAKE_TPUT)
+        self.xrdb_db.write_text(xrdb_dump())
+        self.tput_log.write_text('')
+        (self.home / '.Xresources').write_text('')
+        (self.config_dir / 'custom').write_text('{}')
+        (self.config_dir / 'logs').write_text('')
+
+    def _install(self, name, template):
+        exe = self.bin / name
+        exe.write_text(textwrap.dedent(template.format(python=sys.executable)))
+        exe.chmod(0o755)
+
+    @property
+    def env(self):
+        env = dict(os.environ)
+        env.update(
+            HOME=str(self.home),
+            XDG_CONFIG_HOME=str(self.home / '.config'),
+            TERM_SESSION_ID=SESSION_ID,
+            XTHEMATIC_FAKE_XRDB_DB=str(self.xrdb_db),
+            XTHEMATIC_FAKE_TPUT_LOG=str(self.tput_log),
+            PATH=str(self.bin) + os.pathsep + env.get('PATH', ''),
+            PYTHONPATH=str(SRC_DIR) + os.pathsep + env.get('PYTHONPATH', ''),
+        )
+        env.pop('XTHEMES_DIR', None)
+        env.pop('XTHEME_LINK_FILE', None)
+        return env
+
+    def add_themes(self, count):
+        for k in range(count):
+            (self.theme_dir / f'theme{k}').write_text(theme_text(k))
+
+    def add_sessions(self, count):
+        sessions = {f'session-{k}': {str(i): hex_of(k + i) for i in range(16)} for k in range(count)}
+        sessions[SESSION_ID] = {}
+        (self.config_dir / 'custom').write_text(json.dumps(sessions))
+
+    def set_resource_dump(self, filler_lines):
+        self.xrdb_db.write_text(xrdb_dump(filler_lines))
+
+    def command(self, *args):
+        return [sys.executable, '-c', 'from xthematic.fastpath import main; main()', *args]
+
+    def run(self, *args):
+        """ Run xthematic with a pty pair as its terminal and press Enter for it."""
+        master, slave = pty.openpty()
+        proc = subprocess.Popen(self.command(*args), stdin=slave, stdout=slave, stderr=subprocess.PIPE,
+                                env=self.env, cwd=str(self.root))
+        os.close(slave)
+        drainer = threading.Thread(target=_drain, args=(master, proc), daemon=True)
+        drainer.start()
+        os.write(master, b'\n')
+        _, stderr = proc.communicate(timeout=60)
+        drainer.join(timeout=5)
+        os.close(master)
+        assert proc.returncode == 0, f'xthematic {" ".join(args)} failed:\n{stderr.decode()}'
+
+    def run_python(self, code):
+        subprocess.run([sys.executable, '-c', code], env=self.env, check=True,
+                       stdout=subprocess.DEVNULL, cwd=str(self.root))
+
+
+def _drain(fd, proc):
+    while proc.poll() is None:
+        ready, _, _ = select.select([fd], [], [], 0.05)
+        if ready:
+            try:
+                os.read(fd, 65536)
+            except OSError:
+                return
+
+
+class Baselines:
+    """ Stored median timings that benchmarks are compared against."""
+
+    def __init__(self, path, tolerance, save):
+        self.path = path
+        self.tolerance = tolerance
+        self.save = save
+        self.data = json.loads(path.read_text()) if path.exists() else {}
+        self.dirty = False
+
+    def require(self, name):
+        """ Skip the benchmark name unless it has a baseline or baselines are being recorded.
+
+        Baselines depend on the machine, so a first run doesn't silently record its timings.
+        """
+        if not self.save and name not in self.data:
+            pytest.skip(f'no baseline for {name} in {self.path}, record one with --bench-save')
+
+    def check(self, name, seconds):
+        if self.save:
+            self.data[name] = seconds
+            self.dirty = True
+            return
+        self.require(name)
+        baseline = self.data[name]
+        limit = baseline * (1 + self.tolerance)
+        assert seconds <= limit, (
+            f'{name} regressed: median {seconds * 1000:.1f}ms, '
+            f'baseline {baseline * 1000:.1f}ms (limit {limit * 1000:.1f}ms)'
+        )
+
+    def flush(self):
+        if self.dirty:
+            self.path.write_text(json.dumps(self.data, indent=2, sort_keys=True) + '\n')
+
+
+@pytest.fixture(scope='session')
+def baselines(request):
+    option = request.config.getoption('--bench-baselines')
+    b = Baselines(path=pathlib.Path(option) if option else DEFAULT_BASELINES,
+                  tolerance=request.config.getoption('--bench-tolerance'),
+                  save=request.config.getoption('--bench-save'))
+    yield b
+    b.flush()
+
+
+@pytest.fixture
+def sandbox(tmp_path):
+    return Sandbox(tmp_path)
+
+
+@pytest.fixture
+def bench(baselines):
+    """ Time a callable a few times and compare its median with the stored baseline."""
+    def measure(name, fn, rounds=5):
+        baselines.require(name)
+        fn()  # warm up the page cache and compiled bytecode
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        median = statistics.median(timings)
+        baselines.check(name, median)
+        return median
+
+    return measure
@@ -0,0 +1,76 @@
+""" End to end latency of the xthematic executable.
+
+Run with `pytest --bench`; record the machine's baselines with `--bench-save` in tests/benchmarks/baselines.json.
+"""
+import pytest
+
+
+def test_import_time(sandbox, bench):
+    bench('import', lambda: sandbox.run_python('import xthematic.cli'))
+
+
+@pytest.mark.parametrize('filler', [0, 20000])
+def test_color_set(sandbox, bench, filler):
+    sandbox.set_resource_dump(filler)
+    bench(f'color-set[{filler}]', lambda: sandbox.run('color', '3', 'FF0000'))
+
+
+def test_color_view(sandbox, bench):
+    bench('color-view', lambda: sandbox.run('color', '3'))
+
+
+@pytest.mark.parametrize('sessions', [1, 5000])
+def test_color_set_many_sessions(sandbox, bench, sessions):
+    sandbox.add_sessions(sessions)
+    bench(f'color-set-sessions[{sessions}]', lambda: sandbox.run('color', '5', '00FF00'))
+
+
+@pytest.mark.parametrize('themes', [10, 2000])
+def test_theme_list(sandbox, bench, themes):
+    sandbox.add_themes(themes)
+    bench(f'theme-list[{themes}]', lambda: sandbox.run('theme', '-l'))
+
+
+@pytest.mark.parametrize('themes', [10, 2000])
+def test_theme_activate(sandbox, bench, themes):
+    sandbox.add_themes(themes)
+    bench(f'theme-activate[{themes}]', lambda: sandbox.run('theme', 'theme1', '-a'))
+
+
+def test_theme_activate_permanent(sandbox, bench):
+    sandbox.add_themes(10)
+    bench('theme-activate-permanent', lambda: sandbox.run('theme', 'theme1', '-a', '-p'))
+
+
+def test_batch(sandbox, bench):
+    sandbox.add_themes(10)
+    commands = sandbox.root / 'commands'
+    lines = [f'color {k % 16} {k:06x}' for k in range(1, 200)] + ['theme theme1 -a', 'color 3 FF0000']
+    commands.write_text('\n'.join(lines) + '\n')
+    bench('batch[201]', lambda: sandbox.run('batch', str(commands)))
+    # the palette changes of a run are applied together, one tput call per color
+    assert len(sandbox.tput_log.read_text().splitlines()) <= 16 * 5
+
+
+def test_view(sandbox, bench):
+    specs = ['FF0000:00FF00:hello', '0000FF::world', ':#123456']
+    bench('view', lambda: sandbox.run('view', *specs))
+
+
+def test_view_stream(sandbox, bench):
+    specs = sandbox.root / 'specs'
+    specs.write_text(''.join(f'{k:06x}:{0xffffff - k:06x}:line {k}\n' for k in range(20000)))
+    bench('view-stream[20000]', lambda: sandbox.run('view', '--input', str(specs)))
+
+
+@pytest.mark.parametrize('fmt', ['png', 'jpg'])
+def test_theme_from_4k_image(tmp_path, bench, fmt):
+    numpy = pytest.importorskip('numpy')
+    Image = pytest.importorskip('PIL.Image')
+    from xthematic import extract
+
+    y, x = numpy.mgrid[0:2160, 0:3840]
+    pixels = numpy.stack([x * 255 // 3840, y * 255 // 2160, (x + y) % 256], axis=2).astype(numpy.uint8)
+    path = tmp_path / f'wall.{fmt}'
+    Image.fromarray(pixels).save(path)
+    bench(f'extract-4k[{fmt}]', lambda: extract.palette_from_image(path))
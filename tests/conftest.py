@@ -1,6 +1,32 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# xthematic.config reads the environment and creates its files when it's imported - tests that
+# import it get a throwaway home and never touch the terminal or the X server
+_HOME = tempfile.mkdtemp(prefix='xthematic-tests-')
+atexit.register(shutil.rmtree, _HOME, ignore_errors=True)
+os.mkdir(os.path.join(_HOME, '.config'))
+os.environ.update(HOME=_HOME, XDG_CONFIG_HOME=os.path.join(_HOME, '.config'),
+                  TERM_SESSION_ID='test-session', XTHEMATIC_BACKEND='memory')
+for _name in ('XTHEMES_DIR', 'XTHEME_LINK_FILE', 'XTHEMATIC_LIVE_PALETTE', 'TMUX', 'STY'):
+    os.environ.pop(_name, None)
+
+
 def pytest_addoption(parser):
     parser.addoption('--repeat', action='store',
         help='Number of times to repeat each test')
+    parser.addoption('--bench', action='store_true', default=False,
+        help='Run the latency benchmarks in tests/benchmarks')
+    parser.addoption('--bench-save', action='store_true', default=False,
+        help='Overwrite the stored benchmark baselines with the measured values')
+    parser.addoption('--bench-tolerance', action='store', type=float, default=0.5,
+        help='Allowed relative slowdown against a baseline before a benchmark fails')
+    parser.addoption('--bench-baselines', action='store', default=None,
+        help='Path of the JSON file holding benchmark baselines')
 
 
 def pytest_generate_tests(metafunc):
@@ -16,3 +42,44 @@ def pytest_generate_tests(metafunc):
         # @pytest.mark.parametrize('tmp_ct', range(count))
         # def test_foo(): pass
         metafunc.parametrize('tmp_ct', range(count))
+
+
+CONFIG_FILES = {'USER_CUSTOM_FILE': 'custom', 'USER_OLD_THEME_FILE': 'old_theme', 'USER_INDEX_FILE': 'index.json',
+                'USER_OFFSETS_FILE': 'offsets.json', 'USER_VECTORS_FILE': 'vectors.bin',
+                'USER_SEQUENCE_FILE': 'sequences', 'USER_XRDB_CACHE_FILE': 'xrdb.json',
+                'USER_COLOR_NAMES_FILE': 'colornames', 'USER_COLOR_NAMES_INDEX_FILE': 'colornames.json',
+                'USER_EXPORT_CACHE_DIR': 'exports'}
+
+
+@pytest.fixture
+def xhome(tmp_path, monkeypatch):
+    """ Fresh configuration files under tmp_path and a MemoryBackend holding xterm's defaults.
+
+    Returns the backend - its writes attribute lists every batch written to the terminal.
+    """
+    from xthematic import backends, config, term, themes
+
+    config_dir = tmp_path / 'config'
+    for name in ('themes', 'journal'):
+        (config_dir / name).mkdir(parents=True)
+    for attribute, name in CONFIG_FILES.items():
+        monkeypatch.setattr(config, attribute, config_dir / name)
+    config.USER_CUSTOM_FILE.write_text('{}')
+    config.USER_OLD_THEME_FILE.write_text('')
+    monkeypatch.setattr(config, 'USER_CONFIG_DIR', config_dir)
+    monkeypatch.setattr(config, 'USER_THEME_DIR', config_dir / 'themes')
+    monkeypatch.setattr(config, 'USER_JOURNAL_DIR', config_dir / 'journal')
+    monkeypatch.setattr(config, 'USER_XRESOURCES_FILE', tmp_path / '.Xresources')
+    monkeypatch.setattr(config, 'USER_THEME_LINK_FILE', None)
+    config.USER_XRESOURCES_FILE.write_text('')
+
+    backend = backends.MemoryBackend()
+    monkeypatch.setattr(backends, '_backend', backend)
+    monkeypatch.setattr(themes, '_theme_index', None)
+    monkeypatch.setattr(term, '_batch', None)
+    monkeypatch.setattr(term.LOADED_COLORS, '_colors', None)
+    monkeypatch.setattr(term.CUSTOM_COLORS, '_colors', None)
+    monkeypatch.setattr(term.TERMINAL_COLORS, '_queried', None)
+    monkeypatch.setattr(term.TERMINAL_COLORS, 'pending', None)
+    monkeypatch.setattr(term.TERMINAL_COLORS, 'live', False)
+    return backend
@@ -0,0 +1,135 @@
+import os
+import pty
+import re
+import subprocess
+import threading
+
+from xthematic import backends, colors
+
+
+def test_colors_from_xrdb():
+    output = b'*color1:\t#FF0000\nXTerm*colorMode:\ton\nURxvt.color12:\t#0000FF\n'
+    parsed = backends.colors_from_xrdb(output)
+    assert parsed == {colors.ColorIdentifier(1): colors.Color('#FF0000'),
+                      colors.ColorIdentifier(12): colors.Color('#0000FF')}
+
+
+def test_osc4_sequence():
+    seq = backends.osc4_sequence({colors.ColorIdentifier(3): colors.Color('#FF8000')})
+    assert seq == '\033]4;3;rgb:ff/80/00\033\\'
+
+
+class TestMemoryBackend:
+    def test_defaults(self):
+        b = backends.MemoryBackend()
+        assert len(b.read_loaded()) == 16
+        assert b.query_current() == b.read_loaded()
+
+    def test_apply_batch(self):
+        b = backends.MemoryBackend()
+        change = {colors.ColorIdentifier(0): colors.Color('#123456'),
+                  colors.ColorIdentifier(1): colors.Color('#654321')}
+        b.apply_batch(change)
+        assert b.writes == [change]
+        assert b.query_current()[colors.ColorIdentifier(0)] == colors.Color('#123456')
+        assert b.read_loaded()[colors.ColorIdentifier(0)] == colors.Color('#000000')
+
+
+def test_set_backend():
+    old = backends.get_backend()
+    try:
+        b = backends.MemoryBackend()
+        backends.set_backend(b)
+        assert backends.get_backend() is b
+    finally:
+        backends.set_backend(old)
+
+
+def test_multiplexer():
+    assert backends.multiplexer({'TMUX': '/tmp/tmux-1000/default,1,0'}) == 'tmux'
+    assert backends.multiplexer({'STY': '123.pts-0.host'}) == 'screen'
+    assert backends.multiplexer({}) is None
+
+
+def test_palette_sequence_passthrough():
+    change = {colors.ColorIdentifier(1): colors.Color('#FF0000'),
+              colors.ColorIdentifier(2): colors.Color('#00FF00')}
+    plain = backends.osc4_sequence(change)
+    assert backends.palette_sequence(change) == plain
+    assert backends.palette_sequence(change, 'tmux') == \
+        '\033Ptmux;' + plain.replace('\033', '\033\033') + '\033\\'
+    assert backends.palette_sequence(change, 'screen') == (
+        '\033P\033]4;1;rgb:ff/00/00\a\033\\'
+        '\033P\033]4;2;rgb:00/ff/00\a\033\\'
+    )
+
+
+def test_tmux_ttys(monkeypatch):
+    output = (b'pane main /dev/pts/3\npane main /dev/pts/4\n'
+              b'client main /dev/pts/1\nclient other /dev/pts/2\n')
+    calls = []
+
+    def run(args, stdout, check):
+        calls.append(args)
+        return subprocess.CompletedProcess(args, 0, stdout=output)
+
+    monkeypatch.setattr(backends.subprocess, 'run', run)
+    assert backends.tmux_ttys() == ['/dev/pts/3', '/dev/pts/4', '/dev/pts/1']
+    assert len(calls) == 1
+
+
+def test_broadcast(monkeypatch, tmp_path):
+    for name in ('0', '3', '10', 'ptmx'):
+        (tmp_path / name).write_bytes(b'')
+    monkeypatch.setattr(backends, 'multiplexer', lambda: None)
+    user_ttys = backends.user_ttys
+    monkeypatch.setattr(backends, 'user_ttys', lambda: user_ttys(str(tmp_path)))
+    written = []
+
+    def write_tty(tty, data):
+        if tty.endswith('3'):
+            raise PermissionError(tty)
+        written.append((tty, data))
+
+    monkeypatch.setattr(backends, 'write_tty', write_tty)
+    change = {colors.ColorIdentifier(1): colors.Color('#FF0000')}
+    assert backends.broadcast(change) == 2
+    assert [tty for tty, _ in written] == [str(tmp_path / '0'), str(tmp_path / '10')]
+    assert written[0][1] == backends.osc4_sequence(change).encode('ascii')
+
+
+def test_colors_from_osc4_replies():
+    data = (b'\033]4;1;rgb:ffff/0000/8080\033\\'
+            b'\033]4;12;rgb:12/34/56\007'
+            b'\033]4;300;rgb:ffff/ffff/ffff\033\\\033[?62;c')
+    assert backends.colors_from_osc4_replies(data) == {
+        colors.ColorIdentifier(1): colors.Color('#ff0080'),
+        colors.ColorIdentifier(12): colors.Color('#123456'),
+    }
+
+
+def answer_queries(master, answered=(1, 2)):
+    data = b''
+    while b'\033[c' not in data:
+        data += os.read(master, 4096)
+    slots = [int(n) for n in re.findall(rb'\033\]4;(\d+);\?', data)]
+    replies = b''.join(b'\033]4;%d;rgb:%02x%02x/0000/0000\033\\' % (n, n, n) for n in slots if n in answered)
+    os.write(master, replies + b'\033[?62;c')
+
+
+def test_query_palette():
+    master, slave = pty.openpty()
+    try:
+        answering = threading.Thread(target=answer_queries, args=(master,))
+        answering.start()
+        queried = backends.query_palette(tty=os.ttyname(slave), timeout=5)
+        answering.join()
+    finally:
+        os.close(master)
+        os.close(slave)
+    assert queried == {colors.ColorIdentifier(1): colors.Color('#010000'),
+                       colors.ColorIdentifier(2): colors.Color('#020000')}
+
+
+def test_query_palette_without_tty(tmp_path):
+    assert backends.query_palette(tty=str(tmp_path / 'missing')) == {}
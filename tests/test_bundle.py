@@ -0,0 +1,72 @@
+import pytest
+
+from xthematic import bundle
+
+
+def palettes(n):
+    return [(f'theme{i:04d}', {0: f'#{i:06x}', 7: '#ffffff', 15: f'#{i % 256:02x}ab{255 - i % 256:02x}'})
+            for i in range(n)]
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'themes.xtb'
+    named = palettes(300)
+    content_hash = bundle.write_bundle(path, reversed(named))
+    with bundle.Bundle(path) as b:
+        assert len(b) == 300
+        assert b.content_hash == content_hash
+        assert list(b) == [name for name, _ in named]
+        assert list(b.items()) == named
+        assert b.palette('theme0123') == named[123][1]
+        assert 'theme0299' in b
+        assert 'theme0300' not in b and 'a' not in b and 'z' not in b
+        with pytest.raises(KeyError):
+            b.palette('missing')
+        assert b.verify()
+
+
+def test_hex_codes_are_normalized(tmp_path):
+    path = tmp_path / 'themes.xtb'
+    bundle.write_bundle(path, [('dark', {1: '#CD0000', 12: 'AbCdEf'})])
+    with bundle.Bundle(path) as b:
+        assert b.palette('dark') == {1: '#cd0000', 12: '#abcdef'}
+
+
+def test_empty_bundle(tmp_path):
+    path = tmp_path / 'themes.xtb'
+    bundle.write_bundle(path, [])
+    with bundle.Bundle(path) as b:
+        assert len(b) == 0
+        assert 'dark' not in b
+        assert list(b) == []
+
+
+def test_unicode_names_sort_by_bytes(tmp_path):
+    path = tmp_path / 'themes.xtb'
+    bundle.write_bundle(path, [('été', {0: '#000000'}), ('zebra', {0: '#111111'}), ('Ábc', {0: '#222222'})])
+    with bundle.Bundle(path) as b:
+        assert list(b) == ['zebra', 'Ábc', 'été']
+        assert b.palette('été') == {0: '#000000'}
+
+
+def test_duplicate_names(tmp_path):
+    with pytest.raises(bundle.BundleError):
+        bundle.write_bundle(tmp_path / 'themes.xtb', [('a', {}), ('a', {0: '#000000'})])
+
+
+def test_corruption(tmp_path):
+    path = tmp_path / 'themes.xtb'
+    bundle.write_bundle(path, palettes(3))
+    data = bytearray(path.read_bytes())
+    data[bundle.HEADER.size + 5] ^= 0xff
+    path.write_bytes(bytes(data))
+    with bundle.Bundle(path) as b:
+        assert not b.verify()
+
+    path.write_bytes(b'! not a bundle\n')
+    assert not bundle.is_bundle(path)
+    with pytest.raises(bundle.BundleError):
+        bundle.Bundle(path)
+    path.write_bytes(bytes(data[:bundle.HEADER.size + 10]))
+    with pytest.raises(bundle.BundleError):
+        bundle.Bundle(path)
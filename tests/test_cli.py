@@ -0,0 +1,142 @@
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from xthematic import backends, cli, colors, config, pipeline, term, themes
+
+
+def cid(number):
+    return colors.ColorIdentifier(number)
+
+
+BATCH = '''\
+# comments and blank lines are skipped
+
+color 1 111111
+color 2 #222222
+theme missing -a
+color 3 333333
+'''
+
+
+def test_batch_stops_at_the_first_failing_line(xhome):
+    result = CliRunner().invoke(cli.main, ['batch'], input=BATCH)
+    assert result.exit_code == 1
+    assert "line 5: 'theme missing -a' failed" in result.output
+    assert xhome.writes == [{cid(1): colors.Color('#111111'), cid(2): colors.Color('#222222')}]
+    assert len(term.session_journal().records()[0]) == 1
+
+
+def test_batch_keeps_going(xhome):
+    result = CliRunner().invoke(cli.main, ['batch', '--keep-going'], input=BATCH + 'color 99 000000\n')
+    assert result.exit_code == 1
+    assert 'line 5:' in result.output and 'line 7:' in result.output
+    assert xhome.writes == [{cid(k): colors.Color(f'#{k}{k}{k}{k}{k}{k}') for k in (1, 2, 3)}]
+
+
+def test_batch_exit_code_is_zero_when_every_line_succeeds(xhome):
+    result = CliRunner().invoke(cli.main, ['batch'], input='color 1 111111\ntheme --list\n')
+    assert result.exit_code == 0, result.output
+
+
+def test_readable_lines_sees_lines_that_were_already_read(tmp_path):
+    read_fd, write_fd = os.pipe()
+    try:
+        os.write(write_fd, b'one\ntwo\nthr')
+        with os.fdopen(read_fd, mode='r', encoding='utf-8', closefd=False) as file:
+            lines, ready = cli.readable_lines(file)
+            assert ready()
+            assert next(lines) == 'one\n' and ready()
+            assert next(lines) == 'two\n' and not ready()
+            os.write(write_fd, b'ee\n')
+            os.close(write_fd)
+            write_fd = None
+            assert ready() and list(lines) == ['three\n']
+    finally:
+        os.close(read_fd)
+        if write_fd is not None:
+            os.close(write_fd)
+
+    file = tmp_path / 'views'
+    file.write_bytes(b'#ff0000::a\n#00ff00::b')
+    with open(file, encoding='utf-8') as f:
+        lines, ready = cli.readable_lines(f)
+        assert list(lines) == ['#ff0000::a\n', '#00ff00::b']
+
+
+def test_view_streams_valid_lines_and_reports_invalid_ones(tmp_path):
+    file = tmp_path / 'views'
+    file.write_text('#ff0000::red\n\nnot a view\n::plain\n')
+    result = CliRunner().invoke(cli.main, ['view', '--input', str(file), '-t', 'x'])
+    assert result.exit_code == 0
+    assert result.stdout.splitlines() == ['red', 'plain']
+    assert result.stderr.startswith('line 3: ')
+
+
+def test_view_no_wait(xhome):
+    result = CliRunner().invoke(cli.main, ['view', '#123456::hello', '--no-wait'])
+    assert result.exit_code == 0, result.output
+    assert result.stdout == 'hello'
+    assert xhome.current == backends.default_palette()
+
+
+def test_batch_reports_a_failing_flush(xhome, monkeypatch):
+    (config.USER_THEME_DIR / 't1').write_text('*color0: #000000\n*color1: #123456\n')
+    config.USER_XRESOURCES_FILE.write_text('*color1: #ffffff\n')
+
+    def load_resources(include_dirs=()):
+        raise OSError('xrdb is missing')
+
+    monkeypatch.setattr(themes, 'load_resources', load_resources)
+    result = CliRunner().invoke(cli.main, ['batch'], input='color 2 222222\ntheme t1 -a -p\n')
+    assert result.exit_code == 1
+    assert 'error: resources failed after' in result.output
+    assert 'the previous colors were restored' in result.output
+    assert xhome.current == backends.default_palette()
+    assert config.USER_XRESOURCES_FILE.read_text() == '*color1: #ffffff\n'
+    assert term.session_journal().records()[0] == []
+
+
+def test_edit_fills_the_slots_the_terminal_did_not_report(xhome, monkeypatch):
+    import xthematic.editor
+    xhome.loaded = xhome.current = {cid(1): colors.Color('#111111')}
+    runs = []
+    monkeypatch.setattr(xthematic.editor, 'run', lambda palette, **kwargs: runs.append((palette, kwargs)))
+    result = CliRunner().invoke(cli.main, ['edit'])
+    assert result.exit_code == 0, result.output
+    palette, kwargs = runs[0]
+    assert sorted(palette) == list(range(16)) and sorted(kwargs['restore']) == list(range(16))
+    assert palette[1] == '#111111' and palette[0] == backends.DEFAULT_PALETTE[0].lower()
+
+
+def test_color_reports_failed_steps(xhome, monkeypatch):
+    def refresh_sequence_cache(colors=None):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(term, 'refresh_sequence_cache', refresh_sequence_cache)
+    for args in (['color', '1', '123456'], ['color', '1', '123456', '-a']):
+        result = CliRunner().invoke(cli.main, args)
+        assert result.exit_code == 1, result.output
+        assert 'error: sequence cache failed after' in result.output
+        assert 'could not set color 1, the previous colors were restored' in result.output
+    assert xhome.current == backends.default_palette()
+
+
+def test_edit_writes_the_theme_only_after_the_colors_were_applied(xhome, monkeypatch):
+    import xthematic.editor
+    theme_file = config.USER_THEME_DIR / 'dark'
+    theme_file.write_text('*color0: #000000\n*color1: #aa0000\n')
+
+    def refresh_sequence_cache(colors=None):
+        raise OSError('disk full')
+
+    def run(palette, save, **kwargs):
+        with pytest.raises(pipeline.PipelineError):
+            save({**palette, 1: '#bb0000'})
+
+    monkeypatch.setattr(term, 'refresh_sequence_cache', refresh_sequence_cache)
+    monkeypatch.setattr(xthematic.editor, 'run', run)
+    result = CliRunner().invoke(cli.main, ['edit', 'dark'])
+    assert result.exit_code == 0, result.output
+    assert theme_file.read_text() == '*color0: #000000\n*color1: #aa0000\n'
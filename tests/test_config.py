@@ -0,0 +1,39 @@
+import logging
+
+from xthematic import config
+
+
+def test_log_file_is_chosen_and_opened_on_the_first_record(tmp_path):
+    file = tmp_path / 'missing' / 'xthematic.log'
+    backup = tmp_path / 'logs'
+    handler = config.LazyLogFileHandler(file, backup=backup, maxBytes=1024, backupCount=1)
+    handler.setFormatter(logging.Formatter('{message}', style='{'))
+    assert handler.stream is None and not backup.exists()
+
+    handler.emit(logging.makeLogRecord({'msg': 'first', 'levelno': logging.INFO}))
+    handler.close()
+    assert handler.baseFilename == str(backup)
+    assert backup.read_text() == 'first\n' and not file.parent.exists()
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_queue_listener_starts_with_the_first_record(monkeypatch):
+    stops = []
+    monkeypatch.setattr(config.atexit, 'register', stops.append)
+    target = ListHandler()
+    handler = config.LazyQueueHandler(target)
+    assert handler.listener._thread is None
+
+    handler.handle(logging.makeLogRecord({'msg': 'one', 'levelno': logging.INFO}))
+    handler.handle(logging.makeLogRecord({'msg': 'two', 'levelno': logging.INFO}))
+    assert handler.listener._thread is not None and stops == [handler.listener.stop]
+    stops[0]()
+    assert target.messages == ['one', 'two']
@@ -0,0 +1,42 @@
+import pytest
+
+from xthematic import colorspace, contrast
+
+
+def test_reference_values():
+    assert contrast.wcag_contrast('#000000', '#FFFFFF') == pytest.approx(21)
+    assert contrast.wcag_contrast('#777777', '#ffffff') == pytest.approx(4.48, abs=0.01)
+    gray, white = contrast.apca_luminance('#888888'), contrast.apca_luminance('#ffffff')
+    assert contrast.apca_lc(gray, white) == pytest.approx(63.06, abs=0.01)
+    assert contrast.apca_lc(white, gray) == pytest.approx(-68.54, abs=0.01)
+    assert contrast.apca_lc(gray, gray) == 0
+
+
+@pytest.fixture(params=[True, False], ids=['numpy', 'fallback'])
+def use_numpy(request, monkeypatch):
+    if not request.param:
+        monkeypatch.setattr(colorspace, 'optional_numpy', lambda: None)
+    elif colorspace.optional_numpy() is None:
+        pytest.skip('numpy is not installed')
+
+
+@pytest.mark.parametrize('method', contrast.METHODS)
+def test_audit(use_numpy, method):
+    readable = {k: '#000000' if k < 8 else '#ffffff' for k in range(16)}
+    unreadable = {**readable, 9: '#101010'}
+    results = contrast.audit([('readable', readable), ('unreadable', unreadable)], method=method)
+    assert [r.name for r in results] == ['readable', 'unreadable']
+    # colors 1-7 on each other are black on black, only the bright colors are readable
+    assert results[0].score == pytest.approx(100 * 64 / 120)
+    assert {(f.fg, f.bg) for f in results[1].failures} - {(f.fg, f.bg) for f in results[0].failures} \
+        == {(9, bg) for bg in range(8)}
+
+
+def test_audit_minimum(use_numpy):
+    palette = {k: '#000000' if k < 8 else '#595959' for k in range(16)}
+    assert contrast.audit([('t', palette)], minimum=2.5)[0].score > contrast.audit([('t', palette)])[0].score
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        contrast.audit([], method='nope')
@@ -0,0 +1,90 @@
+import itertools
+
+import click.utils
+import pytest
+
+from xthematic import backends, colors, config, display, term
+
+SGR_RESET = '\033[0m'
+
+
+def red_bg(text):
+    return f'\033[48;2;255;0;0m{text}{SGR_RESET}'
+
+
+@pytest.fixture
+def keep_ansi(monkeypatch):
+    """ Keep the escape sequences that click strips from output that isn't a terminal."""
+    monkeypatch.setattr(click.utils, 'should_strip_ansi', lambda stream=None, color=None: False)
+
+
+def test_gallery_cell_draws_truecolor_swatches():
+    name, normal, bright = display.gallery_cell('a-very-long-theme-name-indeed', {0: '#ff0000', 9: '#ff0000'})
+    assert name == 'a-very-long-theme-name-~' and len(name) == display.GALLERY_CELL_WIDTH
+    assert normal == red_bg('   ') + ' ' * 21
+    assert bright == '   ' + red_bg('   ') + ' ' * 18
+
+
+def test_gallery_pages_only_consume_the_themes_of_a_page():
+    themes = ((f'theme{k}', {0: '#000000'}) for k in itertools.count())
+    pages = display.gallery_pages(themes, columns=3, rows=2)
+    page = next(pages)
+    assert len(page) == 2 * 4
+    assert page[0].split() == ['theme0', 'theme1', 'theme2'] and page[4].split() == ['theme3', 'theme4', 'theme5']
+    assert page[3] == page[7] == ''
+    assert next(pages)[0].split() == ['theme6', 'theme7', 'theme8']
+
+    themes = [(f'theme{k}', {}) for k in range(7)]
+    assert [len(page) for page in display.gallery_pages(themes, columns=3, rows=2)] == [8, 4]
+
+
+def test_echo_gallery_waits_between_pages(monkeypatch, capsys):
+    monkeypatch.setattr(display.shutil, 'get_terminal_size', lambda: (80, 9))
+    keys = iter(' q')
+    monkeypatch.setattr(display.click, 'getchar', lambda: next(keys))
+    display.echo_gallery([(f'theme{k}', {}) for k in range(20)], interactive=True)
+    out = capsys.readouterr().out
+    assert out.count('any key for more') == 2
+    assert 'theme11' in out and 'theme12' not in out
+
+    display.echo_gallery([(f'theme{k}', {}) for k in range(20)], interactive=False)
+    assert 'theme19' in capsys.readouterr().out
+
+
+def test_echo_palette_uses_truecolor(keep_ansi, capsys):
+    display.echo_palette({1: '#ff0000', 0: '#000000'})
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 16
+    assert lines[1].startswith('\033[38;2;255;0;0m\033[48;2;0;0;0m0;31;40' + SGR_RESET + ' ')
+    assert lines[9].startswith('\033[48;2;0;0;0m1;31;40' + SGR_RESET)
+
+
+def test_colored_context_restores_the_borrowed_slots(xhome):
+    context = display.ColoredContext()
+    context.register_color(colors.Color('#123456'))
+    context.register_color(colors.Color('#654321'))
+    context.commit()
+    assert len(xhome.writes) == 1 and len(xhome.writes[0]) == 2
+    borrowed = context.id_for_color(colors.Color('#123456'))
+    assert xhome.current[borrowed] == colors.Color('#123456')
+    # borrowed slots only reach the terminal, not the bookkeeping
+    assert term.TERMINAL_COLORS[borrowed] == backends.default_palette()[borrowed]
+    assert term.CUSTOM_COLORS.read_customized_colors() == {}
+    assert not config.USER_SEQUENCE_FILE.exists()
+
+    context.unregister_all()
+    assert len(xhome.writes) == 2
+    assert xhome.current == backends.default_palette()
+    assert term.session_journal().records() == ([], 0)
+
+
+def test_echo_lines_writes_chunks(monkeypatch):
+    writes = []
+    monkeypatch.setattr(display.click, 'echo', lambda text, **kwargs: writes.append(text))
+    display.echo_lines((str(k) for k in range(5)), chunk_lines=2)
+    assert writes == ['0\n1', '2\n3', '4']
+
+    writes.clear()
+    ready = iter([True, False, True, True])
+    display.echo_lines((str(k) for k in range(4)), chunk_lines=3, ready=lambda: next(ready))
+    assert writes == ['0\n1', '2\n3']
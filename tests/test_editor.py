@@ -0,0 +1,59 @@
+import curses
+
+import pytest
+
+from xthematic import editor
+
+PALETTE = {slot: '#102030' for slot in range(16)}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_frame_writer_coalesces_changes_within_a_frame():
+    clock, writes = Clock(), []
+    writer = editor.FrameWriter(writes.append, interval=0.1, clock=clock)
+    assert writer.due_in() is None and not writer.flush()
+    writer.add({1: '#000001'})
+    assert writer.flush()
+    for value in range(2, 50):
+        writer.add({1: f'#0000{value:02x}'})
+        writer.add({2: '#ffffff'})
+        assert not writer.flush()
+    assert writer.due_in() == pytest.approx(0.1)
+    clock.now += 0.1
+    assert writer.flush()
+    assert writes == [{1: '#000001'}, {1: '#000031', 2: '#ffffff'}]
+    writer.add({3: '#000000'})
+    assert writer.flush(force=True) and writer.writes == 3
+
+
+def test_keys_adjust_the_selected_channel():
+    e = editor.PaletteEditor(PALETTE)
+    for key in (curses.KEY_DOWN, curses.KEY_RIGHT, curses.KEY_RIGHT, ord('\t'), curses.KEY_PPAGE):
+        assert e.handle_key(key) is None
+    assert e.palette[1] == '#123030'
+    assert e.modified() == [1]
+    assert e.take_changes() == {1: '#123030'} and e.take_changes() == {}
+    e.handle_key(ord('b'))
+    for _ in range(300):
+        e.handle_key(curses.KEY_LEFT)
+    assert e.palette[1] == '#123000'
+    e.handle_key(ord('u'))
+    assert e.palette[1] == '#102030' and e.modified() == []
+    assert e.handle_key(ord('s')) == editor.SAVE and e.handle_key(ord('q')) == editor.QUIT
+
+
+def test_click_on_a_slider_sets_its_value():
+    e = editor.PaletteEditor(PALETTE)
+    green = editor.SLIDERS_X + editor.SLIDER_SPAN + 2
+    e.click(green + editor.SLIDER_WIDTH - 1, editor.HEADER_ROWS + 5)
+    assert (e.slot, e.channel) == (5, 1)
+    assert e.palette[5] == '#10ff30'
+    e.click(0, editor.HEADER_ROWS + 16)
+    assert e.slot == 5
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from xthematic import exporters, palette
+
+PALETTE = {k: '#{:02x}{:02x}{:02x}'.format(k * 16, 255 - k * 16, k) for k in range(16)}
+
+
+def test_every_format_compiles_all_slots():
+    texts = exporters.compile_palette('dark', PALETTE, list(exporters.FORMATS))
+    assert set(texts) == set(exporters.FORMATS)
+    assert palette.parse_resources(texts['kitty'].replace(' ', ': ').replace('color', '*color')) == PALETTE
+    assert 'regular1=10ef01\n' in texts['foot'] and 'bright7=f00f0f\n' in texts['foot']
+    assert '[colors.bright]\nblack = "#807f08"\n' in texts['alacritty']
+    scheme = json.loads(texts['windows-terminal'])
+    assert scheme['name'] == 'dark' and scheme['brightPurple'] == PALETTE[13]
+    assert (scheme['background'], scheme['foreground']) == (PALETTE[0], PALETTE[7])
+    base16 = dict(line.split(': ') for line in texts['base16'].splitlines())
+    assert base16['scheme'] == '"dark"' and len(base16) == 18
+    assert base16['base08'] == '"10ef01"' and base16['base0D'] == '"40bf04"'
+
+
+def test_missing_slots_are_xterm_defaults():
+    full = exporters.complete({1: '#ABCDEF'})
+    assert len(full) == 16 and full[1] == '#abcdef' and full[9] == '#ff0000'
+
+
+def test_parse_formats():
+    assert exporters.parse_formats('kitty, foot,kitty') == ['kitty', 'foot']
+    with pytest.raises(exporters.ExportError, match='nope'):
+        exporters.parse_formats('kitty,nope')
+    with pytest.raises(exporters.ExportError):
+        exporters.parse_formats(',')
+
+
+def test_cache_keys_and_cache(tmp_path):
+    palette_hash = palette.palette_hash(PALETTE)
+    assert exporters.cache_key('a', palette_hash, 'kitty') == exporters.cache_key('b', palette_hash, 'kitty')
+    assert exporters.cache_key('a', palette_hash, 'base16') != exporters.cache_key('b', palette_hash, 'base16')
+    assert exporters.cache_key('a', palette_hash, 'kitty') != exporters.cache_key('a', palette_hash, 'foot')
+    cache = exporters.ExportCache(tmp_path / 'exports')
+    assert cache.get('key') is None
+    cache.put('key', 'text')
+    assert cache.get('key') == 'text'
@@ -0,0 +1,46 @@
+import pytest
+
+numpy = pytest.importorskip('numpy')
+Image = pytest.importorskip('PIL.Image')
+
+from xthematic import contrast, extract, similarity
+
+
+def test_lab_round_trip():
+    rgb = numpy.array([[255, 0, 0], [10, 200, 30], [0, 0, 0], [255, 255, 255]], dtype=numpy.uint8)
+    lab = extract.rgb_to_lab(rgb)
+    assert lab[0] == pytest.approx(similarity.rgb_to_lab(255, 0, 0), abs=1e-3)
+    assert (extract.lab_to_rgb(lab) == rgb).all()
+
+
+def test_kmeans_finds_separate_clusters():
+    points = numpy.concatenate([numpy.full((50, 3), 10.0), numpy.full((30, 3), 80.0)])
+    centers, counts = extract.kmeans(points, k=2)
+    assert sorted(zip(counts.tolist(), centers[:, 0].round().tolist())) == [(30, 80.0), (50, 10.0)]
+
+
+def gradient(path, size, light=False):
+    height, width = size
+    y, x = numpy.mgrid[0:height, 0:width]
+    base = 200 if light else 0
+    pixels = numpy.stack([base + x * (255 - base) // width, base + y * (255 - base) // height,
+                          numpy.full((height, width), 240 if light else 120)], axis=2)
+    Image.fromarray(pixels.astype(numpy.uint8)).save(path)
+    return path
+
+
+@pytest.mark.parametrize('light', [False, True])
+def test_palette_from_image_is_readable(tmp_path, light):
+    palette = extract.palette_from_image(gradient(tmp_path / 'wall.png', (300, 500), light=light))
+    assert sorted(palette) == list(range(16))
+    assert (contrast.relative_luminance(palette[0]) > 0.5) == light
+    for slot in (1, 2, 3, 4, 5, 6, 7, 9, 10, 11, 12, 13, 14, 15):
+        assert contrast.wcag_contrast(palette[slot], palette[0]) >= extract.MIN_CONTRAST
+    assert len({palette[slot] for slot in range(1, 7)}) == 6
+
+
+def test_extract_palette_reports_errors(tmp_path):
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not an image')
+    path, palette, error = extract.extract_palette(str(broken))
+    assert palette is None and error
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from xthematic import fastpath
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+SLOW_MODULES = ('click', 'sty', 'xrp')
+
+# cumulative import time budgets in microseconds, as reported by `python -X importtime`
+IMPORT_BUDGETS = {
+    'xthematic.fastpath': 30000,
+    'xthematic.themes': 150000,
+}
+
+
+@pytest.mark.parametrize('args, expected', [
+    (['color', '3', 'FF0000'], ('set_color', {'color_id': 3, 'hex_code': '#FF0000'})),
+    (['color', '15', '#00ff00'], ('set_color', {'color_id': 15, 'hex_code': '#00ff00'})),
+    (['theme', '-l'], ('list_themes', {})),
+    (['theme', '--list'], ('list_themes', {})),
+    (['theme', 'dark', '-a'], ('activate_theme', {'name': 'dark', 'permanent': False})),
+    (['theme', '-a', '--permanent', 'dark'], ('activate_theme', {'name': 'dark', 'permanent': True})),
+    (['theme', 'dark', '-ap'], ('activate_theme', {'name': 'dark', 'permanent': True})),
+    (['bundle', 'themes.xtb'], ('list_bundle', {'path': 'themes.xtb'})),
+])
+def test_parse_fast_commands(args, expected):
+    assert fastpath.parse(args) == expected
+
+
+@pytest.mark.parametrize('args', [
+    [], ['--help'], ['color', '3'], ['color', '16', 'FF0000'], ['color', '3', 'red'],
+    ['color', '3', 'FF0000', '-a'], ['theme'], ['theme', 'dark'], ['theme', 'dark', '-p'],
+    ['theme', 'dark', '-as'], ['theme', 'a', 'b', '-a'], ['theme', '-l', 'dark'], ['view', 'FF0000'],
+    ['bundle', 'themes.xtb', 'dark'], ['bundle', '-w', 'themes.xtb'],
+    ['--profile', 'color', '3', 'FF0000'],
+])
+def test_parse_falls_back_to_click(args):
+    assert fastpath.parse(args) is None
+
+
+def import_times(module, tmp_path):
+    """ Return a dict of module name -> cumulative import time in microseconds."""
+    (tmp_path / '.config').mkdir(exist_ok=True)
+    env = dict(os.environ, HOME=str(tmp_path), XDG_CONFIG_HOME=str(tmp_path / '.config'),
+               TERM_SESSION_ID='test', PYTHONPATH=SRC_DIR)
+    env.pop('XTHEMES_DIR', None)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize('module', sorted(IMPORT_BUDGETS))
+def test_import_budget(module, tmp_path):
+    import_times(module, tmp_path)  # the first run compiles bytecode
+    times = import_times(module, tmp_path)
+    assert not [m for m in times if m.split('.')[0] in SLOW_MODULES]
+    assert times[module] < IMPORT_BUDGETS[module], f'{module} took {times[module]}us to import'
+
+
+def test_failed_activation_is_reported_without_a_traceback(xhome, monkeypatch, capsys):
+    from xthematic import config, term, themes
+    (config.USER_THEME_DIR / 't1').write_text('*color0: #000000\n*color1: #123456\n')
+    config.USER_XRESOURCES_FILE.write_text('')
+
+    def load_resources(include_dirs=()):
+        raise OSError('xrdb is missing')
+
+    monkeypatch.setattr(themes, 'load_resources', load_resources)
+    assert fastpath.main(['theme', 't1', '-ap']) == 1
+    err = capsys.readouterr().err
+    assert 'error: resources failed after' in err and 'xrdb is missing' in err
+    assert err.endswith('Error: could not activate t1, the previous colors were restored\n')
+    assert term.session_journal().records()[0] == []
+
+
+def test_failed_color_change_is_reported_without_a_traceback(xhome, monkeypatch, capsys):
+    from xthematic import backends, term
+
+    def refresh_sequence_cache(colors=None):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(term, 'refresh_sequence_cache', refresh_sequence_cache)
+    assert fastpath.main(['color', '1', '123456']) == 1
+    err = capsys.readouterr().err
+    assert 'error: sequence cache failed after' in err and 'disk full' in err
+    assert err.endswith('Error: could not set color 1, the previous colors were restored\n')
+    assert xhome.current == backends.default_palette()
@@ -0,0 +1,71 @@
+import os
+
+from xthematic import index
+
+
+def write_theme(directory, name, text):
+    path = directory / name
+    path.write_text(text)
+    return path
+
+
+def test_refresh_and_lookup(tmp_path):
+    themes = tmp_path / 'themes'
+    themes.mkdir()
+    write_theme(themes, 'a', '*color0: #000000\n*color1: #FF0000\n')
+    write_theme(themes, 'b', '*color0: #000000\n*color1: #ff0000\n')
+    write_theme(themes, 'broken', 'nothing here\n')
+    idx = index.ThemeIndex(tmp_path / 'index.json', themes).refresh()
+    assert list(idx) == ['a', 'b', 'broken']
+    assert idx.names_for({0: '#000000', 1: '#ff0000'}) == ['a', 'b']
+    assert idx.names_for({0: '#111111'}) == []
+    assert dict(idx.palettes()).keys() == {'a', 'b'}
+
+
+def test_save_load_and_incremental_refresh(tmp_path):
+    themes = tmp_path / 'themes'
+    themes.mkdir()
+    file = tmp_path / 'index.json'
+    write_theme(themes, 'a', '*color0: #000000\n')
+    idx = index.ThemeIndex(file, themes).refresh()
+    idx.save()
+
+    loaded = index.ThemeIndex.load(file, themes)
+    assert loaded.names_for({0: '#000000'}) == ['a']
+
+    os.remove(themes / 'a')
+    write_theme(themes, 'c', '*color0: #abcdef\n')
+    loaded.refresh()
+    assert list(loaded) == ['c']
+    assert loaded.names_for({0: '#000000'}) == []
+    assert loaded.names_for({0: '#ABCDEF'}) == ['c']
+
+
+def test_add_and_remove(tmp_path):
+    themes = tmp_path / 'themes'
+    themes.mkdir()
+    idx = index.ThemeIndex(tmp_path / 'index.json', themes).refresh()
+    write_theme(themes, 'new', '*color2: #00ff00\n')
+    idx.add('new', {2: '#00ff00'})
+    assert idx.names_for({2: '#00ff00'}) == ['new']
+    os.remove(themes / 'new')
+    idx.remove('new')
+    assert idx.names_for({2: '#00ff00'}) == [] and len(idx) == 0
+
+
+def test_refresh_sees_themes_edited_in_place(tmp_path):
+    themes = tmp_path / 'themes'
+    themes.mkdir()
+    path = write_theme(themes, 'a', '*color0: #000000\n')
+    idx = index.ThemeIndex(tmp_path / 'index.json', themes).refresh()
+    idx.save()
+    dir_mtime_ns = os.stat(themes).st_mtime_ns
+
+    with open(path, mode='r+') as f:
+        f.write('*color0: #ffffff\n')
+    os.utime(path, ns=(dir_mtime_ns + 1, dir_mtime_ns + 1))
+    assert os.stat(themes).st_mtime_ns == dir_mtime_ns
+    loaded = index.ThemeIndex.load(tmp_path / 'index.json', themes).refresh()
+    assert loaded.palette('a') == {0: '#ffffff'} and loaded.dirty
+    loaded.save()
+    assert not index.ThemeIndex.load(tmp_path / 'index.json', themes).refresh().dirty
@@ -0,0 +1,61 @@
+from xthematic import journal
+
+
+def test_record_undo_redo(tmp_path):
+    j = journal.Journal(tmp_path / 'journal')
+    assert j.undo() is None
+    j.record([(1, '#cd0000', '#111111')])
+    j.record([(0, '#000000', '#202020'), (2, '#00CD00', '#00cd00')], kind=journal.THEME_CHANGE)
+
+    records, applied = j.records()
+    assert applied == 2
+    assert records[1] == journal.Record(journal.THEME_CHANGE, [journal.Change(0, '#000000', '#202020')])
+
+    assert j.undo().changes == [journal.Change(0, '#000000', '#202020')]
+    assert j.undo() == journal.Record(journal.COLOR_CHANGE, [journal.Change(1, '#cd0000', '#111111')])
+    assert j.undo() is None
+    assert j.records()[1] == 0
+
+    assert j.redo().kind == journal.COLOR_CHANGE
+    assert j.records()[1] == 1
+
+
+def test_record_discards_redo(tmp_path):
+    j = journal.Journal(tmp_path / 'journal')
+    j.record([(1, '#cd0000', '#111111')])
+    j.record([(1, '#111111', '#222222')])
+    j.undo()
+    j.record([(3, '#cdcd00', '#333333')])
+    assert j.redo() is None
+    records, applied = j.records()
+    assert [r.changes[0].slot for r in records] == [1, 3]
+    assert applied == 2
+
+
+def test_no_op_changes_are_not_recorded(tmp_path):
+    j = journal.Journal(tmp_path / 'journal')
+    j.record([(1, '#cd0000', '#CD0000')])
+    assert j.records() == ([], 0)
+
+
+def test_corrupt_file_starts_a_new_journal(tmp_path):
+    file = tmp_path / 'journal'
+    file.write_bytes(b'garbage')
+    j = journal.Journal(file)
+    assert j.undo() is None
+    j.record([(1, '#cd0000', '#111111')])
+    assert len(j.records()[0]) == 1
+
+
+def test_undo_steps_back_to_a_kind(tmp_path):
+    j = journal.Journal(tmp_path / 'journal')
+    assert j.undo_steps(journal.THEME_CHANGE) == 0
+    j.record([(1, '#cd0000', '#111111')])
+    assert j.undo_steps(journal.THEME_CHANGE) == 0
+    j.record([(0, '#000000', '#202020')], kind=journal.THEME_CHANGE)
+    j.record([(1, '#111111', '#222222')])
+    j.record([(2, '#00cd00', '#333333')])
+    assert j.undo_steps(journal.THEME_CHANGE) == 3
+    j.undo()
+    assert j.undo_steps(journal.THEME_CHANGE) == 2
+    assert j.undo_steps(journal.COLOR_CHANGE) == 1
@@ -0,0 +1,83 @@
+import pytest
+
+from xthematic import names
+
+RGB_TXT = """\
+! $Xorg: rgb.txt,v 1.3 2000/08/17 19:54:00 cpqbld Exp $
+255 250 250		snow
+  0 255   0		green
+ 47  79  79		dark slate gray
+ 47  79  79		DarkSlateGray
+151 255 255		DarkSlateGray1
+ 72  61 139		DarkSlateBlue
+"""
+
+
+@pytest.fixture
+def database(tmp_path):
+    rgb = tmp_path / 'rgb.txt'
+    rgb.write_text(RGB_TXT)
+    user = tmp_path / 'colornames'
+    user.write_text('# my colors\nPaper White #F4F1EA\nink,#1b1b1f\n#ff00aa hot magenta\nnot a color\n')
+    return names.ColorNames.load(x11_files=[tmp_path / 'missing', rgb], extra_files=[user, tmp_path / 'missing'])
+
+
+def test_parse_names():
+    assert names.parse_names(RGB_TXT)[:2] == [('snow', '#fffafa'), ('green', '#00ff00')]
+    assert names.parse_names('a = #AABBCC\n300 0 0 overflow\n') == [('a', '#aabbcc')]
+
+
+def test_lookup(database):
+    assert database.lookup('green') == '#00ff00'  # X11 overrides CSS
+    assert database.lookup('rebeccapurple') == '#663399'
+    assert database.lookup('Dark_Slate-Gray') == '#2f4f4f'
+    assert database.lookup('paperwhite') == '#f4f1ea'
+    assert database.lookup('ink') == '#1b1b1f'
+    assert database.lookup('Hot Magenta') == '#ff00aa'
+    assert database.lookup('not a color') is None
+    assert 'snow' in database and 'nope' not in database
+
+
+def test_prefixed(database):
+    matches = database.prefixed('dark slate')
+    assert [m.name for m in matches] == ['DarkSlateBlue', 'DarkSlateGray', 'DarkSlateGray1', 'darkslategrey']
+    assert len(database.prefixed('dark', limit=3)) == 3
+    assert database.prefixed('zzz') == []
+
+
+def test_fuzzy(database):
+    assert database.fuzzy('bleu')[0].name == 'blue'
+    assert database.fuzzy('darkslategrye')[0].name in ('darkslategrey', 'DarkSlateGray')
+    assert database.fuzzy('qqqqqqq') == []
+
+
+def test_nearest(database):
+    match, = database.nearest('#fffafb')
+    assert match.name == 'snow' and match.distance < 1
+    assert [m.hex for m in database.nearest('#2f4f4f', limit=2)] == ['#2f4f4f', '#2f4f4f']
+
+
+def test_css_colors():
+    colors = dict(names.css_colors())
+    assert len(colors) == 148
+    assert colors['green'] == '#008000'
+
+
+def test_index_is_cached_until_a_source_changes(tmp_path, monkeypatch):
+    rgb = tmp_path / 'rgb.txt'
+    rgb.write_text(RGB_TXT)
+    user = tmp_path / 'colornames'
+    cache = tmp_path / 'colornames.json'
+    first = names.ColorNames.load(x11_files=[rgb], extra_files=[user], cache_file=cache)
+
+    parsed = []
+    monkeypatch.setattr(names, 'parse_names', lambda text: parsed.append(text) or [])
+    cached = names.ColorNames.load(x11_files=[rgb], extra_files=[user], cache_file=cache)
+    assert parsed == []
+    assert cached.lookup('Dark Slate Gray') == '#2f4f4f' and len(cached) == len(first)
+    assert cached.prefixed('darkslate') == first.prefixed('darkslate')
+    assert cached.nearest('#fffafb') == first.nearest('#fffafb')
+
+    user.write_text('ink #1b1b1f\n')
+    names.ColorNames.load(x11_files=[rgb], extra_files=[user], cache_file=cache)
+    assert len(parsed) == 2
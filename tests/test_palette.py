@@ -0,0 +1,43 @@
+import pytest
+
+from xthematic import colors, palette
+
+
+def test_parse_resources():
+    text = (
+        '! comment *color3: #333333\n'
+        '#define base00 #ABCDEF\n'
+        'URxvt*color1: #111111\n'
+        '*.color1: #FF0000\n'
+        '*color0: base00\n'
+        'XTerm*colorMode: on\n'
+        '*color42: #424242\n'
+    )
+    assert palette.parse_resources(text) == {0: '#abcdef', 1: '#ff0000'}
+
+
+def test_parse_resources_invalid_value():
+    with pytest.raises(palette.PaletteError):
+        palette.parse_resources('*color0: blue\n')
+
+
+def test_parse_theme_file(tmp_path):
+    good = tmp_path / 'good'
+    good.write_text('*color5: #00ff00\n')
+    empty = tmp_path / 'empty'
+    empty.write_text('! nothing\n')
+    assert palette.parse_theme_file(str(good)) == (str(good), {5: '#00ff00'}, None)
+    path, parsed, error = palette.parse_theme_file(str(empty))
+    assert parsed is None and error
+
+
+def test_palette_hash_ignores_case_and_order():
+    assert palette.palette_hash({0: '#ABCDEF', 1: '#000000'}) == palette.palette_hash({1: '000000', 0: '#abcdef'})
+    assert palette.palette_hash({0: '#ABCDEF'}) != palette.palette_hash({1: '#ABCDEF'})
+
+
+def test_colormap_round_trip():
+    colormap = {colors.ColorIdentifier(2): colors.Color('#00FF00')}
+    assert palette.from_colormap(colormap) == {2: '#00ff00'}
+    assert palette.to_colormap({2: '#00ff00'}) == {colors.ColorIdentifier(2): colors.Color('#00ff00')}
+    assert palette.resource_text({2: '#00ff00'}) == '*color2: #00ff00\n'
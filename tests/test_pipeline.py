@@ -0,0 +1,39 @@
+import threading
+
+import pytest
+
+from xthematic import pipeline, profiling
+
+
+def test_steps_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+    results = pipeline.run([(f'step{k}', barrier.wait) for k in range(3)])
+    assert [r.name for r in results] == ['step0', 'step1', 'step2']
+    assert all(r.error is None and r.seconds >= 0 for r in results)
+
+
+def test_failing_step_does_not_stop_the_others():
+    done = []
+
+    def fail():
+        raise OSError('xrdb not found')
+
+    results = pipeline.run([('fail', fail), ('ok', lambda: done.append(True))])
+    assert done == [True]
+    assert isinstance(results[0].error, OSError) and results[1].error is None
+    with pytest.raises(pipeline.PipelineError, match='fail failed: xrdb not found') as e:
+        pipeline.check(results)
+    assert e.value.results == results
+    assert pipeline.check(results[1:]) == results[1:]
+
+
+def test_steps_are_profiled(monkeypatch):
+    monkeypatch.setattr(profiling, 'ENABLED', True)
+    monkeypatch.setattr(profiling, '_spans', [])
+    pipeline.run([('first', lambda: None), ('second', lambda: None)])
+    assert sorted(s.name for s in profiling.spans()) == ['first', 'second']
+    assert all(s.category == 'pipeline' for s in profiling.spans())
+
+
+def test_no_steps():
+    assert pipeline.run([]) == []
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from xthematic import preprocess
+
+
+@pytest.fixture
+def files(tmp_path):
+    themes = tmp_path / 'themes'
+    themes.mkdir()
+    (themes / 'dark').write_text('#define BG #000000\n*color0: BG\n*background: BG\n')
+    resources = tmp_path / '.Xresources'
+    resources.write_text('! comment with BG\nURxvt.font: xft:mono\n#include "dark"\n#undef BG\n*foo: BG\n')
+    return resources, themes
+
+
+def test_flatten(files):
+    resources, themes = files
+    text, dependencies = preprocess.flatten(resources, include_dirs=[themes])
+    assert text == ('! comment with BG\nURxvt.font: xft:mono\n'
+                    '*color0: #000000\n*background: #000000\n*foo: BG\n')
+    assert dependencies[str(themes / 'dark')] is not None
+    # the directory of the including file is searched first
+    assert dependencies[os.path.join(str(resources.parent), 'dark')] is None
+
+
+@pytest.mark.parametrize('line', ['#ifdef COLOR', '#define F(x) x', '/* comment */', '*width: WIDTH'])
+def test_unsupported(files, line):
+    resources, themes = files
+    resources.write_text(line + '\n')
+    with pytest.raises(preprocess.UnsupportedDirective):
+        preprocess.flatten(resources, include_dirs=[themes])
+
+
+def test_cache_tracks_includes(files, tmp_path):
+    resources, themes = files
+    cache = preprocess.FlattenCache(tmp_path / 'cache.json')
+    assert '#000000' in cache.flatten(resources, [themes])
+    (themes / 'dark').write_text('*color0: #111111\n')
+    assert '#111111' in cache.flatten(resources, [themes])
+    # an include that shadows the one from the include path
+    (resources.parent / 'dark').write_text('*color0: #222222\n')
+    assert '#222222' in cache.flatten(resources, [themes])
+
+
+def test_xrdb_load_skips_unchanged(files, tmp_path, monkeypatch):
+    resources, themes = files
+    loads = []
+    monkeypatch.setattr(preprocess.subprocess, 'run', lambda args, input, check: loads.append((args, input)))
+    monkeypatch.setattr(preprocess, 'server_id', lambda: [':0', 1, 2])
+    cache_file = tmp_path / 'cache.json'
+
+    assert preprocess.xrdb_load(resources, [themes], cache_file=cache_file)
+    assert loads[0][0] == ['xrdb', '-nocpp', '-load'] and b'*color0: #000000' in loads[0][1]
+    assert not preprocess.xrdb_load(resources, [themes], cache_file=cache_file)
+    assert preprocess.xrdb_load(resources, [themes], cache_file=cache_file, force=True)
+
+    monkeypatch.setattr(preprocess, 'server_id', lambda: [':0', 3, 4])  # the X server restarted
+    assert preprocess.xrdb_load(resources, [themes], cache_file=cache_file)
+    assert len(loads) == 3
+
+
+def test_xrdb_load_falls_back_to_cpp(files, tmp_path, monkeypatch):
+    resources, themes = files
+    resources.write_text('#ifdef COLOR\n#include "dark"\n#endif\n')
+    calls = []
+    monkeypatch.setattr(preprocess.subprocess, 'check_call', calls.append)
+    preprocess.xrdb_load(resources, [themes], cache_file=tmp_path / 'cache.json')
+    assert calls == [['xrdb', f'-I{themes}', '-load', str(resources)]]
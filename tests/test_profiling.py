@@ -0,0 +1,31 @@
+import json
+
+from xthematic import profiling
+
+
+def test_disabled_span_records_nothing(monkeypatch):
+    monkeypatch.setattr(profiling, 'ENABLED', False)
+    monkeypatch.setattr(profiling, '_spans', [])
+    with profiling.span('nothing'):
+        pass
+    assert profiling.spans() == []
+
+
+def test_traced_and_chrome_trace(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, 'ENABLED', True)
+    monkeypatch.setattr(profiling, '_spans', [])
+
+    @profiling.traced('work', category='test')
+    def work():
+        return 42
+
+    assert work() == 42
+    assert work() == 42
+    assert [(name, calls) for name, _, calls, _ in profiling.summary()] == [('work', 2)]
+    assert 'work' in profiling.report()
+
+    trace = tmp_path / 'trace.json'
+    profiling.write_chrome_trace(trace)
+    events = json.loads(trace.read_text())['traceEvents']
+    assert [e['name'] for e in events] == ['work', 'work']
+    assert all(e['ph'] == 'X' and e['cat'] == 'test' for e in events)
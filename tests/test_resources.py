@@ -0,0 +1,47 @@
+from xthematic import palette, resources
+
+TEXT = (b'! resources\n'
+        b'URxvt*color1: #111111\n'
+        b'*color1:\t#222222  ! generic wins\n'
+        b'*color12: #333333\n'
+        b'XTerm*font: fixed\n')
+
+
+def test_scan_offsets_follows_parse_resources():
+    offsets = resources.scan_offsets(TEXT)
+    assert sorted(offsets) == [1, 12]
+    assert {k: TEXT[s:e].decode() for k, (s, e) in offsets.items()} == palette.parse_resources(TEXT.decode())
+
+
+def test_set_color_only_replaces_the_value(tmp_path):
+    file = tmp_path / 'Xresources'
+    file.write_bytes(TEXT)
+    index = resources.OffsetIndex(tmp_path / 'offsets.json')
+    assert index.set_color(str(file), 1, '#ABCDEF') == '#222222'
+    assert file.read_bytes() == TEXT.replace(b'#222222', b'#abcdef')
+    assert index.set_color(str(file), 3, '#000000') is None
+    assert index.set_color(str(file), 12, '#444444') == '#333333'
+    text = file.read_text()
+    assert palette.parse_resources(text) == {1: '#abcdef', 3: '#000000', 12: '#444444'}
+    assert text.endswith('XTerm*font: fixed\n*color3: #000000\n')
+
+
+def test_offsets_are_cached_until_the_file_changes(tmp_path, monkeypatch):
+    file = tmp_path / 'theme'
+    file.write_bytes(TEXT)
+    index = resources.OffsetIndex(tmp_path / 'offsets.json')
+    index.set_color(str(file), 1, '#000001')
+    index.save()
+
+    scans = []
+    scan = resources.scan_offsets
+    monkeypatch.setattr(resources, 'scan_offsets', lambda data: scans.append(data) or scan(data))
+    index = resources.OffsetIndex.load(tmp_path / 'offsets.json')
+    index.set_color(str(file), 12, '#000012')
+    index.set_color(str(file), 1, '#000002')
+    assert scans == []
+
+    file.write_bytes(b'*color1: #ffffff\n' + file.read_bytes())
+    index.set_color(str(file), 12, '#000013')
+    assert len(scans) == 1
+    assert palette.parse_resources(file.read_text()) == {1: '#ffffff', 12: '#000013'}
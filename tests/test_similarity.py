@@ -0,0 +1,56 @@
+import pytest
+
+from xthematic import colorspace, index, similarity
+
+
+def test_rgb_to_lab():
+    assert similarity.rgb_to_lab(255, 255, 255) == pytest.approx((100, 0, 0), abs=0.05)
+    assert similarity.rgb_to_lab(0, 0, 0) == pytest.approx((0, 0, 0), abs=0.05)
+
+
+@pytest.fixture
+def theme_index(tmp_path):
+    themes = tmp_path / 'themes'
+    themes.mkdir()
+    for name, hex_code in [('red', '#ff0000'), ('dark_red', '#aa0000'), ('blue', '#0000ff')]:
+        (themes / name).write_text(''.join(f'*color{k}: {hex_code}\n' for k in range(16)))
+    return index.ThemeIndex(tmp_path / 'index.json', themes).refresh()
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_similar_themes(theme_index, tmp_path, monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(colorspace, 'optional_numpy', lambda: None)
+    store = similarity.VectorStore(tmp_path / 'vectors.bin')
+    result = similarity.similar_themes(theme_index, store, theme_index.palette('red'), k=2, exclude=['red'])
+    assert [name for name, _ in result] == ['dark_red', 'blue']
+    near = similarity.themes_near_color(theme_index, store, '#0000EE', k=1)
+    assert [name for name, _ in near] == ['blue']
+
+
+def test_store_round_trip(theme_index, tmp_path):
+    store = similarity.VectorStore(tmp_path / 'vectors.bin').sync(theme_index)
+    store.save()
+    loaded = similarity.VectorStore.load(tmp_path / 'vectors.bin')
+    assert loaded.vectors.keys() == store.vectors.keys()
+    for key in store.vectors:
+        assert loaded.vectors[key] == pytest.approx(store.vectors[key], abs=1e-4)
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_store_add_and_discard(theme_index, tmp_path, monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(colorspace, 'optional_numpy', lambda: None)
+    elif colorspace.optional_numpy() is None:
+        pytest.skip('numpy is not installed')
+    store = similarity.VectorStore(tmp_path / 'vectors.bin').sync(theme_index)
+    red = theme_index.entries['red']['hash']
+    store.discard([red])
+    assert red not in store and len(store.hashes) == 2
+    store.add({red: theme_index.palette('red')})
+    store.save()
+    loaded = similarity.VectorStore.load(tmp_path / 'vectors.bin')
+    assert loaded.hashes == store.hashes
+    assert loaded.vectors[red] == pytest.approx(similarity.palette_vector(theme_index.palette('red')), abs=1e-4)
+    if use_numpy:
+        assert loaded.matrix.dtype == colorspace.optional_numpy().float32 and loaded.matrix.shape == (3, 48)
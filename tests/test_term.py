@@ -0,0 +1,157 @@
+import pytest
+from click.testing import CliRunner
+
+from xthematic import backends, cli, colors, config, journal, pipeline, term, themes
+
+
+def cid(number):
+    return colors.ColorIdentifier(number)
+
+
+def sequence_of(palette):
+    return backends.osc4_sequence(term.sorted_colors(palette))
+
+
+def test_sequence_cache_is_rewritten_only_when_it_changes(xhome):
+    assert term.refresh_sequence_cache()
+    assert config.USER_SEQUENCE_FILE.read_text() == sequence_of(backends.default_palette())
+    assert not term.refresh_sequence_cache()
+
+    term.apply_colors({cid(1): colors.Color('#123456')})
+    assert '\033]4;1;rgb:12/34/56\033\\' in config.USER_SEQUENCE_FILE.read_text()
+    assert not term.refresh_sequence_cache()
+
+
+def test_sequence_cache_is_restored_after_a_failed_commit(xhome):
+    term.refresh_sequence_cache()
+    before = config.USER_SEQUENCE_FILE.read_text()
+
+    def fail():
+        raise OSError('disk full')
+
+    with pytest.raises(pipeline.PipelineError):
+        term.apply_colors({cid(1): colors.Color('#123456')}, steps=[('fail', fail)])
+    assert config.USER_SEQUENCE_FILE.read_text() == before
+    assert term.TERMINAL_COLORS[cid(1)] == colors.Color('#CD0000')
+
+
+def test_theme_emit_prints_the_sequence(xhome):
+    (config.USER_THEME_DIR / 'red').write_text('*color1: #ff0000\n*color0: #000000\n')
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ['theme', 'red', '--emit'])
+    assert result.exit_code == 0
+    assert result.output == '\033]4;0;rgb:00/00/00\033\\\033]4;1;rgb:ff/00/00\033\\'
+
+    result = runner.invoke(cli.main, ['theme', '--emit'])
+    assert result.output == sequence_of(backends.default_palette())
+    assert xhome.writes == []
+
+
+def test_deactivate_without_an_activation_keeps_color_changes(xhome):
+    term.apply_colors({cid(1): colors.Color('#111111')})
+    themes.deactivate_theme()
+    assert term.TERMINAL_COLORS[cid(1)] == colors.Color('#111111')
+
+
+def test_deactivate_undoes_back_to_the_last_activation(xhome):
+    term.apply_colors({cid(1): colors.Color('#111111')})
+    term.apply_colors({cid(2): colors.Color('#222222'), cid(3): colors.Color('#333333')},
+                      kind=journal.THEME_CHANGE)
+    term.apply_colors({cid(3): colors.Color('#444444')})
+    themes.deactivate_theme()
+    assert [term.TERMINAL_COLORS[cid(k)].hex.lower() for k in (1, 2, 3)] == ['#111111', '#00cd00', '#cdcd00']
+
+
+def test_undo_to_a_loaded_color_is_not_a_custom_color(xhome):
+    term.apply_colors({cid(1): colors.Color('#111111')})
+    assert term.undo() == 1
+    assert term.TERMINAL_COLORS[cid(1)].hex.lower() == '#cd0000'
+    assert term.CUSTOM_COLORS.read_customized_colors() == {}
+    assert term.TERMINAL_COLORS.customized() == []
+
+
+def test_live_palette_ignores_the_case_of_loaded_resources(xhome, monkeypatch):
+    monkeypatch.setattr(term.TERMINAL_COLORS, 'live', True)
+    xhome.current[cid(1)] = colors.Color('#123456')
+    xhome.current[cid(2)] = colors.Color('#00cd00')  # loaded as '#00CD00'
+    assert term.TERMINAL_COLORS.customized() == [cid(1)]
+    term.reset_customized()
+    assert xhome.writes == [{cid(1): colors.Color('#CD0000')}]
+
+
+def test_batched_changes_are_written_and_journaled_once(xhome, monkeypatch):
+    custom_writes = []
+    write_custom_dict = term.CUSTOM_COLORS.write_custom_dict
+    monkeypatch.setattr(term._CustomColors, 'write_custom_dict',
+                        staticmethod(lambda d: custom_writes.append(d) or write_custom_dict(d)))
+    with term.batched():
+        term.set_color(cid(1), colors.Color('#111111'))
+        term.apply_colors({cid(2): colors.Color('#222222'), cid(1): colors.Color('#121212')})
+        assert term.TERMINAL_COLORS[cid(1)] == colors.Color('#121212')
+        assert xhome.writes == []
+    assert xhome.writes == [{cid(1): colors.Color('#121212'), cid(2): colors.Color('#222222')}]
+    assert len(custom_writes) == 1
+    records, _ = term.session_journal().records()
+    assert records == [journal.Record(journal.COLOR_CHANGE, [journal.Change(1, '#cd0000', '#121212'),
+                                                             journal.Change(2, '#00cd00', '#222222')])]
+
+
+def test_batched_changes_with_other_flags_are_flushed_separately(xhome):
+    with term.batched():
+        term.apply_colors({cid(1): colors.Color('#111111')})
+        term.apply_colors({cid(2): colors.Color('#222222')}, record=False, everywhere=True)
+        term.apply_colors({cid(3): colors.Color('#333333')}, record=False, everywhere=True)
+    assert xhome.writes == [{cid(1): colors.Color('#111111')},
+                            {cid(2): colors.Color('#222222'), cid(3): colors.Color('#333333')}]
+    assert xhome.broadcasts == [{cid(2): colors.Color('#222222'), cid(3): colors.Color('#333333')}]
+    records, _ = term.session_journal().records()
+    assert [[c.slot for c in record.changes] for record in records] == [[1]]
+
+
+def test_session_commits_with_one_write(xhome):
+    with term.session() as palette:
+        palette[1] = '#111111'
+        palette[cid(2)] = colors.Color('#222222')
+        assert palette[1] == colors.Color('#111111') and term.TERMINAL_COLORS[cid(1)].hex == '#CD0000'
+    assert xhome.writes == [{cid(1): colors.Color('#111111'), cid(2): colors.Color('#222222')}]
+    assert len(term.session_journal().records()[0]) == 1
+
+
+def test_session_rolls_back_when_the_block_raises(xhome):
+    with pytest.raises(KeyError):
+        with term.session() as palette:
+            palette[1] = '#111111'
+            palette.commit()
+            palette[2] = '#222222'
+            raise KeyError()
+    assert xhome.current == backends.default_palette()
+    assert xhome.writes[-1] == {cid(1): colors.Color('#CD0000')}
+    assert term.CUSTOM_COLORS.read_customized_colors() == {}
+
+
+def test_session_restores_the_colors_when_its_commit_fails(xhome):
+    def fail():
+        raise OSError('xrdb is missing')
+
+    with pytest.raises(pipeline.PipelineError):
+        with term.session() as palette:
+            palette[1] = '#111111'
+            palette.commit(steps=[('resources', fail)])
+    assert xhome.current == backends.default_palette()
+    assert len(xhome.writes) == 2  # the change and the restore by apply_colors, no rollback
+    assert term.TERMINAL_COLORS[cid(1)].hex.lower() == '#cd0000'
+    assert term.CUSTOM_COLORS.read_customized_colors() == {}
+
+
+def test_session_rolls_back_the_commits_before_a_failed_one(xhome):
+    def fail():
+        raise OSError('xrdb is missing')
+
+    with pytest.raises(pipeline.PipelineError):
+        with term.session() as palette:
+            palette[1] = '#111111'
+            palette.commit()
+            palette[2] = '#222222'
+            palette.commit(steps=[('resources', fail)])
+    assert xhome.current == backends.default_palette()
+    assert xhome.writes[-1] == {cid(1): colors.Color('#CD0000')}
@@ -0,0 +1,152 @@
+import json
+import os
+import tarfile
+
+import pytest
+from click.testing import CliRunner
+
+from xthematic import backends, cli, config, index, palette, pipeline, similarity, term, themes
+
+
+def resources(*hex_codes):
+    return ''.join(f'*color{k}: {hex_code}\n' for k, hex_code in enumerate(hex_codes))
+
+
+@pytest.fixture
+def theme_files(tmp_path):
+    source = tmp_path / 'source'
+    (source / 'pywal').mkdir(parents=True)
+    (source / 'dark.Xresources').write_text(resources('#000000', '#AA0000'))
+    (source / 'same-as-dark').write_text('URxvt*color1: #aa0000\n*.color0: #000000\n')
+    (source / 'pywal' / 'colors.Xresources').write_text(resources('#101010', '#20A020'))
+    (source / 'broken').write_text('*color1: not-a-color\n')
+    (source / 'notes').write_text('no colors here\n')
+    (source / '.hidden').write_text(resources('#ffffff'))
+    return source
+
+
+def test_import_saves_new_palettes_and_reports_the_rest(xhome, theme_files):
+    report = themes.import_themes(theme_files, jobs=1)
+    assert sorted(name for _, name in report.imported) == ['dark', 'pywal-colors']
+    assert report.duplicates == [(str(theme_files / 'same-as-dark'), 'dark')]
+    assert sorted(path for path, _ in report.errors) == [str(theme_files / 'broken'), str(theme_files / 'notes')]
+    assert sorted(p.name for p in config.USER_THEME_DIR.iterdir()) == ['dark', 'pywal-colors']
+    assert dict(themes.theme_palettes())['dark'] == {0: '#000000', 1: '#aa0000'}
+
+    again = themes.import_themes(theme_files, jobs=1)
+    assert again.imported == [] and len(again.duplicates) == 3
+
+
+def test_import_from_an_archive(xhome, theme_files, tmp_path):
+    archive = tmp_path / 'themes.tar.gz'
+    with tarfile.open(archive, mode='w:gz') as tf:
+        tf.add(theme_files / 'dark.Xresources', arcname='themes/dark.Xresources')
+    report = themes.import_themes(archive, jobs=1)
+    assert report.imported == [(f'{archive}:themes/dark.Xresources', 'dark')]
+
+
+def test_import_of_an_unsupported_file_is_a_usage_error(xhome, tmp_path):
+    source = tmp_path / 'plain.txt'
+    source.write_text(resources('#000000'))
+    with pytest.raises(themes.UnsupportedSource):
+        themes.import_themes(source)
+    result = CliRunner().invoke(cli.main, ['import', str(source)])
+    assert result.exit_code == 2 and 'neither a directory' in result.output
+
+
+@pytest.fixture
+def failing_xrdb(xhome, monkeypatch):
+    (config.USER_THEME_DIR / 't1').write_text(resources('#000000', '#123456'))
+    loads = []
+
+    def load_resources(include_dirs=()):
+        loads.append(include_dirs)
+        raise OSError('xrdb is missing')
+
+    monkeypatch.setattr(themes, 'load_resources', load_resources)
+    return loads
+
+
+def test_failed_activation_restores_the_resources(xhome, failing_xrdb):
+    config.USER_XRESOURCES_FILE.write_text('*color1: #ffffff\n')
+    with pytest.raises(pipeline.PipelineError):
+        themes.activate_theme('t1')
+    assert config.USER_XRESOURCES_FILE.read_text() == '*color1: #ffffff\n'
+    assert len(failing_xrdb) == 2
+    assert term.session_journal().records()[0] == []
+    assert xhome.current == backends.default_palette()
+
+
+def test_failed_activation_restores_the_link(xhome, failing_xrdb, tmp_path):
+    link = tmp_path / 'theme-link'
+    link.symlink_to(tmp_path / 'old-theme')
+    with pytest.raises(pipeline.PipelineError):
+        themes.activate_theme('t1', link_file=link)
+    assert os.readlink(link) == str(tmp_path / 'old-theme')
+    assert term.session_journal().records()[0] == []
+
+    missing = tmp_path / 'new-link'
+    with pytest.raises(pipeline.PipelineError):
+        themes.activate_theme('t1', link_file=missing)
+    assert not os.path.lexists(missing)
+
+
+def test_export_of_a_palette_shared_by_two_themes(xhome):
+    (config.USER_THEME_DIR / 't1').write_text(resources('#000000', '#123456'))
+    (config.USER_THEME_DIR / 'solarized').write_text(resources('#000000', '#123456'))
+    assert 't1' not in themes.export_theme('t1', 'kitty')
+    assert themes.export_theme('solarized', 'kitty') == themes.export_theme('t1', 'kitty')
+    assert '"solarized"' in themes.export_theme('solarized', 'base16')
+    assert '"t1"' in themes.export_theme('t1', 'base16')
+
+
+def test_export_writes_only_what_changed(xhome, tmp_path):
+    (config.USER_THEME_DIR / 'dark').write_text(resources('#000000', '#aa0000'))
+    (config.USER_THEME_DIR / 'light').write_text(resources('#ffffff', '#00aa00'))
+    out = tmp_path / 'out'
+    first = themes.export_themes(out, ['kitty', 'base16'], jobs=1)
+    paths = sorted(str(out / f'{name}.{extension}') for name in ('dark', 'light') for extension in ('conf', 'yaml'))
+    assert sorted(first.written) == paths and first.unchanged == []
+    manifest = json.loads((config.USER_EXPORT_CACHE_DIR / 'manifest.json').read_text())
+    assert sorted(manifest) == paths
+
+    again = themes.export_themes(out, ['kitty', 'base16'], jobs=1)
+    assert again.written == [] and sorted(again.unchanged) == paths
+
+    themes.save_theme('dark', palette.to_colormap({0: '#000000', 1: '#bb0000'}), overwrite=True)
+    (out / 'light.yaml').unlink()
+    edited = themes.export_themes(out, ['kitty', 'base16'], jobs=1)
+    assert sorted(edited.written) == [str(out / 'dark.conf'), str(out / 'dark.yaml'), str(out / 'light.yaml')]
+    assert 'color1 #bb0000' in (out / 'dark.conf').read_text()
+    assert (out / 'light.yaml').is_file()
+
+
+def test_index_is_refreshed_once_per_process(xhome, monkeypatch):
+    refreshes = []
+    refresh = index.ThemeIndex.refresh
+    monkeypatch.setattr(index.ThemeIndex, 'refresh', lambda self: refreshes.append(self) or refresh(self))
+    (config.USER_THEME_DIR / 'dark').write_text(resources('#000000', '#aa0000'))
+    assert themes.theme_index().names_for({0: '#000000', 1: '#aa0000'}) == ['dark']
+    themes.save_theme('light', palette.to_colormap({0: '#ffffff'}))
+    assert themes.theme_index().names_for({0: '#ffffff'}) == ['light']
+    assert len(refreshes) == 1
+
+
+def test_theme_colors_and_the_index_read_a_file_alike(xhome):
+    (config.USER_THEME_DIR / 'mixed').write_text('URxvt*color1: #111111\n*color1: #222222\n'
+                                                 'URxvt*color2: #333333\n*.color0: #000000\n')
+    colors = themes.theme_colors('mixed')
+    assert palette.from_colormap(colors) == {0: '#000000', 1: '#222222', 2: '#333333'}
+    assert themes.theme_index().names_for(palette.from_colormap(colors)) == ['mixed']
+
+
+def test_saving_and_removing_themes_updates_the_vector_store(xhome, monkeypatch):
+    themes.save_theme('red', palette.to_colormap({k: '#ff0000' for k in range(16)}))
+    themes.save_theme('blue', palette.to_colormap({k: '#0000ff' for k in range(16)}))
+    assert len(themes._vector_store().hashes) == 2
+
+    monkeypatch.setattr(similarity.VectorStore, 'sync', None)  # queries only read the store
+    assert [name for name, _ in themes.similar_themes('red', k=1)] == ['blue']
+    themes.remove_theme('blue')
+    assert len(themes._vector_store().hashes) == 1
+    assert themes.similar_themes('red') == []